@@ -0,0 +1,192 @@
+import collections
+import threading
+import time
+
+# Threaded acquisition for the live scripts: one thread reads the camera and fans
+# each packet out to bounded queues, the GUI thread renders the preview queue and
+# a recording thread drains the record queue into the writer. A full queue drops
+# its oldest packet instead of blocking the camera thread.
+
+
+class DropQueue:
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.maxsize = maxsize
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self.put_count = 0
+        self.dropped = 0
+        self.dropped_by_stream = collections.Counter()
+        self.high_water = 0
+
+    def put(self, item, force=False):
+        # Never blocks. force=True bypasses the bound and protects the item from being
+        # dropped later, used for control messages. Items are (stream name, payload).
+        with self._cond:
+            if not force and len(self._items) >= self.maxsize:
+                self._drop_oldest()
+            self._items.append((item, force))
+            self.put_count += 1
+            self.high_water = max(self.high_water, len(self._items))
+            self._cond.notify()
+
+    def _drop_oldest(self):
+        for i, (item, forced) in enumerate(self._items):
+            if not forced:
+                del self._items[i]
+                self.dropped += 1
+                self.dropped_by_stream[item[0]] += 1
+                return
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()[0]
+
+    def get_all(self):
+        with self._cond:
+            items = [item for item, _ in self._items]
+            self._items.clear()
+            return items
+
+    @property
+    def depth(self):
+        return len(self._items)
+
+    def stats(self):
+        return {"name": self.name, "depth": self.depth, "maxsize": self.maxsize,
+                "put": self.put_count, "dropped": self.dropped, "high_water": self.high_water}
+
+
+def format_queue_stats(queue):
+    s = queue.stats()
+    return (f"{s['name']}: depth {s['depth']}/{s['maxsize']}, high water {s['high_water']}, "
+            f"put {s['put']}, dropped {s['dropped']}")
+
+
+class AcquisitionThread(threading.Thread):
+    # readers: list of (stream name, zero-argument callable returning the next packet or None).
+    # Every packet is read exactly once and handed to both the preview and the record queue;
+    # preview_streams limits which streams the preview gets (None means all).
+    def __init__(self, readers, preview_queue, record_queue, preview_streams=None, idle_sleep=0.0005):
+        super().__init__(name="acquisition", daemon=True)
+        self.readers = readers
+        self.preview_queue = preview_queue
+        self.record_queue = record_queue
+        self.preview_streams = preview_streams
+        self.idle_sleep = idle_sleep
+        self.recording = False
+        self.read_count = collections.Counter()
+        # Packets read while recording in the current session, per stream
+        self.recorded_count = collections.Counter()
+        self._record_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            got_packet = False
+            for name, read in self.readers:
+                packet = read()
+                if packet is None:
+                    continue
+                got_packet = True
+                self.read_count[name] += 1
+                if self.preview_streams is None or name in self.preview_streams:
+                    self.preview_queue.put((name, packet))
+                with self._record_lock:
+                    if self.recording:
+                        self.recorded_count[name] += 1
+                        self.record_queue.put((name, packet))
+            if not got_packet:
+                time.sleep(self.idle_sleep)
+
+    def set_recording(self, recording, control=None):
+        # The control message is queued under the same lock as the packets, so it
+        # lands exactly between the last packet of one state and the first of the next
+        with self._record_lock:
+            if control is not None:
+                self.record_queue.put(control, force=True)
+            if recording and not self.recording:
+                self.recorded_count.clear()
+                self.record_queue.dropped_by_stream.clear()
+            self.recording = recording
+
+    def stop(self):
+        self._stop_event.set()
+
+
+OPEN_WRITER = "open"
+CLOSE_WRITER = "close"
+
+
+def write_davis_packet(writer, stream, packet):
+    # The dv.io.MonoCameraWriter call for one packet read by davis_readers()
+    if stream == "frames":
+        writer.writeFrame(packet, streamName='frames')
+    elif stream == "events":
+        writer.writeEvents(packet, streamName='events')
+    elif stream == "imu":
+        writer.writeImuPacket(packet, streamName='imu')
+    elif stream == "triggers":
+        writer.writeTriggerPacket(packet, streamName='triggers')
+
+
+class RecordingThread(threading.Thread):
+    # write_packet(writer, stream name, packet) performs the actual writer call
+    def __init__(self, record_queue, write_packet):
+        super().__init__(name="recording", daemon=True)
+        self.record_queue = record_queue
+        self.write_packet = write_packet
+        self.writer = None
+        self.written = collections.Counter()
+        self.discarded = 0
+        self.closed = threading.Event()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            item = self.record_queue.get(timeout=0.1)
+            if item is None:
+                continue
+            kind, payload = item
+            if kind == OPEN_WRITER:
+                self.writer = payload
+                self.written.clear()
+                self.closed.clear()
+            elif kind == CLOSE_WRITER:
+                # Dropping the last reference finalizes the file
+                self.writer = None
+                self.closed.set()
+            elif self.writer is not None:
+                self.write_packet(self.writer, kind, payload)
+                self.written[kind] += 1
+            else:
+                self.discarded += 1
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def recording_report(acquisition, recorder):
+    # Per-stream accounting of the last recording session, to be called once the writer
+    # has been closed: every packet read while recording is either written or dropped.
+    report = {}
+    streams = set(acquisition.recorded_count) | set(recorder.written)
+    for name in sorted(streams):
+        read = acquisition.recorded_count[name]
+        written = recorder.written[name]
+        dropped = acquisition.record_queue.dropped_by_stream[name]
+        report[name] = {"read": read, "written": written, "dropped": dropped,
+                        "lost": read - written}
+    return report
+
+
+def format_recording_report(report):
+    lines = []
+    for name, r in report.items():
+        status = "OK" if r["lost"] == 0 else f"LOST {r['lost']} (dropped {r['dropped']})"
+        lines.append(f"{name}: read {r['read']}, written {r['written']} -> {status}")
+    return lines
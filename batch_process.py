@@ -0,0 +1,309 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from calibration_detect import content_hash, add_target_arguments, target_from_args
+from event_archive import CODEC_ORDER, DEFAULT_CODEC
+
+# Batch driver over directories of recordings: every .aedat4 (paired by file name with a
+# .svo2 of the same stem for the sync step) goes through the selected steps in a process
+# pool, one task per recording and step, so all cores stay busy across recordings.
+# Steps of one recording wait for the ones they depend on (the sidecar index and the
+# event store are built once, not raced by parallel readers).
+#
+# Finished steps are recorded in a manifest with the content hashes of their inputs,
+# their parameters and their outputs. A step is redone only when an input changed, the
+# parameters differ or an output is gone, so an interrupted or repeated run picks up
+# where it stopped. Content hashes are cached by size and mtime like the sidecar index,
+# large recordings are only re-hashed after they change. The manifest is rewritten
+# after every finished task.
+
+BASE_DIR = "D:/Programs/DV/Recording"
+MANIFEST_NAME = "batch_manifest.json"
+MANIFEST_VERSION = 1
+
+STEPS = ("index", "store", "archive", "sync", "export", "calibrate")
+DEFAULT_STEPS = ("index", "sync", "export")
+# Steps that must have finished first, when they are selected as well
+DEPENDS = {"index": (), "store": ("index",), "archive": ("index", "store"), "sync": (),
+           "export": ("index", "store"), "calibrate": ("index", "store")}
+# Steps that need the matching ZED recording
+PAIRED_STEPS = ("sync",)
+
+SKIP_DIRS = (".store", ".tmp")
+
+
+def find_recordings(directories):
+    # {stem: {".aedat4": path, ".svo2": path}}, searched recursively
+    recordings = {}
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [d for d in dirs if not d.endswith(SKIP_DIRS)]
+            for name in files:
+                stem, ext = os.path.splitext(name)
+                if ext in (".aedat4", ".svo2"):
+                    recordings.setdefault(stem, {}).setdefault(ext, os.path.abspath(os.path.join(root, name)))
+    return recordings
+
+
+def load_manifest(path):
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {"version": MANIFEST_VERSION, "files": {}, "steps": {}}
+    if data.get("version") != MANIFEST_VERSION:
+        return {"version": MANIFEST_VERSION, "files": {}, "steps": {}}
+    return data
+
+
+def save_manifest(path, manifest):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def normalized(params):
+    # Parameters as they read back from the manifest (tuples become lists)
+    return json.loads(json.dumps(params, sort_keys=True))
+
+
+# --- Steps, run in the worker processes. Each returns a JSON-serializable summary with
+# the paths it wrote under "outputs".
+
+def step_index(aedat_path, svo_path):
+    from recording_index import load_index, index_path_for
+    index = load_index(aedat_path)
+    return {"events": index.event_count, "frames": len(index.frame_timestamps), "outputs": [index_path_for(aedat_path)]}
+
+
+def step_store(aedat_path, svo_path):
+    from event_store import convert
+    store = convert(aedat_path)
+    return {"events": store.event_count, "frames": store.frame_count, "outputs": [store.path]}
+
+
+def step_archive(aedat_path, svo_path, codec, level):
+    from event_archive import convert
+    path = convert(aedat_path, None, codec, level)
+    return {"bytes": os.path.getsize(path), "outputs": [path]}
+
+
+def step_sync(aedat_path, svo_path, bin_us, max_offset_us, window_us):
+    from sync_estimator import estimate_sync, save_sync, sync_path_for
+    result = estimate_sync(aedat_path, svo_path, bin_us, max_offset_us, window_us)
+    path = sync_path_for(svo_path)
+    save_sync(result, path)
+    return {"offset_us": result["offset_us"], "drift": result["drift"], "outputs": [path]}
+
+
+def step_export(aedat_path, svo_path, output_dir, frame_interval, event_interval):
+    from recording_index import load_index
+    from export_png import select_save_points, export
+    index = load_index(aedat_path)
+    name = os.path.splitext(os.path.basename(aedat_path))[0]
+    frame_dir = os.path.join(output_dir, name, "frame")
+    event_dir = os.path.join(output_dir, name, "event")
+    os.makedirs(frame_dir, exist_ok=True)
+    os.makedirs(event_dir, exist_ok=True)
+    frame_points = select_save_points(index.frame_timestamps, frame_interval, None)
+    event_points = select_save_points(index.frame_timestamps, event_interval, None)
+    # One encoder process per task: the pool already runs a task per core
+    saved = export(aedat_path, frame_points, event_points, index.frame_timestamps, frame_dir, event_dir, 1)
+    return {"pngs": saved, "outputs": [frame_dir, event_dir]}
+
+
+def step_calibrate(aedat_path, svo_path, pattern, cols, rows, spacing, subpix_window, window_us):
+    from calibration_detect import TargetSpec
+    from calibration_events import detect_recording, save_detections
+    spec = TargetSpec(pattern, cols, rows, spacing, subpix_window)
+    detections = detect_recording(aedat_path, spec, window_us)
+    path = save_detections(aedat_path, spec, detections)
+    return {"windows": len(detections), "found": sum(d["found"] for d in detections), "outputs": [path]}
+
+
+STEP_FUNCTIONS = {"index": step_index, "store": step_store, "archive": step_archive, "sync": step_sync,
+                  "export": step_export, "calibrate": step_calibrate}
+
+
+def run_step(step, aedat_path, svo_path, params):
+    start = time.perf_counter()
+    result = STEP_FUNCTIONS[step](aedat_path, svo_path, **params)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def _hash_job(path):
+    return path, content_hash(path)
+
+
+class BatchRun:
+    def __init__(self, manifest_path, recordings, steps, params, force=False):
+        self.manifest_path = manifest_path
+        self.manifest = load_manifest(manifest_path)
+        self.recordings = recordings
+        self.steps = steps
+        self.params = {step: normalized(params.get(step, {})) for step in steps}
+        self.force = force
+
+    def hash_inputs(self, pool):
+        # Content hashes of every recording, re-hashed only when size or mtime changed
+        files = self.manifest["files"]
+        extensions = [".aedat4", ".svo2"] if any(s in PAIRED_STEPS for s in self.steps) else [".aedat4"]
+        todo = []
+        for paths in self.recordings.values():
+            for path in (paths[ext] for ext in extensions if ext in paths):
+                st = os.stat(path)
+                entry = files.get(path)
+                if entry is None or entry["size"] != st.st_size or entry["mtime_ns"] != st.st_mtime_ns:
+                    files[path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": None}
+                    todo.append(path)
+        if todo:
+            print(f"Hashing {len(todo)} recordings")
+            for path, digest in pool.map(_hash_job, todo):
+                files[path]["hash"] = digest
+            save_manifest(self.manifest_path, self.manifest)
+
+    def inputs(self, step, paths):
+        keys = [".aedat4", ".svo2"] if step in PAIRED_STEPS else [".aedat4"]
+        return [self.manifest["files"][paths[k]]["hash"] for k in keys]
+
+    def is_done(self, step, paths):
+        entry = self.manifest["steps"].get(f"{paths['.aedat4']}|{step}")
+        if self.force or entry is None:
+            return False
+        return (entry["inputs"] == self.inputs(step, paths) and entry["params"] == self.params[step]
+                and all(os.path.exists(p) for p in entry["outputs"]))
+
+    def plan(self):
+        # [(stem, step)] still to run, largest recordings first so the long tasks start early;
+        # steps without their ZED recording are reported and left out
+        tasks = []
+        by_size = sorted(self.recordings.items(), key=lambda item: -self.manifest["files"][item[1][".aedat4"]]["size"])
+        for stem, paths in by_size:
+            for step in self.steps:
+                if step in PAIRED_STEPS and ".svo2" not in paths:
+                    print(f"{stem}: no matching .svo2, {step} skipped")
+                elif not self.is_done(step, paths):
+                    tasks.append((stem, step))
+        return tasks
+
+    def run(self, pool, tasks, workers):
+        # At most one task per worker is submitted, so tasks start in plan order and an
+        # interrupted run leaves nothing queued in the pool
+        order = {task: i for i, task in enumerate(tasks)}
+        remaining = set(tasks)
+        running = {}
+        failed = set()
+        finished = 0
+        while remaining or running:
+            in_flight = set(running.values())
+            for task in sorted(remaining, key=order.get):
+                if len(running) >= workers:
+                    break
+                stem, step = task
+                depends = [(stem, d) for d in DEPENDS[step]]
+                if any(d in failed for d in depends):
+                    print(f"{stem}: {step} skipped, a step it depends on failed")
+                    failed.add(task)
+                    remaining.discard(task)
+                elif not any(d in remaining or d in in_flight for d in depends):
+                    paths = self.recordings[stem]
+                    future = pool.submit(run_step, step, paths[".aedat4"], paths.get(".svo2"), self.params[step])
+                    running[future] = task
+                    in_flight.add(task)
+                    remaining.discard(task)
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stem, step = running.pop(future)
+                finished += 1
+                paths = self.recordings[stem]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed.add((stem, step))
+                    print(f"[{finished}/{len(tasks)}] {stem}: {step} failed: {e}")
+                    continue
+                self.manifest["steps"][f"{paths['.aedat4']}|{step}"] = {
+                    "inputs": self.inputs(step, paths), "params": self.params[step], "outputs": result.pop("outputs"),
+                    "result": result, "finished": datetime.datetime.now().isoformat(timespec="seconds")}
+                save_manifest(self.manifest_path, self.manifest)
+                print(f"[{finished}/{len(tasks)}] {stem}: {step} done in {result['seconds']:.1f} s")
+        return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run indexing, conversion, sync, export and calibration steps over "
+                                                 "directories of .aedat4 / .svo2 recordings.")
+    parser.add_argument("dirs", nargs="*", default=[BASE_DIR], help=f"Recording directories (default: {BASE_DIR})")
+    parser.add_argument("--steps", default=",".join(DEFAULT_STEPS), help=f"Comma-separated, from {', '.join(STEPS)}")
+    parser.add_argument("--manifest", help=f"Manifest file (default: {MANIFEST_NAME} in the first directory)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--force", action="store_true", help="Redo every step regardless of the manifest")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the steps that would run")
+    parser.add_argument("--export-dir", help="PNG export root (default: <first directory>/export)")
+    parser.add_argument("--export-interval", type=int, nargs=2, default=[1_000_000, 1_000_000],
+                        metavar=("FRAME_US", "EVENT_US"), help="Save a frame / event PNG every given microseconds")
+    parser.add_argument("--codec", choices=CODEC_ORDER, default=DEFAULT_CODEC, help="Event archive codec")
+    parser.add_argument("--level", type=int, help="Event archive codec level")
+    parser.add_argument("--sync-bin-us", type=int, default=5000)
+    parser.add_argument("--sync-max-offset-us", type=int, default=2_000_000)
+    parser.add_argument("--sync-window-us", type=int, default=20_000_000)
+    add_target_arguments(parser)
+    parser.set_defaults(pattern="circles")
+    parser.add_argument("--window-ms", type=float, default=500.0, help="Event calibration detection window")
+    args = parser.parse_args()
+
+    steps = [s.strip() for s in args.steps.split(",") if s.strip()]
+    unknown = [s for s in steps if s not in STEPS]
+    if unknown:
+        print(f"Unknown steps: {', '.join(unknown)}; expected some of {', '.join(STEPS)}")
+        sys.exit(1)
+    steps = [s for s in STEPS if s in steps]
+    spec = target_from_args(args)
+    params = {
+        "archive": {"codec": args.codec, "level": args.level},
+        "sync": {"bin_us": args.sync_bin_us, "max_offset_us": args.sync_max_offset_us, "window_us": args.sync_window_us},
+        "export": {"output_dir": os.path.abspath(args.export_dir or os.path.join(args.dirs[0], "export")),
+                   "frame_interval": max(1, args.export_interval[0]), "event_interval": max(1, args.export_interval[1])},
+        "calibrate": {"pattern": spec.pattern, "cols": spec.cols, "rows": spec.rows, "spacing": spec.spacing,
+                      "subpix_window": spec.subpix_window, "window_us": int(args.window_ms * 1e3)},
+    }
+
+    recordings = {stem: paths for stem, paths in find_recordings(args.dirs).items() if ".aedat4" in paths}
+    if not recordings:
+        print(f"No .aedat4 recordings in {', '.join(args.dirs)}")
+        sys.exit(1)
+    manifest_path = args.manifest or os.path.join(args.dirs[0], MANIFEST_NAME)
+    batch = BatchRun(manifest_path, recordings, steps, params, args.force)
+    print(f"{len(recordings)} recordings ({sum('.svo2' in p for p in recordings.values())} with a .svo2), "
+          f"steps: {', '.join(steps)}, {args.workers} workers")
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        batch.hash_inputs(pool)
+        tasks = batch.plan()
+        print(f"{len(tasks)} steps to run, the others are up to date")
+        if args.dry_run:
+            for stem, step in tasks:
+                print(f"  {stem}: {step}")
+            return
+        try:
+            failed = batch.run(pool, tasks, max(1, args.workers))
+        except KeyboardInterrupt:
+            print("Interrupted, finished steps are kept in the manifest")
+            pool.shutdown(wait=False, cancel_futures=True)
+            sys.exit(1)
+    print(f"Finished in {time.perf_counter() - start:.1f} s, {len(failed)} failed")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
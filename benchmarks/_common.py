@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def measure(fn, repeat=20, warmup=2):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    samples.sort()
+    return {"min": samples[0], "median": samples[len(samples) // 2], "max": samples[-1], "repeat": repeat}
+
+
+def report(name, result, items=None):
+    line = f"{name:<48} median {result['median'] * 1e3:9.3f} ms   min {result['min'] * 1e3:9.3f} ms"
+    if items:
+        line += f"   {items / result['median'] / 1e6:8.2f} M/s"
+    print(line)
+
+
+def environment():
+    # Library versions the numbers depend on, stored with every JSON result
+    import platform
+    import numpy
+    info = {"python": platform.python_version(), "machine": platform.machine(), "numpy": numpy.__version__}
+    for module, key in (("cv2", "opencv"), ("dv_processing", "dv_processing"), ("pyzed.sl", "pyzed")):
+        try:
+            info[key] = getattr(__import__(module, fromlist=["_"]), "__version__", "unknown")
+        except ImportError:
+            info[key] = None
+    return info
+
+
+def write_json(path, results):
+    import datetime
+    import json
+    data = {"created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "environment": environment(), "results": results}
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def percentiles(samples, points=(50, 95, 99)):
+    if len(samples) == 0:
+        return {f"p{p}": None for p in points}
+    ordered = sorted(samples)
+    return {f"p{p}": ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in points}
+
+
+def peak_rss_mb():
+    # Peak resident set size of this process; None where the resource module is missing
+    try:
+        import resource
+    except ImportError:
+        return None
+    import sys
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
@@ -0,0 +1,116 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import _common
+from acquisition import DropQueue, AcquisitionThread, RecordingThread, OPEN_WRITER, CLOSE_WRITER
+from acquisition import recording_report, format_queue_stats
+from event_accumulation import EventAccumulator
+from sources import SyntheticDavisSource, ReplayDavisSource, davis_readers
+
+# Runs the live2.py pipeline (acquisition thread -> preview/record queues -> recording
+# thread) on a synthetic or replayed DAVIS source and raises the event rate until the
+# record path starts dropping packets. The writer appends raw packet bytes to a
+# temporary file, the preview renders a polarity image at about 30 Hz.
+
+
+def write_packet(writer, stream, packet):
+    if stream == "frames":
+        writer.write(packet.image.tobytes())
+    elif isinstance(packet, np.ndarray):
+        writer.write(packet.tobytes())
+    elif stream == "events":
+        writer.write(packet.numpy().tobytes())
+
+
+def run_pipeline(source, duration, preview_queue_size, record_queue_size, output_dir):
+    width, height = source.getEventResolution()
+    accumulator = EventAccumulator(width, height)
+    preview_queue = DropQueue("preview", preview_queue_size)
+    record_queue = DropQueue("record", record_queue_size)
+    acquisition = AcquisitionThread(davis_readers(source), preview_queue, record_queue,
+                                    preview_streams={"frames", "events"})
+    recorder = RecordingThread(record_queue, write_packet)
+    acquisition.start()
+    recorder.start()
+
+    path = os.path.join(output_dir, "load_test.bin")
+    writer = open(path, "wb")
+    acquisition.set_recording(True, (OPEN_WRITER, writer))
+    t0 = time.monotonic()
+    previews = 0
+    while time.monotonic() - t0 < duration and source.isRunning():
+        for stream, packet in preview_queue.get_all():
+            if stream == "events":
+                accumulator.polarity_image(packet)
+        previews += 1
+        time.sleep(1 / 30)
+    acquisition.set_recording(False, (CLOSE_WRITER, None))
+    while not recorder.closed.wait(0.1) and recorder.is_alive():
+        pass
+    elapsed = time.monotonic() - t0
+    acquisition.stop()
+    recorder.stop()
+    acquisition.join()
+    recorder.join()
+    writer.close()
+    size = os.path.getsize(path)
+    os.remove(path)
+    return {"elapsed": elapsed, "previews": previews, "bytes": size,
+            "report": recording_report(acquisition, recorder),
+            "preview": preview_queue, "record": record_queue}
+
+
+def print_result(label, result, events_generated=None):
+    report = result["report"]
+    lost = sum(r["lost"] for r in report.values())
+    line = f"{label}: {result['elapsed']:.1f} s, wrote {result['bytes'] / 1e6 / result['elapsed']:.1f} MB/s"
+    if events_generated is not None:
+        line += f", {events_generated / result['elapsed'] / 1e6:.2f} Mev/s generated"
+    print(line)
+    for name, r in report.items():
+        print(f"    {name}: read {r['read']}, written {r['written']}, dropped {r['dropped']}")
+    print(f"    {format_queue_stats(result['preview'])}")
+    print(f"    {format_queue_stats(result['record'])}")
+    return lost
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the event rate at which the threaded capture pipeline drops data")
+    parser.add_argument("--rates", type=float, nargs="+", default=[1e6, 2e6, 5e6, 10e6, 20e6, 50e6],
+                        help="Synthetic event rates (events/s) to try in order")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per rate")
+    parser.add_argument("--width", type=int, default=346)
+    parser.add_argument("--height", type=int, default=260)
+    parser.add_argument("--record-queue", type=int, default=4096, help="Same default as live2.py")
+    parser.add_argument("--preview-queue", type=int, default=64, help="Same default as live2.py")
+    parser.add_argument("--replay", help="Replay this .aedat4 instead of synthetic data")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed, 0 for as fast as possible")
+    parser.add_argument("--keep-going", action="store_true", help="Try all rates even after drops")
+    args = parser.parse_args()
+
+    output_dir = tempfile.mkdtemp(prefix="msc_load_")
+    try:
+        if args.replay:
+            source = ReplayDavisSource(args.replay, speed=args.speed or None)
+            result = run_pipeline(source, args.duration, args.preview_queue, args.record_queue, output_dir)
+            print_result(f"replay {args.replay} at {args.speed or 'max'}x", result)
+            return
+
+        for rate in args.rates:
+            source = SyntheticDavisSource(rate, (args.width, args.height))
+            result = run_pipeline(source, args.duration, args.preview_queue, args.record_queue, output_dir)
+            lost = print_result(f"{rate / 1e6:g} Mev/s", result, source.generated_events)
+            if source.skipped_us:
+                # The acquisition thread could not even read at this rate; nothing reached the queues
+                print(f"    acquisition fell behind the source by {source.skipped_us / 1e3:.0f} ms in total")
+            if (lost or source.skipped_us) and not args.keep_going:
+                print(f"Pipeline saturated at {rate / 1e6:g} Mev/s")
+                break
+    finally:
+        os.rmdir(output_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import numpy as np
+from _common import measure, report
+from event_arrays import EVENT_DTYPE
+from calibration_detect import TargetSpec
+from calibration_events import BlinkDetector, blink_frequency, order_grid
+
+# Blinking circle grid on a 346x260 sensor: every LED pixel fires a few ON events at
+# each rising edge and OFF events at each falling edge (with timing jitter), on top of
+# uniform background noise. Reports throughput of the detector and the centre error.
+
+WIDTH, HEIGHT = 346, 260
+
+
+def make_blinking_grid(spec, frequency, duration_s, noise_rate, radius=3, events_per_edge=3, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = np.array([[60 + j * 35.3 + 0.37, 50 + i * 34.1 + 0.21]
+                        for i in range(spec.rows) for j in range(spec.cols)])
+    yy, xx = np.mgrid[0:HEIGHT, 0:WIDTH]
+    inside = np.zeros((HEIGHT, WIDTH), dtype=bool)
+    for cx, cy in centres:
+        inside |= (xx - cx) ** 2 + (yy - cy) ** 2 <= radius ** 2
+    py, px = np.nonzero(inside)
+    edges = np.arange(int(duration_s * frequency))
+    t, x, y, p = [], [], [], []
+    for polarity, offset in ((1, 0.0), (0, 0.5)):
+        for k in range(events_per_edge):
+            times = (edges[:, None] + offset) / frequency * 1e6 + rng.normal(0, 60, (len(edges), len(px))) + k * 40
+            t.append(times.ravel())
+            x.append(np.tile(px, len(edges)))
+            y.append(np.tile(py, len(edges)))
+            p.append(np.full(times.size, polarity))
+    n = int(noise_rate * duration_s)
+    t.append(rng.uniform(0, duration_s * 1e6, n))
+    x.append(rng.integers(0, WIDTH, n))
+    y.append(rng.integers(0, HEIGHT, n))
+    p.append(rng.integers(0, 2, n))
+    t = np.concatenate(t)
+    order = np.argsort(t, kind="stable")
+    events = np.empty(len(t), dtype=EVENT_DTYPE)
+    events["timestamp"] = t[order].astype(np.int64) + 1_000_000
+    events["x"] = np.concatenate(x)[order]
+    events["y"] = np.concatenate(y)[order]
+    events["polarity"] = np.concatenate(p)[order]
+    return events, centres
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and accuracy of the blinking target detector")
+    parser.add_argument("--durations", type=float, nargs="+", default=[0.5, 1.0, 3.0], help="Window lengths (s)")
+    parser.add_argument("--frequency", type=float, default=217.0, help="Blink frequency (Hz)")
+    parser.add_argument("--noise-rate", type=float, default=2e6, help="Background events/s")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    spec = TargetSpec("circles", 7, 5, 1.0)
+    for duration in args.durations:
+        events, centres = make_blinking_grid(spec, args.frequency, duration, args.noise_rate)
+        n = len(events)
+        print(f"--- {duration:g} s, {n / 1e6:.1f} M events")
+        report("blink_frequency", measure(lambda: blink_frequency(events), args.repeat), n)
+        known = BlinkDetector(WIDTH, HEIGHT, args.frequency)
+        report("detect, known frequency", measure(lambda: known.detect(events), args.repeat), n)
+        estimated = BlinkDetector(WIDTH, HEIGHT)
+        report("detect, estimated frequency", measure(lambda: estimated.detect(events), args.repeat), n)
+        frequency, blobs, _ = estimated.detect(events)
+        grid = order_grid(blobs, spec, (WIDTH, HEIGHT))
+        if grid is None:
+            print(f"grid not found ({len(blobs)} blobs, {frequency:.2f} Hz)")
+        else:
+            error = np.linalg.norm(grid - centres, axis=1)
+            print(f"{frequency:.2f} Hz, centre error mean {error.mean():.3f} px, max {error.max():.3f} px")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import numpy as np
+import cv2
+from _common import measure, report
+from depth_render import DepthRenderer
+
+DISPLAY_WIDTH, DISPLAY_HEIGHT = 640, 360
+
+
+def make_depth(width, height, seed=0):
+    # Smooth ramp with holes: NaN (occluded), +inf (too far), -inf (too close) and zeros
+    rng = np.random.default_rng(seed)
+    depth = np.linspace(300, 8000, width, dtype=np.float32)[None, :].repeat(height, axis=0)
+    depth += rng.normal(0, 20, depth.shape).astype(np.float32)
+    holes = rng.random(depth.shape)
+    depth[holes < 0.05] = np.nan
+    depth[(holes >= 0.05) & (holes < 0.07)] = np.inf
+    depth[(holes >= 0.07) & (holes < 0.08)] = -np.inf
+    depth[(holes >= 0.08) & (holes < 0.09)] = 0
+    return depth
+
+
+# Current approach in playback_svo.py: full-size processing, resize at the end
+def full_size_render(depth_data):
+    valid_mask = np.logical_and(np.isfinite(depth_data), depth_data > 0)
+    depth_valid = np.where(valid_mask, depth_data, 0)
+    depth_clipped = np.clip(depth_valid, 0, 5000)
+    if np.count_nonzero(depth_clipped) == 0:
+        depth_gray = np.zeros((depth_data.shape[0], depth_data.shape[1]), dtype=np.uint8)
+    else:
+        depth_normalized = cv2.normalize(depth_clipped, None, 0, 255, cv2.NORM_MINMAX)
+        depth_gray = depth_normalized.astype(np.uint8)
+    return cv2.resize(depth_gray, (DISPLAY_WIDTH, DISPLAY_HEIGHT))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-frame cost of depth visualization: full-size vs. downscale-first")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    depth = make_depth(args.width, args.height)
+    print(f"--- {args.width}x{args.height} depth -> {DISPLAY_WIDTH}x{DISPLAY_HEIGHT}")
+    report("full size (playback_svo.py)", measure(lambda: full_size_render(depth), args.repeat))
+    for name, renderer in [
+        ("downscale first, min/max", DepthRenderer(DISPLAY_WIDTH, DISPLAY_HEIGHT)),
+        ("downscale first, fixed range", DepthRenderer(DISPLAY_WIDTH, DISPLAY_HEIGHT, fixed_range=True)),
+        ("downscale first, fixed range + JET LUT",
+         DepthRenderer(DISPLAY_WIDTH, DISPLAY_HEIGHT, fixed_range=True, colormap=cv2.COLORMAP_JET)),
+    ]:
+        report(name, measure(lambda: renderer.render(depth), args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import numpy as np
+from _common import measure, report
+from event_arrays import EVENT_DTYPE
+from event_accumulation import EventAccumulator
+
+WIDTH, HEIGHT = 346, 260
+
+
+def make_events(n, width=WIDTH, height=HEIGHT, duration_us=1_000_000, seed=0):
+    rng = np.random.default_rng(seed)
+    events = np.empty(n, dtype=EVENT_DTYPE)
+    events["timestamp"] = np.sort(rng.integers(0, duration_us, n))
+    events["x"] = rng.integers(0, width, n)
+    events["y"] = rng.integers(0, height, n)
+    events["polarity"] = rng.integers(0, 2, n)
+    return events
+
+
+def visualizer_case(n):
+    # dv.visualization.EventVisualizer on the same events, for reference
+    try:
+        import dv_processing as dv
+    except ImportError:
+        return None
+    events = make_events(n)
+    store = dv.EventStore()
+    for e in events:
+        store.push_back(int(e["timestamp"]), int(e["x"]), int(e["y"]), bool(e["polarity"]))
+    visualizer = dv.visualization.EventVisualizer((WIDTH, HEIGHT), dv.visualization.colors.black(),
+                                                  dv.visualization.colors.green(), dv.visualization.colors.red())
+    return lambda: visualizer.generateImage(store)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the NumPy event representations")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 5_000_000])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--bins", type=int, default=5)
+    parser.add_argument("--with-visualizer", action="store_true", help="Also time EventVisualizer.generateImage")
+    args = parser.parse_args()
+
+    accumulator = EventAccumulator(WIDTH, HEIGHT)
+    for n in args.sizes:
+        events = make_events(n)
+        print(f"--- {n} events at {WIDTH}x{HEIGHT}")
+        report("polarity image", measure(lambda: accumulator.polarity_image(events), args.repeat), n)
+        report("signed count image", measure(lambda: accumulator.count_image(events), args.repeat), n)
+        report("time surface (tau 50 ms)",
+               measure(lambda: accumulator.time_surface(events, int(events["timestamp"][-1]), 50_000), args.repeat), n)
+        report(f"voxel grid ({args.bins} bins)", measure(lambda: accumulator.voxel_grid(events, args.bins), args.repeat), n)
+        if args.with_visualizer:
+            case = visualizer_case(n)
+            if case is not None:
+                report("EventVisualizer.generateImage", measure(case, args.repeat), n)
+
+
+if __name__ == "__main__":
+    main()
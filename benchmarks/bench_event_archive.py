@@ -0,0 +1,165 @@
+import argparse
+import os
+import shutil
+import tempfile
+import numpy as np
+from _common import measure, report, write_json
+from event_arrays import EVENT_DTYPE
+from event_archive import ArchiveWriter, EventArchive, available_codecs
+
+# Size and decode speed of event archives (event_archive.py) per codec and level, against
+# the .aedat4 they replace and the raw 13 bytes/event columns of event_store.py. Input is
+# a real recording (--recording, needs dv_processing) or a synthetic DAVIS stream of
+# moving edges over background noise. Random events compress far worse than a real
+# scene, so the synthetic ratios are only a lower bound.
+
+WIDTH, HEIGHT = 346, 260
+RAW_BYTES_PER_EVENT = 13
+WINDOW_US = 33_000
+LEVELS = {"zstd": (1, 3, 9), "lz4": (0, 9), "zlib": (1, 6)}
+
+
+def make_edge_stream(duration_us, rate, noise=0.1, seed=0):
+    # Vertical edges sweeping across the sensor, events along them with jitter, plus noise
+    rng = np.random.default_rng(seed)
+    n = int(rate * duration_us / 1e6)
+    t = np.sort(rng.integers(0, duration_us, n))
+    x = (t * (WIDTH / 250_000.0) + rng.normal(0, 1.5, n)) % WIDTH
+    edge = rng.integers(0, 3, n)
+    x = (x + edge * (WIDTH / 3)) % WIDTH
+    y = rng.integers(0, HEIGHT, n)
+    p = (edge % 2).astype(np.uint8)
+    is_noise = rng.random(n) < noise
+    x[is_noise] = rng.integers(0, WIDTH, is_noise.sum())
+    p[is_noise] = rng.integers(0, 2, is_noise.sum())
+    events = np.empty(n, dtype=EVENT_DTYPE)
+    events["timestamp"] = t + 1_700_000_000_000_000
+    events["x"] = x.astype(np.int16)
+    events["y"] = y
+    events["polarity"] = p
+    return events
+
+
+def read_recording(path):
+    import dv_processing as dv
+    recording = dv.io.MonoCameraRecording(path)
+    batches = []
+    while True:
+        events = recording.getNextEventBatch()
+        if events is None:
+            break
+        if len(events) > 0:
+            batches.append(events.numpy())
+    return np.concatenate(batches), recording.getEventResolution()
+
+
+def write_archive(path, events, resolution, codec, level, batch=10_000):
+    writer = ArchiveWriter(path, resolution, codec, level)
+    for start in range(0, len(events), batch):
+        writer.add_events(events[start:start + batch])
+    writer.close()
+
+
+def full_decode(path):
+    # A fresh reader each time, so no chunk comes from the cache
+    archive = EventArchive(path)
+    return archive.events_between(*archive.time_range()) if len(archive.chunks) else None
+
+
+def window_reader(path):
+    # Consecutive frame-interval windows, as the players read them
+    archive = EventArchive(path)
+    start, end = archive.time_range()
+    position = [start]
+
+    def run():
+        t0 = position[0]
+        position[0] = t0 + WINDOW_US if t0 + WINDOW_US < end else start
+        return archive.events_between(t0, t0 + WINDOW_US)
+    return run
+
+
+def aedat4_cases(path, event_count, repeat):
+    import dv_processing as dv
+    recording = dv.io.MonoCameraRecording(path)
+    start, end = recording.getTimeRange()
+    report("aedat4 full decode", measure(lambda: dv.io.MonoCameraRecording(path).getEventsTimeRange(start, end + 1),
+                                         max(1, repeat // 4), 1), event_count)
+    position = [start]
+
+    def run():
+        t0 = position[0]
+        position[0] = t0 + WINDOW_US if t0 + WINDOW_US < end else start
+        return recording.getEventsTimeRange(t0, t0 + WINDOW_US)
+    report(f"aedat4 {WINDOW_US / 1e3:g} ms windows", measure(run, repeat))
+
+
+def write_synthetic_aedat4(path, events):
+    import dv_processing as dv
+    config = dv.io.MonoCameraWriter.EventOnlyConfig("bench", (WIDTH, HEIGHT))
+    writer = dv.io.MonoCameraWriter(path, config)
+    for start in range(0, len(events), 10_000):
+        store = dv.EventStore()
+        for t, x, y, p in events[start:start + 10_000].tolist():
+            store.push_back(t, x, y, bool(p))
+        writer.writeEvents(store, streamName="events")
+    del writer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compression ratio and decode throughput of event archives")
+    parser.add_argument("--recording", help=".aedat4 to archive (default: a synthetic stream)")
+    parser.add_argument("--duration", type=float, default=5.0, help="Synthetic stream length (s)")
+    parser.add_argument("--rate", type=float, default=5e6, help="Synthetic events/s")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="msc_bench_")
+    results = []
+    try:
+        aedat4_path = args.recording
+        if aedat4_path is not None:
+            events, resolution = read_recording(aedat4_path)
+        else:
+            events, resolution = make_edge_stream(int(args.duration * 1e6), args.rate), (WIDTH, HEIGHT)
+            aedat4_path = os.path.join(tmp_dir, "synthetic.aedat4")
+            try:
+                write_synthetic_aedat4(aedat4_path, events)
+            except (ImportError, AttributeError, RuntimeError) as e:
+                print(f"No synthetic .aedat4 ({e}), aedat4 comparison skipped")
+                aedat4_path = None
+        n = len(events)
+        aedat4_size = os.path.getsize(aedat4_path) if aedat4_path else None
+        print(f"{n / 1e6:.1f} M events, raw columns {n * RAW_BYTES_PER_EVENT / 1e6:.1f} MB"
+              + (f", .aedat4 {aedat4_size / 1e6:.1f} MB ({aedat4_size / n:.2f} B/event)" if aedat4_size else ""))
+        if aedat4_path:
+            aedat4_cases(aedat4_path, n, args.repeat)
+
+        for codec in available_codecs():
+            for level in LEVELS[codec]:
+                name = f"{codec} {level}"
+                path = os.path.join(tmp_dir, f"{codec}_{level}.evar")
+                encode = measure(lambda: write_archive(path, events, resolution, codec, level), max(1, args.repeat // 4), 0)
+                size = os.path.getsize(path)
+                ratio = f"{RAW_BYTES_PER_EVENT * n / size:.1f}x raw"
+                if aedat4_size:
+                    ratio += f", {size / aedat4_size:.2f}x the .aedat4"
+                print(f"--- {name}: {size / 1e6:.1f} MB, {size / n:.2f} B/event ({ratio})")
+                report(f"{name} encode", encode, n)
+                decode = measure(lambda: full_decode(path), max(1, args.repeat // 4), 1)
+                report(f"{name} full decode", decode, n)
+                windows = measure(window_reader(path), args.repeat)
+                report(f"{name} {WINDOW_US / 1e3:g} ms windows", windows)
+                results.append({"name": name, "bytes": size, "bytes_per_event": size / n, "aedat4_bytes": aedat4_size,
+                                "encode": encode, "full_decode": decode, "windows": windows, "events": n})
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    if args.output:
+        write_json(args.output, results)
+        print(f"Saved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
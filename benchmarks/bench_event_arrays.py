@@ -0,0 +1,66 @@
+import argparse
+import numpy as np
+from _common import measure, report
+import dv_processing as dv
+from event_arrays import event_array, event_columns, time_bounds, filter_roi, count_image
+
+WIDTH, HEIGHT = 346, 260
+
+
+def make_store(n, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.sort(rng.integers(0, 1_000_000, n)).astype(np.int64)
+    x = rng.integers(0, WIDTH, n)
+    y = rng.integers(0, HEIGHT, n)
+    p = rng.integers(0, 2, n).astype(bool)
+    store = dv.EventStore()
+    for i in range(n):
+        store.push_back(int(t[i]), int(x[i]), int(y[i]), bool(p[i]))
+    return store
+
+
+# Current approach in read2.py / savepng: materialize the packet as Python objects
+def per_event_timestamps(store):
+    return [e.timestamp() for e in list(store)]
+
+
+def per_event_bounds(store):
+    events = list(store)
+    return events[0].timestamp(), events[-1].timestamp()
+
+
+def per_event_roi_count(store):
+    counts = np.zeros((HEIGHT, WIDTH), dtype=np.int64)
+    for e in store:
+        if 100 <= e.x() < 200 and 50 <= e.y() < 150:
+            counts[e.y(), e.x()] += 1
+    return counts
+
+
+def vectorized_timestamps(store):
+    return event_columns(store)[0]
+
+
+def vectorized_roi_count(store):
+    return count_image(filter_roi(event_array(store), 100, 50, 200, 150), WIDTH, HEIGHT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-event iteration vs. NumPy column access on EventStore")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        store = make_store(n)
+        print(f"--- {n} events")
+        report("per-event timestamps", measure(lambda: per_event_timestamps(store), args.repeat, 1), n)
+        report("event_columns timestamps", measure(lambda: vectorized_timestamps(store), args.repeat), n)
+        report("per-event start/end", measure(lambda: per_event_bounds(store), args.repeat, 1), n)
+        report("time_bounds start/end", measure(lambda: time_bounds(store), args.repeat), n)
+        report("per-event ROI accumulation", measure(lambda: per_event_roi_count(store), args.repeat, 1), n)
+        report("vectorized ROI accumulation", measure(lambda: vectorized_roi_count(store), args.repeat), n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import cv2
+from _common import measure, report, write_json
+from bench_depth_render import make_depth, full_size_render
+from bench_event_accumulation import make_events
+from depth_render import DepthRenderer, colormap_lut, apply_lut
+from depth_registration import DepthRegistration
+from event_accumulation import EventAccumulator
+from event_store import EventStore, write_event_store
+from undistort_maps import CameraCalibration
+
+# Per-frame operations of the capture and playback loops, on synthetic 346x260 DAVIS and
+# 1080p ZED inputs. Every case is (name, setup); setup returns the callable to time and
+# the number of items it processes, or raises ImportError when a dependency is missing,
+# in which case the case is recorded as skipped. --output writes all results as JSON,
+# --compare prints the median ratio against an earlier JSON file.
+
+DAVIS_SIZE = (346, 260)
+ZED_SIZE = (1920, 1080)
+PREVIEW_SIZE = (640, 360)
+FRAME_INTERVAL_US = 33_000
+EVENT_RATES = (1_000_000, 5_000_000, 20_000_000)
+
+
+def event_store(events):
+    import dv_processing as dv
+    store = dv.EventStore()
+    for t, x, y, p in zip(events["timestamp"].tolist(), events["x"].tolist(), events["y"].tolist(),
+                          events["polarity"].tolist()):
+        store.push_back(t, x, y, bool(p))
+    return store
+
+
+def frame_packet_events(rate):
+    # One 33 ms frame interval worth of events at the given event rate
+    n = int(rate * FRAME_INTERVAL_US / 1e6)
+    return make_events(n, *DAVIS_SIZE, duration_us=FRAME_INTERVAL_US)
+
+
+def slicer_case(rate):
+    def setup():
+        import dv_processing as dv
+        from datetime import timedelta
+        store = event_store(frame_packet_events(rate))
+        frame = dv.Frame(FRAME_INTERVAL_US, np.zeros(DAVIS_SIZE[::-1], dtype=np.uint8))
+
+        def run():
+            # A fresh slicer per run: feeding one slicer the same packet again would go
+            # back in time. Its construction is small next to accept() on a full packet.
+            slicer = dv.EventMultiStreamSlicer("events")
+            slicer.addFrameStream("frames")
+            slicer.doEveryTimeInterval(timedelta(milliseconds=33), lambda data: data.getEvents("events"))
+            slicer.accept("frames", [frame])
+            slicer.accept("events", store)
+        return run, len(store)
+    return setup
+
+
+def visualizer_case(rate):
+    def setup():
+        import dv_processing as dv
+        store = event_store(frame_packet_events(rate))
+        visualizer = dv.visualization.EventVisualizer(DAVIS_SIZE, dv.visualization.colors.black(),
+                                                      dv.visualization.colors.green(), dv.visualization.colors.red())
+        return (lambda: visualizer.generateImage(store)), len(store)
+    return setup
+
+
+def time_range_case(recording_path, window_us):
+    def setup():
+        import dv_processing as dv
+        recording = dv.io.MonoCameraRecording(recording_path)
+        start, end = recording.getTimeRange()
+        rng = np.random.default_rng(0)
+        starts = rng.integers(start, max(start + 1, end - window_us), 64).tolist()
+        position = [0]
+
+        def run():
+            t0 = starts[position[0] % len(starts)]
+            position[0] += 1
+            return recording.getEventsTimeRange(t0, t0 + window_us)
+        return run, None
+    return setup
+
+
+def write_synthetic_recording(path, rate, duration_us=2_000_000):
+    import dv_processing as dv
+    config = dv.io.MonoCameraWriter.EventOnlyConfig("bench", DAVIS_SIZE)
+    writer = dv.io.MonoCameraWriter(path, config)
+    for t0 in range(0, duration_us, FRAME_INTERVAL_US):
+        events = frame_packet_events(rate)
+        events["timestamp"] += t0
+        writer.writeEvents(event_store(events), streamName="events")
+    del writer
+
+
+def write_synthetic_store(path, rate, duration_us=2_000_000):
+    # The event_store.py layout of the same synthetic stream, without frames
+    batches = []
+    for t0 in range(0, duration_us, FRAME_INTERVAL_US):
+        events = frame_packet_events(rate)
+        events["timestamp"] += t0
+        batches.append(events)
+    source = os.stat(os.path.dirname(path))
+    write_event_store(path, DAVIS_SIZE, sum(len(b) for b in batches), batches, 0, [], source)
+
+
+def store_range_case(store_path, window_us, render):
+    def setup():
+        store = EventStore(store_path)
+        accumulator = EventAccumulator(*DAVIS_SIZE)
+        rng = np.random.default_rng(0)
+        starts = rng.integers(int(store.t[0]), max(int(store.t[0]) + 1, int(store.t[-1]) - window_us), 64).tolist()
+        position = [0]
+
+        def run():
+            t0 = starts[position[0] % len(starts)]
+            position[0] += 1
+            events = store.events_between(t0, t0 + window_us)
+            return accumulator.polarity_image(events) if render else events
+        return run, None
+    return setup
+
+
+def blend_case(event_scale):
+    # preview_events_both(): resize the event image to the frame, gray -> BGR, addWeighted
+    def setup():
+        frame = np.random.default_rng(0).integers(0, 256, DAVIS_SIZE[::-1], dtype=np.uint8)
+        ew, eh = int(DAVIS_SIZE[0] * event_scale), int(DAVIS_SIZE[1] * event_scale)
+        event_image = np.random.default_rng(1).integers(0, 256, (eh, ew, 3), dtype=np.uint8)
+
+        def run():
+            image = event_image
+            if image.shape[:2] != frame.shape[:2]:
+                image = cv2.resize(image, (frame.shape[1], frame.shape[0]))
+            frame_color = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+            return cv2.addWeighted(frame_color, 1.0, image, 0.5, 0)
+        return run, None
+    return setup
+
+
+def depth_case(fixed_range=None):
+    def setup():
+        depth = make_depth(*ZED_SIZE)
+        if fixed_range is None:
+            return (lambda: full_size_render(depth)), None
+        renderer = DepthRenderer(*PREVIEW_SIZE, fixed_range=fixed_range)
+        return (lambda: renderer.render(depth)), None
+    return setup
+
+
+def confidence_case(preview):
+    def setup():
+        size = PREVIEW_SIZE if preview else ZED_SIZE
+        confidence = np.random.default_rng(0).uniform(0, 100, size[::-1]).astype(np.float32)
+        if not preview:
+            # display_live_feed.py before preview-resolution rendering
+            def run():
+                conf_map = cv2.normalize(confidence, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+                return cv2.applyColorMap(conf_map, cv2.COLORMAP_JET)
+            return run, None
+        gray = np.empty(size[::-1], dtype=np.uint8)
+        color = np.empty(size[::-1] + (3,), dtype=np.uint8)
+        lut = colormap_lut(cv2.COLORMAP_JET)
+
+        def run():
+            cv2.convertScaleAbs(confidence, dst=gray, alpha=255.0 / 100)
+            return apply_lut(gray, lut, color)
+        return run, None
+    return setup
+
+
+def registration_case():
+    # ZED 1080p depth into the DAVIS image, nominal intrinsics and a 6 cm baseline
+    def setup():
+        zed = CameraCalibration([[1060, 0, 960], [0, 1060, 540], [0, 0, 1]], np.zeros(5), ZED_SIZE)
+        davis = CameraCalibration([[250, 0, 173], [0, 250, 130], [0, 0, 1]], [-0.3, 0.1, 0, 0, 0], DAVIS_SIZE)
+        registration = DepthRegistration(zed, davis, np.eye(3), [-60, 0, 0], ZED_SIZE)
+        depth = make_depth(*ZED_SIZE)
+        return (lambda: registration.register(depth)), None
+    return setup
+
+
+def build_cases(recording_path, store_path):
+    cases = []
+    for rate in EVENT_RATES:
+        cases.append((f"slicer accept+callback @ {rate / 1e6:g} Mev/s", slicer_case(rate)))
+    for rate in EVENT_RATES:
+        cases.append((f"EventVisualizer.generateImage @ {rate / 1e6:g} Mev/s", visualizer_case(rate)))
+    if recording_path is not None:
+        for window_us in (1_000, 33_000, 1_000_000):
+            cases.append((f"getEventsTimeRange {window_us / 1e3:g} ms window", time_range_case(recording_path, window_us)))
+    if store_path is not None:
+        for window_us in (FRAME_INTERVAL_US, 1_000_000):
+            cases.append((f"event store slice {window_us / 1e3:g} ms window", store_range_case(store_path, window_us, False)))
+        cases.append((f"event store slice + polarity_image {FRAME_INTERVAL_US / 1e3:g} ms",
+                      store_range_case(store_path, FRAME_INTERVAL_US, True)))
+    cases.append(("preview blend, same size", blend_case(1.0)))
+    cases.append(("preview blend, 2x event image resized", blend_case(2.0)))
+    cases.append(("depth 1080p, full-size normalize (old)", depth_case(None)))
+    cases.append(("depth 1080p, downscale-first min/max", depth_case(False)))
+    cases.append(("depth 1080p, downscale-first fixed range", depth_case(True)))
+    cases.append(("depth 1080p registered into the DAVIS image", registration_case()))
+    cases.append(("confidence JET 1080p, normalize+applyColorMap (old)", confidence_case(False)))
+    cases.append(("confidence JET 640x360, fixed scale + cached LUT", confidence_case(True)))
+    return cases
+
+
+def run_cases(cases, repeat):
+    results = []
+    for name, setup in cases:
+        try:
+            fn, items = setup()
+            result = measure(fn, repeat)
+        except (ImportError, AttributeError, RuntimeError) as e:
+            print(f"{name:<48} skipped: {e}")
+            results.append({"name": name, "skipped": str(e)})
+            continue
+        report(name, result, items)
+        result.update({"name": name, "items": items})
+        results.append(result)
+    return results
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, "r") as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"] if "median" in r}
+    print(f"--- compared with {baseline_path} (ratio > 1 is slower)")
+    for r in results:
+        old = baseline.get(r["name"])
+        if old is None or "median" not in r:
+            continue
+        print(f"{r['name']:<48} {r['median'] / old['median']:6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the per-frame hot paths")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--recording", help=".aedat4 for the getEventsTimeRange cases (default: a synthetic one)")
+    parser.add_argument("--filter", help="Only run cases whose name contains this text")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Earlier JSON result to compare against")
+    args = parser.parse_args()
+
+    recording_path = args.recording
+    tmp_dir = tempfile.mkdtemp(prefix="msc_bench_")
+    store_path = os.path.join(tmp_dir, "synthetic.aedat4.store")
+    write_synthetic_store(store_path, EVENT_RATES[1])
+    if recording_path is None:
+        recording_path = os.path.join(tmp_dir, "synthetic.aedat4")
+        try:
+            write_synthetic_recording(recording_path, EVENT_RATES[1])
+        except (ImportError, AttributeError, RuntimeError) as e:
+            print(f"No synthetic recording ({e}), getEventsTimeRange cases skipped")
+            recording_path = None
+
+    try:
+        cases = build_cases(recording_path, store_path)
+        if args.filter:
+            cases = [c for c in cases if args.filter in c[0]]
+        results = run_cases(cases, args.repeat)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    if args.output:
+        write_json(args.output, results)
+        print(f"Saved: {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
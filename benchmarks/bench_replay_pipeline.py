@@ -0,0 +1,382 @@
+import argparse
+import collections
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+import numpy as np
+import cv2
+from _common import percentiles, peak_rss_mb, write_json
+from acquisition import DropQueue, AcquisitionThread, RecordingThread, OPEN_WRITER, CLOSE_WRITER
+from acquisition import write_davis_packet, recording_report, format_recording_report, format_queue_stats
+from depth_render import DepthRenderer
+from event_accumulation import EventAccumulator
+from event_archive import ArchiveWriter, ARCHIVE_SUFFIX
+from event_arrays import event_array
+from export_png import export, select_save_points
+from recording_index import load_index
+from sources import SyntheticDavisSource, ReplayDavisSource, FakeZedSource, davis_readers
+
+# End-to-end headless run of the capture pipeline on a replayed .aedat4 (or synthetic
+# events) through the code live2.py and export_png.py run: the AcquisitionThread feeds
+# the preview stage (33 ms slices blended with the latest frame) and the RecordingThread,
+# which writes every packet with acquisition.write_davis_packet; once the recording is
+# closed, export_png.export writes frame and event PNGs from the file that was recorded.
+# An optional ZED stage renders depth from an .svo2 (or a fake ZED) alongside.
+#
+# A replayed recording is written with dv.io.MonoCameraWriter and previewed with the dv
+# slicer and visualizer, as in live2.py. Synthetic events are numpy arrays, which the dv
+# writer does not take: they are recorded into an event archive (event_archive.py) and
+# previewed with EventAccumulator, as read2.py does for converted recordings.
+#
+# Every packet carries its arrival time, when the camera would have delivered it
+# (sources arrival_time), so queueing in front of a stage counts. The preview and record
+# stages report the latency from arrival to the end of their own work as p50/p95/p99; a
+# preview slice is timed from the oldest packet it renders. The export reports its
+# throughput, it runs on the closed file and has no per-packet latency.
+
+PREVIEW_INTERVAL_US = 33_000
+
+
+class StageStats:
+    def __init__(self, name, clock=time.perf_counter):
+        self.name = name
+        self.clock = clock
+        self.latency = []
+        self.work = []
+        self.items = 0
+
+    def add(self, arrival, work_start, items=0):
+        now = self.clock()
+        self.latency.append(now - arrival)
+        self.work.append(now - work_start)
+        self.items += items
+
+    def summary(self):
+        to_ms = lambda d: {k: (None if v is None else v * 1e3) for k, v in d.items()}
+        return {"stage": self.name, "count": len(self.latency), "items": self.items,
+                "latency_ms": to_ms(percentiles(self.latency)), "work_ms": to_ms(percentiles(self.work))}
+
+
+def timed_readers(source, clock):
+    # Wrap each reader so packets travel as (arrival time, packet); the read time stands
+    # in when the source cannot tell when the packet arrived
+    def wrap(stream, read):
+        def timed():
+            packet = read()
+            if packet is None:
+                return None
+            arrival = source.arrival_time(stream, packet)
+            return (clock() if arrival is None else arrival), packet
+        return timed
+    return [(stream, wrap(stream, read)) for stream, read in davis_readers(source)]
+
+
+def packet_end_time(stream, packet):
+    if stream == "frames":
+        return packet.timestamp
+    return int(event_array(packet)["timestamp"][-1])
+
+
+class ArchivePacketWriter:
+    # The writer calls of write_davis_packet, into an event archive; IMU and trigger
+    # packets are not archived
+    def __init__(self, path, resolution):
+        self.archive = ArchiveWriter(path, resolution)
+
+    def writeFrame(self, frame, streamName=None):
+        self.archive.add_frame(frame.timestamp, frame.image)
+
+    def writeEvents(self, events, streamName=None):
+        self.archive.add_events(events)
+
+    def writeImuPacket(self, packet, streamName=None):
+        pass
+
+    def writeTriggerPacket(self, packet, streamName=None):
+        pass
+
+    def close(self):
+        self.archive.close()
+
+
+class Pipeline:
+    def __init__(self, source, output_dir, clock=time.perf_counter):
+        self.source = source
+        self.clock = clock
+        self.resolution = source.getEventResolution()
+        self.preview_queue = DropQueue("preview", 64)
+        self.record_queue = DropQueue("record", 4096)
+        self.acquisition = AcquisitionThread(timed_readers(source, clock), self.preview_queue,
+                                             self.record_queue, preview_streams={"frames", "events"})
+        self.recorder = RecordingThread(self.record_queue, self.write_packet)
+        self.stats = {name: StageStats(name, clock) for name in ("preview", "record")}
+        self.events_written = 0
+        # (last event time, arrival) of the event packets handed to the preview and not rendered yet
+        self.arrivals = collections.deque()
+        self.dv = isinstance(source, ReplayDavisSource)
+        if self.dv:
+            import dv_processing as dv
+            self.output_path = os.path.join(output_dir, "replay.aedat4")
+            self.slicer = dv.EventMultiStreamSlicer("events")
+            self.slicer.addFrameStream("frames")
+            self.visualizer = dv.visualization.EventVisualizer(self.resolution, dv.visualization.colors.black(),
+                                                               dv.visualization.colors.green(),
+                                                               dv.visualization.colors.red())
+            self.slicer.doEveryTimeInterval(timedelta(milliseconds=PREVIEW_INTERVAL_US // 1000), self.render_slice)
+        else:
+            self.output_path = os.path.join(output_dir, "replay" + ARCHIVE_SUFFIX)
+            self.accumulator = EventAccumulator(*self.resolution)
+            self.frame_gray = np.zeros(self.resolution[::-1], dtype=np.uint8)
+            self.pending_events = []
+            self.slice_end = None
+
+    def open_writer(self):
+        if self.dv:
+            import dv_processing as dv
+            recording = self.source.recording
+            config = dv.io.MonoCameraWriter.DAVISConfig(recording.getCameraName(), self.resolution)
+            return dv.io.MonoCameraWriter(self.output_path, config)
+        return ArchivePacketWriter(self.output_path, self.resolution)
+
+    def write_packet(self, writer, stream, item):
+        arrival, packet = item
+        start = self.clock()
+        write_davis_packet(writer, stream, packet)
+        n = len(packet) if stream == "events" else 0
+        self.events_written += n
+        self.stats["record"].add(arrival, start, n)
+
+    def rendered(self, slice_end, work_start, items):
+        # Latency of a slice from the arrival of its oldest packet; packets that end in the
+        # slice are done, a packet reaching past it stays for the next one
+        if not self.arrivals:
+            return
+        self.stats["preview"].add(self.arrivals[0][1], work_start, items)
+        while self.arrivals and self.arrivals[0][0] <= slice_end:
+            self.arrivals.popleft()
+
+    def render_slice(self, data):
+        # The display_preview callback of live2.py, without the windows
+        frames = data.getFrames("frames")
+        events = data.getEvents("events")
+        if len(frames) == 0:
+            return
+        start = self.clock()
+        latest_image = frames[-1].image
+        if len(latest_image.shape) != 3:
+            latest_image = cv2.cvtColor(latest_image, cv2.COLOR_GRAY2BGR)
+        self.visualizer.generateImage(events, latest_image)
+        self.visualizer.generateImage(events)
+        if len(events) > 0:
+            self.rendered(events.getHighestTime(), start, len(events))
+
+    def preview_array(self, stream, packet):
+        # Same slicing as the dv slicer, for numpy events
+        if stream == "frames":
+            image = packet.image
+            if image is not None:
+                self.frame_gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            return
+        t = event_array(packet)["timestamp"]
+        self.pending_events.append(packet)
+        if self.slice_end is None:
+            self.slice_end = int(t[0]) + PREVIEW_INTERVAL_US
+        if int(t[-1]) < self.slice_end:
+            return
+        start = self.clock()
+        events = np.concatenate([event_array(p) for p in self.pending_events])
+        self.pending_events.clear()
+        self.slice_end = int(t[-1]) + PREVIEW_INTERVAL_US
+        event_image = self.accumulator.polarity_image(events)
+        frame_color = cv2.cvtColor(self.frame_gray, cv2.COLOR_GRAY2BGR)
+        cv2.addWeighted(frame_color, 1.0, event_image, 0.5, 0)
+        self.rendered(int(t[-1]), start, len(events))
+
+    def preview(self, stream, item):
+        arrival, packet = item
+        if stream == "events":
+            if len(packet) == 0:
+                return
+            self.arrivals.append((packet_end_time(stream, packet), arrival))
+        if not self.dv:
+            self.preview_array(stream, packet)
+        elif stream == "frames":
+            self.slicer.accept("frames", [packet])
+        else:
+            self.slicer.accept("events", packet)
+
+    def run(self, duration):
+        self.acquisition.start()
+        self.recorder.start()
+        writer = self.open_writer()
+        self.acquisition.set_recording(True, (OPEN_WRITER, writer))
+        t0 = time.monotonic()
+        while time.monotonic() - t0 < duration and self.source.isRunning():
+            item = self.preview_queue.get(timeout=0.05)
+            if item is not None:
+                self.preview(*item)
+        self.acquisition.set_recording(False, (CLOSE_WRITER, None))
+        while not self.recorder.closed.wait(0.1) and self.recorder.is_alive():
+            pass
+        elapsed = time.monotonic() - t0
+        self.acquisition.stop()
+        self.recorder.stop()
+        self.acquisition.join()
+        self.recorder.join()
+        # The dv writer finalizes the file when its last reference goes, the archive on close()
+        if isinstance(writer, ArchivePacketWriter):
+            writer.close()
+        del writer
+        return elapsed
+
+
+def export_stage(file_path, export_every, output_dir, workers):
+    # export_png.export on the recorded file, one frame and one event PNG every
+    # export_every preview intervals
+    index = load_index(file_path)
+    if not index.has_frames:
+        return None
+    interval = PREVIEW_INTERVAL_US * export_every
+    frame_points = select_save_points(index.frame_timestamps, interval, None)
+    event_points = select_save_points(index.frame_timestamps, interval, None)
+    frame_dir = os.path.join(output_dir, "frame")
+    event_dir = os.path.join(output_dir, "event")
+    os.makedirs(frame_dir)
+    os.makedirs(event_dir)
+    start = time.perf_counter()
+    # export() prints every saved file
+    with contextlib.redirect_stdout(io.StringIO()):
+        saved = export(file_path, frame_points, event_points, index.frame_timestamps, frame_dir, event_dir, workers)
+    seconds = time.perf_counter() - start
+    return {"stage": "export", "pngs": saved, "seconds": seconds, "pngs_per_s": saved / seconds if seconds > 0 else None}
+
+
+def zed_stage(svo_path, fake_zed, duration, stop):
+    stats = StageStats("zed depth")
+    renderer = DepthRenderer(640, 360)
+    if fake_zed:
+        zed = FakeZedSource()
+        t0 = time.monotonic()
+        while not stop.is_set() and time.monotonic() - t0 < duration:
+            zed.grab()
+            read_time = time.perf_counter()
+            renderer.render(zed.depth())
+            stats.add(read_time, read_time, 1)
+        return stats
+
+    import pyzed.sl as sl
+    input_type = sl.InputType()
+    input_type.set_from_svo_file(svo_path)
+    init = sl.InitParameters(input_t=input_type)
+    init.depth_mode = sl.DEPTH_MODE.PERFORMANCE
+    init.coordinate_units = sl.UNIT.MILLIMETER
+    zed = sl.Camera()
+    if zed.open(init) != sl.ERROR_CODE.SUCCESS:
+        raise IOError(f"Error opening {svo_path}")
+    depth = sl.Mat()
+    runtime = sl.RuntimeParameters()
+    t0 = time.monotonic()
+    while not stop.is_set() and time.monotonic() - t0 < duration:
+        read_time = time.perf_counter()
+        if zed.grab(runtime) != sl.ERROR_CODE.SUCCESS:
+            break
+        zed.retrieve_measure(depth, sl.MEASURE.DEPTH)
+        renderer.render(depth.get_data())
+        stats.add(read_time, read_time, 1)
+    zed.close()
+    return stats
+
+
+def print_stage(summary):
+    lat, work = summary["latency_ms"], summary["work_ms"]
+    if summary["count"] == 0:
+        print(f"{summary['stage']:<10} no samples")
+        return
+    print(f"{summary['stage']:<10} n={summary['count']:<6} latency p50 {lat['p50']:8.2f} p95 {lat['p95']:8.2f} "
+          f"p99 {lat['p99']:8.2f} ms | work p50 {work['p50']:7.2f} p99 {work['p99']:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless end-to-end replay through the preview/record/export pipeline")
+    parser.add_argument("aedat4", nargs="?", help="Recording to replay (default: synthetic events)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed, 0 for as fast as possible")
+    parser.add_argument("--synthetic-rate", type=float, default=2e6, help="Events/s when no recording is given")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--export-every", type=int, default=30,
+                        help="Export a frame and an event PNG every N preview intervals of the recording")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="PNG export processes")
+    parser.add_argument("--svo", help="Also replay this .svo2 through the depth preview")
+    parser.add_argument("--fake-zed", action="store_true", help="Use a synthetic 1080p ZED for the depth stage")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.aedat4:
+        source = ReplayDavisSource(args.aedat4, speed=args.speed or None, clock=time.perf_counter)
+        label = f"{args.aedat4} at {args.speed or 'max'}x"
+    else:
+        source = SyntheticDavisSource(args.synthetic_rate, clock=time.perf_counter)
+        label = f"synthetic {args.synthetic_rate / 1e6:g} Mev/s"
+
+    zed_result = {}
+    stop = threading.Event()
+    zed_thread = None
+    if args.svo or args.fake_zed:
+        def run_zed():
+            try:
+                zed_result["stats"] = zed_stage(args.svo, args.fake_zed, args.duration, stop)
+            except (ImportError, IOError) as e:
+                zed_result["error"] = str(e)
+        zed_thread = threading.Thread(target=run_zed, name="zed", daemon=True)
+        zed_thread.start()
+
+    output_dir = tempfile.mkdtemp(prefix="msc_replay_")
+    pipeline = Pipeline(source, output_dir)
+    try:
+        elapsed = pipeline.run(args.duration)
+        stop.set()
+        export_result = export_stage(pipeline.output_path, max(1, args.export_every), output_dir, max(1, args.workers))
+    finally:
+        stop.set()
+        if zed_thread is not None:
+            zed_thread.join()
+        shutil.rmtree(output_dir)
+
+    stages = [s.summary() for s in pipeline.stats.values()]
+    if "stats" in zed_result:
+        stages.append(zed_result["stats"].summary())
+    report = recording_report(pipeline.acquisition, pipeline.recorder)
+    dropped = {q.name: q.stats()["dropped"] for q in (pipeline.preview_queue, pipeline.record_queue)}
+    result = {"source": label, "elapsed_s": elapsed, "events_per_s": pipeline.events_written / elapsed,
+              "stages": stages, "export": export_result, "dropped": dropped, "recording": report,
+              "peak_rss_mb": peak_rss_mb()}
+
+    print(f"--- {label}, {elapsed:.1f} s")
+    for summary in stages:
+        print_stage(summary)
+    if "error" in zed_result:
+        print(f"zed depth  skipped: {zed_result['error']}")
+    if export_result is None:
+        print("export     skipped: no frames recorded")
+    else:
+        print(f"export     {export_result['pngs']} PNGs in {export_result['seconds']:.2f} s "
+              f"({export_result['pngs_per_s']:.1f} PNG/s)")
+    print(f"sustained {result['events_per_s'] / 1e6:.2f} Mev/s recorded")
+    print(format_queue_stats(pipeline.preview_queue))
+    print(format_queue_stats(pipeline.record_queue))
+    for line in format_recording_report(report):
+        print(line)
+    if result["peak_rss_mb"] is not None:
+        print(f"peak RSS {result['peak_rss_mb']:.0f} MB")
+
+    if args.output:
+        write_json(args.output, [result])
+        print(f"Saved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
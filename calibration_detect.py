@@ -0,0 +1,193 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cv2 as cv
+
+# Calibration target detection over the PNGs written by live2.py ('c' key / calic
+# signal, cali_path) and by the savepng / export_png exports (davis/frame, davis/event).
+# Detection runs in a process pool. Results are cached per image directory in
+# corners_cache.json, keyed by the image's content hash and the target description, so
+# adding images to a directory only processes the new ones and renaming or re-saving
+# an identical image costs nothing.
+
+cali_path = "D:/Programs/DV/Recording/cali/davis"
+sf_path = "D:/Programs/DV/Recording/davis/frame"
+se_path = "D:/Programs/DV/Recording/davis/event"
+
+CACHE_NAME = "corners_cache.json"
+CACHE_VERSION = 1
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+PATTERNS = ("chessboard", "circles", "acircles")
+
+
+class TargetSpec:
+    def __init__(self, pattern, cols, rows, spacing, subpix_window=5):
+        if pattern not in PATTERNS:
+            raise ValueError(f"Unknown pattern {pattern}, expected one of {PATTERNS}")
+        self.pattern = pattern
+        # Inner corners (chessboard) or circles per row and per column
+        self.cols = cols
+        self.rows = rows
+        # Square size or circle spacing, in the unit the calibration should use (e.g. mm)
+        self.spacing = spacing
+        self.subpix_window = subpix_window
+
+    @property
+    def key(self):
+        # Part of the cache key: spacing does not change detections, the window does
+        return f"{self.pattern}:{self.cols}x{self.rows}:w{self.subpix_window}"
+
+    def object_points(self):
+        # Target coordinates (z = 0) in the order the detector returns the corners
+        grid = np.zeros((self.rows * self.cols, 3), dtype=np.float32)
+        if self.pattern == "acircles":
+            for i in range(self.rows):
+                for j in range(self.cols):
+                    grid[i * self.cols + j, :2] = ((2 * j + i % 2) * self.spacing, i * self.spacing)
+        else:
+            grid[:, :2] = np.mgrid[0:self.cols, 0:self.rows].T.reshape(-1, 2) * self.spacing
+        return grid
+
+
+def content_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def list_images(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def detect(path, spec):
+    # Runs in a worker process; returns a JSON-serializable detection
+    image = cv.imread(path, cv.IMREAD_GRAYSCALE)
+    if image is None:
+        return {"found": False, "error": "unreadable"}
+    size = (image.shape[1], image.shape[0])
+    pattern_size = (spec.cols, spec.rows)
+    if spec.pattern == "chessboard":
+        flags = cv.CALIB_CB_ADAPTIVE_THRESH | cv.CALIB_CB_NORMALIZE_IMAGE | cv.CALIB_CB_FAST_CHECK
+        found, corners = cv.findChessboardCorners(image, pattern_size, flags=flags)
+        if found:
+            window = (spec.subpix_window, spec.subpix_window)
+            criteria = (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+            corners = cv.cornerSubPix(image, corners, window, (-1, -1), criteria)
+    else:
+        # Blob centres are already sub-pixel, cornerSubPix does not apply to circles
+        flags = cv.CALIB_CB_SYMMETRIC_GRID if spec.pattern == "circles" else cv.CALIB_CB_ASYMMETRIC_GRID
+        found, corners = cv.findCirclesGrid(image, pattern_size, flags=flags)
+    result = {"found": bool(found), "image_size": size}
+    if found:
+        result["corners"] = corners.reshape(-1, 2).tolist()
+    return result
+
+
+def _detect_job(args):
+    path, spec = args
+    return detect(path, spec)
+
+
+def load_cache(directory):
+    path = os.path.join(directory, CACHE_NAME)
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != CACHE_VERSION:
+        return {}
+    return data.get("detections", {})
+
+
+def save_cache(directory, detections):
+    path = os.path.join(directory, CACHE_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"version": CACHE_VERSION, "detections": detections}, f)
+    os.replace(tmp_path, path)
+
+
+def detect_directories(directories, spec, workers=None, refresh=False):
+    # Returns {image path: detection}; detections carry their content hash
+    caches = {d: ({} if refresh else load_cache(d)) for d in directories}
+    results = {}
+    todo = []
+    for directory in directories:
+        for path in list_images(directory):
+            digest = content_hash(path)
+            cached = caches[directory].get(f"{digest}:{spec.key}")
+            if cached is not None:
+                results[path] = dict(cached, hash=digest, cached=True)
+            else:
+                todo.append((directory, path, digest))
+
+    if todo:
+        workers = max(1, min(workers or os.cpu_count() or 1, len(todo)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            jobs = [(path, spec) for _, path, _ in todo]
+            for (directory, path, digest), detection in zip(todo, pool.map(_detect_job, jobs, chunksize=4)):
+                caches[directory][f"{digest}:{spec.key}"] = detection
+                results[path] = dict(detection, hash=digest, cached=False)
+        for directory in {d for d, _, _ in todo}:
+            try:
+                save_cache(directory, caches[directory])
+            except OSError as e:
+                print(f"Failed to save detection cache in {directory}: {e}")
+    return results
+
+
+def found_views(results):
+    # (path, (N, 1, 2) float32 image points) for every image with a detection, sorted by path
+    return [(path, np.asarray(r["corners"], dtype=np.float32).reshape(-1, 1, 2))
+            for path, r in sorted(results.items()) if r["found"]]
+
+
+def add_target_arguments(parser):
+    parser.add_argument("--pattern", choices=PATTERNS, default="chessboard")
+    parser.add_argument("--cols", type=int, default=9, help="Inner corners / circles per row")
+    parser.add_argument("--rows", type=int, default=6, help="Inner corners / circles per column")
+    parser.add_argument("--spacing", type=float, default=25.0, help="Square size or circle spacing (mm)")
+    parser.add_argument("--subpix-window", type=int, default=5, help="cornerSubPix half window (px)")
+
+
+def target_from_args(args):
+    return TargetSpec(args.pattern, args.cols, args.rows, args.spacing, args.subpix_window)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect calibration target corners in exported calibration images.")
+    parser.add_argument("dirs", nargs="*", default=[cali_path], help=f"Image directories (default: {cali_path})")
+    add_target_arguments(parser)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached detections")
+    args = parser.parse_args()
+
+    missing = [d for d in args.dirs if not os.path.isdir(d)]
+    if missing:
+        print(f"Directory does not exist: {', '.join(missing)}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    results = detect_directories(args.dirs, target_from_args(args), args.workers, args.refresh)
+    cached = sum(1 for r in results.values() if r["cached"])
+    found = sum(1 for r in results.values() if r["found"])
+    for path, r in sorted(results.items()):
+        if not r["cached"]:
+            print(f"{'found' if r['found'] else 'no target'}: {path}")
+    print(f"{len(results)} images, {len(results) - cached} processed, {cached} cached, "
+          f"target found in {found} ({time.perf_counter() - start:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
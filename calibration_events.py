@@ -0,0 +1,277 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+import cv2 as cv
+from event_arrays import event_columns
+from calibration_detect import add_target_arguments, target_from_args
+
+# Calibration target detection straight from DAVIS events, for targets that blink: an
+# LED board or a screen flashing a circle grid. A blinking pixel fires ON and OFF events
+# at the same phase of every period, noise and moving edges do not. Over a window, each
+# pixel's events are binned by their phase at the blink frequency (one bincount over all
+# events); the length of the mean phase vector (1 = perfectly periodic, ~0 = random) and
+# the event count pick out the target. Blobs are the connected components of that mask,
+# their centres the coherence-weighted pixel centroids, so they are sub-pixel.
+#
+# This replaces rendering EventVisualizer images (savepng se_path) and treating them as
+# intensity images. The blink frequency is found from the spectrum of the global event
+# rate when it is not given.
+
+# Power of two, phases are wrapped with a bit mask
+PHASE_BINS = 16
+MIN_COHERENCE = 0.6
+# Events each polarity must have per blink period, on average, for a pixel to count
+MIN_EVENTS_PER_CYCLE = 0.5
+MIN_FREQUENCY = 20.0
+MAX_FREQUENCY = 2000.0
+WINDOW_US = 500_000
+# The frequency estimate thins longer windows down to about this many events
+FREQUENCY_EVENTS = 2_000_000
+MIN_BLOB_AREA = 2
+MAX_BLOB_AREA = 400
+
+
+def blink_frequency(events, min_frequency=MIN_FREQUENCY, max_frequency=MAX_FREQUENCY):
+    # Strongest frequency within [min_frequency, max_frequency] (Hz) of the ON minus OFF
+    # event rate. The plain rate peaks at both edges of a blink and so at twice the blink
+    # frequency; with the OFF events subtracted the fundamental dominates.
+    t, _, _, p = event_columns(events)
+    if len(t) < 2:
+        return None
+    # Every k-th event keeps the rate's shape, only its scale changes
+    step = max(1, len(t) // FREQUENCY_EVENTS)
+    t, p = t[::step], p[::step]
+    bin_us = max(1, int(1e6 / (4 * max_frequency)))
+    bins = np.multiply(t - t[0], 2.0 / bin_us, dtype=np.float32, casting="unsafe").astype(np.int32)
+    bins &= -2
+    bins += p
+    # Even bins count OFF events, odd bins ON events
+    counts = np.bincount(bins).astype(np.float64)
+    if len(counts) % 2:
+        counts = np.append(counts, 0.0)
+    counts = counts.reshape(-1, 2)
+    rate = counts[:, 1] - counts[:, 0]
+    if len(rate) < 8:
+        return None
+    rate -= rate.mean()
+    rate *= np.hanning(len(rate))
+    # Zero padding: a short window puts the fundamental between two FFT bins, where it
+    # can lose to a harmonic that happens to sit on a bin
+    n_fft = 1 << int(np.ceil(np.log2(len(rate) * 4)))
+    spectrum = np.abs(np.fft.rfft(rate, n_fft))
+    freqs = np.fft.rfftfreq(n_fft, bin_us * 1e-6)
+    band = (freqs >= min_frequency) & (freqs <= max_frequency)
+    if not band.any():
+        return None
+    peak = np.argmax(np.where(band, spectrum, 0))
+    # Parabolic interpolation between the neighbouring bins
+    if 0 < peak < len(spectrum) - 1:
+        a, b, c = spectrum[peak - 1], spectrum[peak], spectrum[peak + 1]
+        denom = a - 2 * b + c
+        if denom != 0:
+            return float(freqs[peak] + 0.5 * (a - c) / denom * (freqs[1] - freqs[0]))
+    return float(freqs[peak])
+
+
+class BlinkDetector:
+    def __init__(self, width, height, frequency=None, min_coherence=MIN_COHERENCE,
+                 min_area=MIN_BLOB_AREA, max_area=MAX_BLOB_AREA):
+        self.width = width
+        self.height = height
+        self.size = width * height
+        # None: estimated per window with blink_frequency()
+        self.frequency = frequency
+        self.min_coherence = min_coherence
+        self.min_area = min_area
+        self.max_area = max_area
+        angles = 2 * np.pi * (np.arange(PHASE_BINS) + 0.5) / PHASE_BINS
+        self._phasors = np.exp(1j * angles)
+        self.coherence = np.zeros((height, width), dtype=np.float32)
+        self.mask = np.zeros((height, width), dtype=np.uint8)
+
+    def coherence_map(self, events, frequency):
+        # Per pixel phase coherence of the ON and OFF events at the given frequency, and
+        # the per pixel event count
+        t, x, y, p = event_columns(events)
+        # int32 / float32 in place: the cost is memory traffic over millions of events.
+        # float32 keeps the phase well inside one bin for windows of up to ~100k periods.
+        index = p.astype(np.int32)
+        index *= self.height
+        index += y
+        index *= self.width
+        index += x
+        index *= PHASE_BINS
+        phase = np.multiply(t - t[0], np.float32(frequency * 1e-6 * PHASE_BINS), dtype=np.float32,
+                            casting="unsafe").astype(np.int32)
+        phase &= PHASE_BINS - 1
+        index += phase
+        hist = np.bincount(index, minlength=2 * self.size * PHASE_BINS).reshape(2, self.size, PHASE_BINS)
+        counts = hist.sum(axis=2)
+        resultant = np.abs(hist @ self._phasors)
+        total = counts.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            coherence = np.where(total > 0, resultant.sum(axis=0) / total, 0.0)
+        return coherence.reshape(self.height, self.width), counts.reshape(2, self.height, self.width)
+
+    def detect(self, events):
+        # Returns (frequency, (N, 2) float32 blob centres, per blob event counts)
+        t, _, _, _ = event_columns(events)
+        if len(t) < 2:
+            return None, np.zeros((0, 2), dtype=np.float32), np.zeros(0)
+        frequency = self.frequency or blink_frequency(events)
+        if frequency is None:
+            return None, np.zeros((0, 2), dtype=np.float32), np.zeros(0)
+        coherence, counts = self.coherence_map(events, frequency)
+        cycles = (int(t[-1]) - int(t[0])) * 1e-6 * frequency
+        # Both polarities have to be there: a blinking source switches on and off
+        active = counts.min(axis=0) >= MIN_EVENTS_PER_CYCLE * cycles
+        self.coherence[:] = coherence
+        np.multiply(active & (coherence >= self.min_coherence), 255, out=self.mask, casting="unsafe")
+
+        n, labels, stats, _ = cv.connectedComponentsWithStats(self.mask, connectivity=8)
+        if n <= 1:
+            return frequency, np.zeros((0, 2), dtype=np.float32), np.zeros(0)
+        weights = (coherence * counts.sum(axis=0)).ravel()
+        flat_labels = labels.ravel()
+        ys, xs = np.divmod(np.arange(self.size), self.width)
+        w = np.bincount(flat_labels, weights=weights, minlength=n)
+        cx = np.bincount(flat_labels, weights=weights * xs, minlength=n)
+        cy = np.bincount(flat_labels, weights=weights * ys, minlength=n)
+        area = stats[:, cv.CC_STAT_AREA]
+        keep = np.arange(n) > 0
+        keep &= (area >= self.min_area) & (area <= self.max_area) & (w > 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            centres = np.column_stack([cx / w, cy / w])[keep].astype(np.float32)
+        return frequency, centres, w[keep]
+
+
+def order_grid(centres, spec, image_size):
+    # Grid order of the blob centres for a circles / acircles TargetSpec, or None. The
+    # centres are drawn as dots for findCirclesGrid, whose grid points are then replaced
+    # by the nearest sub-pixel centre.
+    if len(centres) < spec.cols * spec.rows:
+        return None
+    scale = 4
+    canvas = np.full((image_size[1] * scale, image_size[0] * scale), 255, dtype=np.uint8)
+    for cx, cy in centres:
+        cv.circle(canvas, (int(round(cx * scale)), int(round(cy * scale))), 2 * scale, 0, -1)
+    # The default blob detector rejects small rasterized discs on convexity / inertia
+    params = cv.SimpleBlobDetector_Params()
+    params.filterByConvexity = False
+    params.filterByInertia = False
+    params.minArea = scale * scale
+    flags = cv.CALIB_CB_ASYMMETRIC_GRID if spec.pattern == "acircles" else cv.CALIB_CB_SYMMETRIC_GRID
+    found, grid = cv.findCirclesGrid(canvas, (spec.cols, spec.rows), flags=flags,
+                                     blobDetector=cv.SimpleBlobDetector_create(params))
+    if not found:
+        return None
+    grid = grid.reshape(-1, 2) / scale
+    distances = np.linalg.norm(grid[:, None, :] - centres[None, :, :], axis=2)
+    nearest = distances.argmin(axis=1)
+    if len(np.unique(nearest)) != len(nearest) or distances[np.arange(len(grid)), nearest].max() > 1.0:
+        return None
+    return centres[nearest]
+
+
+def detect_recording(file_path, spec, window_us=WINDOW_US, step_us=None, frequency=None,
+                     min_coherence=MIN_COHERENCE):
+    # Slides a window over an .aedat4 recording or event archive; returns a list of
+    # detections in the calibration_detect.py format, plus the window start and blink frequency
+    from event_store import open_event_store
+    from event_archive import EventArchive, is_archive
+    store = EventArchive(file_path) if is_archive(file_path) else open_event_store(file_path)
+    if store is not None:
+        # Converted recording: windows are column slices of the store or archive
+        width, height = store.resolution
+        event_start, event_end = store.time_range()
+        events_between = store.events_between
+    else:
+        import dv_processing as dv
+        from recording_index import load_index
+        recording = dv.io.MonoCameraRecording(file_path)
+        width, height = recording.getEventResolution()
+        index = load_index(file_path)
+        event_start, event_end = index.event_start, index.event_end
+        events_between = lambda start, end: event_columns(recording.getEventsTimeRange(start, end))
+    detector = BlinkDetector(width, height, frequency, min_coherence)
+    step_us = step_us or window_us
+    detections = []
+    for start in range(event_start, event_end - window_us + 1, step_us):
+        events = events_between(start, start + window_us)
+        if len(events[0]) == 0:
+            continue
+        f, centres, _ = detector.detect(events)
+        corners = order_grid(centres, spec, (width, height)) if f is not None else None
+        detection = {"found": corners is not None, "image_size": [width, height], "start": int(start),
+                     "frequency": f, "blobs": len(centres)}
+        if corners is not None:
+            detection["corners"] = corners.tolist()
+        detections.append(detection)
+    return detections
+
+
+def corners_path_for(file_path):
+    return os.path.splitext(file_path)[0] + "_event_corners.json"
+
+
+def save_detections(file_path, spec, detections):
+    output_path = corners_path_for(file_path)
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"target": spec.key, "detections": detections}, f)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect a blinking circle-grid target in .aedat4 event streams.")
+    parser.add_argument("recordings", nargs="+", help=".aedat4 recordings or .evar event archives")
+    add_target_arguments(parser)
+    parser.set_defaults(pattern="circles")
+    parser.add_argument("--window-ms", type=float, default=WINDOW_US / 1e3, help="Events per detection window")
+    parser.add_argument("--step-ms", type=float, help="Window step (default: the window length)")
+    parser.add_argument("--frequency", type=float, help="Blink frequency in Hz (default: estimated)")
+    parser.add_argument("--min-coherence", type=float, default=MIN_COHERENCE)
+    parser.add_argument("--calibrate", action="store_true", help="Run calibrateCamera on the detections")
+    args = parser.parse_args()
+
+    spec = target_from_args(args)
+    if spec.pattern == "chessboard":
+        print("Event detection needs a circles or acircles target")
+        sys.exit(1)
+    window_us = int(args.window_ms * 1e3)
+    step_us = int(args.step_ms * 1e3) if args.step_ms else None
+
+    views = []
+    image_size = None
+    for path in args.recordings:
+        if not os.path.exists(path):
+            print(f"File does not exist: {path}")
+            continue
+        start = time.perf_counter()
+        detections = detect_recording(path, spec, window_us, step_us, args.frequency, args.min_coherence)
+        found = [d for d in detections if d["found"]]
+        frequencies = [d["frequency"] for d in detections if d["frequency"] is not None]
+        print(f"{path}: {len(detections)} windows, target found in {len(found)}"
+              + (f", blink {np.median(frequencies):.1f} Hz" if frequencies else "")
+              + f" ({time.perf_counter() - start:.2f} s)")
+        save_detections(path, spec, detections)
+        views += [np.asarray(d["corners"], dtype=np.float32).reshape(-1, 1, 2) for d in found]
+        if found:
+            image_size = tuple(found[0]["image_size"])
+
+    if args.calibrate:
+        if len(views) < 3:
+            print(f"Need at least 3 views to calibrate, have {len(views)}")
+            sys.exit(1)
+        rms, K, dist, _, _ = cv.calibrateCamera([spec.object_points()] * len(views), views, image_size, None, None)
+        print(f"Event camera intrinsics from {len(views)} views, rms {rms:.3f} px")
+        print(f"K = {np.round(K, 3).tolist()}")
+        print(f"dist = {np.round(dist.ravel(), 5).tolist()}")
+
+
+if __name__ == "__main__":
+    main()
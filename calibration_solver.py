@@ -0,0 +1,422 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+import cv2 as cv
+from calibration_detect import detect_directories, add_target_arguments, target_from_args
+from signal_bus import parse_capture_id
+
+# DAVIS <-> ZED extrinsic calibration from view pairs: images of the same target taken
+# at the same moment by both sensors. live2.py and display_live_feed.py save every
+# capture as <capture id>.png (signal_bus.new_capture_id, the local capture time), so
+# pairs are matched by capture time: the id in the file name, or the file's mtime for
+# images saved with the older per-process counters. Each image is used in at most one
+# pair, closest times first, and only within PAIR_TOLERANCE_S. The result maps DAVIS
+# camera coordinates to ZED left camera coordinates: p_zed = R @ p_davis + T.
+#
+# The solver is incremental. Intrinsics and every view's target pose are kept between
+# updates: new views get a pose from solvePnP with the current intrinsics, the
+# intrinsics are re-refined from the previous estimate (warm start, few iterations)
+# only every `refine_every` new views, and the extrinsic is a running rotation average
+# over the per-view relative poses, so adding a view never re-solves the others from
+# scratch. solve(full=True) does a final joint stereoCalibrate over all views.
+
+DAVIS_DIR = "D:/Programs/DV/Recording/cali/davis"
+ZED_DIR = "D:/Programs/DV/Recording/cali/zed"
+STATE_VERSION = 1
+
+MIN_VIEWS = 5
+WARM_CRITERIA = (cv.TERM_CRITERIA_COUNT + cv.TERM_CRITERIA_EPS, 10, 1e-6)
+COLD_CRITERIA = (cv.TERM_CRITERIA_COUNT + cv.TERM_CRITERIA_EPS, 30, 1e-9)
+# A new pose is considered unnecessary once the extrinsic is this stable
+TARGET_TRANSLATION_STD_MM = 2.0
+TARGET_ROTATION_STD_DEG = 0.2
+COVERAGE_GRID = 4
+# Largest capture time difference of a DAVIS / ZED image pair
+PAIR_TOLERANCE_S = 0.5
+
+
+def rotation_average(rotations):
+    # Chordal L2 mean: the rotation closest to the sum of the matrices
+    u, _, vt = np.linalg.svd(np.sum(rotations, axis=0))
+    r = u @ vt
+    if np.linalg.det(r) < 0:
+        u[:, -1] *= -1
+        r = u @ vt
+    return r
+
+
+def rotation_angle_deg(r):
+    return float(np.degrees(np.arccos(np.clip((np.trace(r) - 1) / 2, -1.0, 1.0))))
+
+
+class CameraModel:
+    def __init__(self, image_size):
+        self.image_size = tuple(image_size)
+        self.K = None
+        self.dist = np.zeros(5)
+        self.rms = None
+        # Target pose per view name: (rvec, tvec)
+        self.poses = {}
+
+    @property
+    def calibrated(self):
+        return self.K is not None
+
+    def refine(self, names, object_points, image_points, warm):
+        flags = 0
+        criteria = COLD_CRITERIA
+        rvecs = tvecs = None
+        if warm and self.calibrated:
+            flags = cv.CALIB_USE_INTRINSIC_GUESS | cv.CALIB_USE_EXTRINSIC_GUESS
+            criteria = WARM_CRITERIA
+            rvecs = [self.poses[n][0] for n in names]
+            tvecs = [self.poses[n][1] for n in names]
+        K = self.K.copy() if self.K is not None else None
+        rms, K, dist, rvecs, tvecs = cv.calibrateCamera(object_points, image_points, self.image_size, K,
+                                                        self.dist.copy(), rvecs, tvecs, flags, criteria)
+        self.K, self.dist, self.rms = K, dist.ravel(), float(rms)
+        for n, r, t in zip(names, rvecs, tvecs):
+            self.poses[n] = (r.reshape(3, 1), t.reshape(3, 1))
+
+    def locate(self, name, object_points, image_points):
+        # Pose of a new view with the current intrinsics
+        ok, rvec, tvec = cv.solvePnP(object_points, image_points, self.K, self.dist)
+        if ok:
+            self.poses[name] = (rvec, tvec)
+        else:
+            self.poses.pop(name, None)
+        return ok
+
+    def locate_all(self, names, object_points, image_points):
+        # Poses of all views with the intrinsics held fixed; rms becomes their reprojection error
+        errors = []
+        for n, pts in zip(names, image_points):
+            if self.locate(n, object_points, pts):
+                errors.append(self.reprojection_error(object_points, pts, *self.poses[n]))
+        self.rms = float(np.sqrt(np.mean(np.square(errors)))) if errors else None
+
+    def reprojection_error(self, object_points, image_points, rvec, tvec):
+        projected, _ = cv.projectPoints(object_points, rvec, tvec, self.K, self.dist)
+        return float(np.sqrt(np.mean(np.sum((projected - image_points) ** 2, axis=2))))
+
+    def coverage(self, image_points_list):
+        # Fraction of a COVERAGE_GRID x COVERAGE_GRID grid over the image touched by corners
+        hit = np.zeros((COVERAGE_GRID, COVERAGE_GRID), dtype=bool)
+        w, h = self.image_size
+        for pts in image_points_list:
+            p = pts.reshape(-1, 2)
+            gx = np.clip((p[:, 0] * COVERAGE_GRID / w).astype(int), 0, COVERAGE_GRID - 1)
+            gy = np.clip((p[:, 1] * COVERAGE_GRID / h).astype(int), 0, COVERAGE_GRID - 1)
+            hit[gy, gx] = True
+        return float(hit.mean())
+
+    def to_dict(self):
+        return {"image_size": list(self.image_size), "K": None if self.K is None else self.K.tolist(),
+                "dist": self.dist.tolist(), "rms": self.rms,
+                "poses": {n: [r.ravel().tolist(), t.ravel().tolist()] for n, (r, t) in self.poses.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        model = cls(data["image_size"])
+        model.K = None if data["K"] is None else np.array(data["K"])
+        model.dist = np.array(data["dist"])
+        model.rms = data["rms"]
+        model.poses = {n: (np.array(r).reshape(3, 1), np.array(t).reshape(3, 1)) for n, (r, t) in data["poses"].items()}
+        return model
+
+
+class IncrementalStereoCalibration:
+    def __init__(self, object_points, davis_size, zed_size, refine_every=5):
+        self.object_points = np.asarray(object_points, dtype=np.float32)
+        self.davis = CameraModel(davis_size)
+        self.zed = CameraModel(zed_size)
+        self.refine_every = refine_every
+        # view name -> (davis image points, zed image points)
+        self.views = {}
+        self.since_refine = 0
+        self.R = None
+        self.T = None
+        self.stereo_rms = None
+
+    def _relative(self, name):
+        rd, td = self.davis.poses[name]
+        rz, tz = self.zed.poses[name]
+        Rd, _ = cv.Rodrigues(rd)
+        Rz, _ = cv.Rodrigues(rz)
+        R = Rz @ Rd.T
+        return R, tz - R @ td
+
+    def _update_extrinsic(self):
+        names = [n for n in self.views if n in self.davis.poses and n in self.zed.poses]
+        if not names:
+            return
+        relative = [self._relative(n) for n in names]
+        self.R = rotation_average([r for r, _ in relative])
+        self.T = np.mean([t for _, t in relative], axis=0)
+        # The averaged extrinsic is no longer the one stereoCalibrate reported an error for
+        self.stereo_rms = None
+
+    def _locate(self, name):
+        # Pose of a view in both cameras with the current intrinsics, or in neither
+        davis_points, zed_points = self.views[name]
+        located = (self.davis.locate(name, self.object_points, davis_points)
+                   and self.zed.locate(name, self.object_points, zed_points))
+        if not located:
+            self.davis.poses.pop(name, None)
+            self.zed.poses.pop(name, None)
+        return located
+
+    def _refine_intrinsics(self, warm):
+        names = sorted(self.views)
+        if warm:
+            # A warm start needs every view's pose; views solvePnP could not place are left
+            # out and located again with the refined intrinsics
+            posed = [n for n in names if n in self.davis.poses and n in self.zed.poses]
+            if len(posed) < MIN_VIEWS:
+                warm = False
+            else:
+                names = posed
+        obj = [self.object_points] * len(names)
+        self.davis.refine(names, obj, [self.views[n][0] for n in names], warm)
+        self.zed.refine(names, obj, [self.views[n][1] for n in names], warm)
+        for n in sorted(set(self.views) - set(names)):
+            self._locate(n)
+        self.since_refine = 0
+
+    def add_views(self, new_views):
+        # new_views: {name: (davis image points, zed image points)}; returns the names added
+        added = [n for n in sorted(new_views) if n not in self.views]
+        for n in added:
+            davis_points, zed_points = new_views[n]
+            self.views[n] = (np.asarray(davis_points, dtype=np.float32).reshape(-1, 1, 2),
+                             np.asarray(zed_points, dtype=np.float32).reshape(-1, 1, 2))
+        if not added or len(self.views) < MIN_VIEWS:
+            return added
+
+        if not self.davis.calibrated or not self.zed.calibrated:
+            self._refine_intrinsics(warm=False)
+        else:
+            for n in added:
+                # Without a pose in both cameras the view waits for the next refine
+                self._locate(n)
+            self.since_refine += len(added)
+            if self.since_refine >= self.refine_every:
+                self._refine_intrinsics(warm=True)
+        self._update_extrinsic()
+        return added
+
+    def solve(self, full=False):
+        # full=True: joint refinement of both intrinsics and the extrinsic over all views
+        if len(self.views) < MIN_VIEWS:
+            return None
+        if not self.davis.calibrated:
+            self._refine_intrinsics(warm=False)
+            self._update_extrinsic()
+        if full:
+            # Starts from the current intrinsics; R/T are initialised by stereoCalibrate itself
+            # (CALIB_USE_EXTRINSIC_GUESS is not accepted by every OpenCV version)
+            names = sorted(self.views)
+            rms, Kd, dd, Kz, dz, R, T, _, _ = cv.stereoCalibrate(
+                [self.object_points] * len(names), [self.views[n][0] for n in names],
+                [self.views[n][1] for n in names], self.davis.K, self.davis.dist, self.zed.K, self.zed.dist,
+                self.davis.image_size, flags=cv.CALIB_USE_INTRINSIC_GUESS, criteria=COLD_CRITERIA)
+            self.davis.K, self.davis.dist = Kd, dd.ravel()
+            self.zed.K, self.zed.dist = Kz, dz.ravel()
+            self.R, self.T, self.stereo_rms = R, T, float(rms)
+            # Intrinsics and R/T come from the same joint solve; only the per-view poses
+            # are recomputed for the new intrinsics, which would otherwise be re-refined
+            # without the extrinsic and no longer match it
+            self.davis.locate_all(names, self.object_points, [self.views[n][0] for n in names])
+            self.zed.locate_all(names, self.object_points, [self.views[n][1] for n in names])
+        return self.status()
+
+    def view_errors(self):
+        # Per view RMS reprojection error (px): each camera with its own pose, and the ZED
+        # with the DAVIS pose carried over through the extrinsic
+        errors = {}
+        for n, (davis_points, zed_points) in sorted(self.views.items()):
+            if n not in self.davis.poses or n not in self.zed.poses:
+                continue
+            rd, td = self.davis.poses[n]
+            rz, tz = self.zed.poses[n]
+            e = {"davis": self.davis.reprojection_error(self.object_points, davis_points, rd, td),
+                 "zed": self.zed.reprojection_error(self.object_points, zed_points, rz, tz)}
+            if self.R is not None:
+                Rd, _ = cv.Rodrigues(rd)
+                r_via, _ = cv.Rodrigues(self.R @ Rd)
+                e["zed_via_extrinsic"] = self.zed.reprojection_error(self.object_points, zed_points, r_via,
+                                                                     self.R @ td + self.T)
+            errors[n] = e
+        return errors
+
+    def status(self):
+        names = [n for n in self.views if n in self.davis.poses and n in self.zed.poses]
+        status = {"views": len(self.views), "posed_views": len(names), "needs_more": True, "reason": None}
+        if len(self.views) < MIN_VIEWS or self.R is None:
+            status["reason"] = f"need at least {MIN_VIEWS} view pairs"
+            return status
+        relative = [self._relative(n) for n in names]
+        rotation_spread = [rotation_angle_deg(r @ self.R.T) for r, _ in relative]
+        translations = np.array([t.ravel() for _, t in relative])
+        # Standard error of the mean over the views
+        t_std = float(np.linalg.norm(translations.std(axis=0)) / np.sqrt(len(names)))
+        r_std = float(np.sqrt(np.mean(np.square(rotation_spread))) / np.sqrt(len(names)))
+        coverage = {"davis": self.davis.coverage([self.views[n][0] for n in names]),
+                    "zed": self.zed.coverage([self.views[n][1] for n in names])}
+        status.update({"R": self.R.tolist(), "T": self.T.ravel().tolist(),
+                       "davis": {"K": self.davis.K.tolist(), "dist": self.davis.dist.tolist(), "rms": self.davis.rms,
+                                 "image_size": list(self.davis.image_size)},
+                       "zed": {"K": self.zed.K.tolist(), "dist": self.zed.dist.tolist(), "rms": self.zed.rms,
+                               "image_size": list(self.zed.image_size)},
+                       "stereo_rms": self.stereo_rms, "translation_std": t_std, "rotation_std_deg": r_std,
+                       "coverage": coverage, "view_errors": self.view_errors()})
+        # The ZED sees a wider field than the DAVIS, so only the DAVIS image can be covered
+        # with the target visible to both
+        if coverage["davis"] < 0.75:
+            status["reason"] = "move the target towards the image edges"
+        elif t_std > TARGET_TRANSLATION_STD_MM or r_std > TARGET_ROTATION_STD_DEG:
+            status["reason"] = f"extrinsic not stable yet ({t_std:.2f} mm, {r_std:.3f} deg)"
+        else:
+            status["needs_more"] = False
+        return status
+
+    def to_dict(self):
+        return {"version": STATE_VERSION, "object_points": self.object_points.tolist(),
+                "refine_every": self.refine_every, "since_refine": self.since_refine,
+                "views": {n: [d.reshape(-1, 2).tolist(), z.reshape(-1, 2).tolist()] for n, (d, z) in self.views.items()},
+                "davis": self.davis.to_dict(), "zed": self.zed.to_dict(),
+                "R": None if self.R is None else self.R.tolist(), "T": None if self.T is None else self.T.tolist(),
+                "stereo_rms": self.stereo_rms}
+
+    @classmethod
+    def from_dict(cls, data):
+        solver = cls(data["object_points"], data["davis"]["image_size"], data["zed"]["image_size"],
+                     data["refine_every"])
+        solver.davis = CameraModel.from_dict(data["davis"])
+        solver.zed = CameraModel.from_dict(data["zed"])
+        solver.views = {n: (np.array(d, dtype=np.float32).reshape(-1, 1, 2), np.array(z, dtype=np.float32).reshape(-1, 1, 2))
+                        for n, (d, z) in data["views"].items()}
+        solver.since_refine = data["since_refine"]
+        solver.R = None if data["R"] is None else np.array(data["R"])
+        solver.T = None if data["T"] is None else np.array(data["T"])
+        solver.stereo_rms = data["stereo_rms"]
+        return solver
+
+
+def save_state(solver, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(solver.to_dict(), f)
+    os.replace(tmp_path, path)
+
+
+def load_state(path, object_points):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        data = json.load(f)
+    if data.get("version") != STATE_VERSION or not np.allclose(data["object_points"], object_points):
+        print(f"Calibration state {path} is for a different target, starting over")
+        return None
+    return IncrementalStereoCalibration.from_dict(data)
+
+
+def capture_time(path):
+    # Capture time (s) from the capture id in the file name, else the file's mtime
+    t = parse_capture_id(os.path.splitext(os.path.basename(path))[0])
+    return os.path.getmtime(path) if t is None else t
+
+
+def pair_by_capture_time(davis_paths, zed_paths, tolerance_s=PAIR_TOLERANCE_S):
+    # [(davis path, zed path)], closest capture times first, each image used once
+    davis_times = {p: capture_time(p) for p in davis_paths}
+    zed_times = {p: capture_time(p) for p in zed_paths}
+    candidates = sorted((abs(td - tz), d, z) for d, td in davis_times.items() for z, tz in zed_times.items()
+                        if abs(td - tz) <= tolerance_s)
+    pairs = []
+    used = set()
+    for _, d, z in candidates:
+        if d not in used and z not in used:
+            used.update((d, z))
+            pairs.append((d, z))
+    return sorted(pairs)
+
+
+def paired_views(davis_results, zed_results):
+    # {name: (davis corners, zed corners)} for image pairs with the target found in both,
+    # named after the DAVIS image, the image size of each sensor and the number of images
+    # left without a pair
+    davis = {p: r for p, r in davis_results.items() if r["found"]}
+    zed = {p: r for p, r in zed_results.items() if r["found"]}
+    pairs = pair_by_capture_time(davis, zed)
+    views = {os.path.splitext(os.path.basename(d))[0]: (davis[d]["corners"], zed[z]["corners"]) for d, z in pairs}
+    sizes = (davis[pairs[0][0]]["image_size"], zed[pairs[0][1]]["image_size"]) if pairs else (None, None)
+    return views, sizes, len(davis_results) + len(zed_results) - 2 * len(pairs)
+
+
+def print_status(status):
+    print(f"{status['views']} view pairs ({status['posed_views']} posed)")
+    if "T" in status:
+        print(f"DAVIS rms {status['davis']['rms']:.3f} px, ZED rms {status['zed']['rms']:.3f} px"
+              + (f", stereo rms {status['stereo_rms']:.3f} px" if status["stereo_rms"] is not None else ""))
+        print(f"T (DAVIS -> ZED): {np.round(status['T'], 2).tolist()}, translation std {status['translation_std']:.2f}, "
+              f"rotation std {status['rotation_std_deg']:.3f} deg")
+        worst = sorted(status["view_errors"].items(), key=lambda kv: -kv[1].get("zed_via_extrinsic", 0))[:3]
+        for name, e in worst:
+            print(f"  {name}: DAVIS {e['davis']:.3f} px, ZED {e['zed']:.3f} px, "
+                  f"ZED via extrinsic {e.get('zed_via_extrinsic', float('nan')):.3f} px")
+    print("Another pose is needed: " + status["reason"] if status["needs_more"] else "Calibration is stable")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental DAVIS <-> ZED extrinsic and intrinsic calibration.")
+    parser.add_argument("--davis-dir", default=DAVIS_DIR)
+    parser.add_argument("--zed-dir", default=ZED_DIR)
+    add_target_arguments(parser)
+    parser.add_argument("--state", help="Solver state file (default: <davis dir>/stereo_state.json)")
+    parser.add_argument("--output", help="Result file (default: <davis dir>/stereo_calibration.json)")
+    parser.add_argument("--refine-every", type=int, default=5, help="Re-refine intrinsics every N new views")
+    parser.add_argument("--full", action="store_true", help="Finish with a joint stereoCalibrate over all views")
+    parser.add_argument("--watch", type=float, metavar="SECONDS", help="Keep polling the directories for new pairs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    for d in (args.davis_dir, args.zed_dir):
+        if not os.path.isdir(d):
+            print(f"Directory does not exist: {d}")
+            sys.exit(1)
+    state_path = args.state or os.path.join(args.davis_dir, "stereo_state.json")
+    output_path = args.output or os.path.join(args.davis_dir, "stereo_calibration.json")
+    spec = target_from_args(args)
+    solver = load_state(state_path, spec.object_points())
+
+    while True:
+        start = time.perf_counter()
+        views, (davis_size, zed_size), unpaired = paired_views(detect_directories([args.davis_dir], spec, args.workers),
+                                                     detect_directories([args.zed_dir], spec, args.workers))
+        if views:
+            if solver is None:
+                solver = IncrementalStereoCalibration(spec.object_points(), davis_size, zed_size, args.refine_every)
+            added = solver.add_views(views)
+            if added or args.watch is None:
+                status = solver.solve(full=args.full and args.watch is None) or solver.status()
+                print(f"--- {len(added)} new view pairs, updated in {time.perf_counter() - start:.2f} s")
+                if unpaired:
+                    print(f"{unpaired} images without the target or without a capture within {PAIR_TOLERANCE_S} s "
+                          f"in the other directory")
+                print_status(status)
+                save_state(solver, state_path)
+                with open(output_path, "w") as f:
+                    json.dump(status, f, indent=2)
+        elif args.watch is None:
+            print("No view pairs with the target found in both directories")
+        if args.watch is None:
+            break
+        time.sleep(args.watch)
+
+
+if __name__ == "__main__":
+    main()
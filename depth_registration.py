@@ -0,0 +1,228 @@
+import json
+import numpy as np
+import cv2 as cv
+from event_arrays import event_array
+from depth_render import colormap_lut, apply_lut, DEFAULT_MAX_DEPTH_MM
+from undistort_maps import CALIBRATION_FILE, load_calibration
+
+# ZED depth (MEASURE.DEPTH, millimetres, left camera) reprojected into the DAVIS image
+# plane with the extrinsic from calibration_solver.py (p_zed = R @ p_davis + T).
+#
+# The back-projection rays of the ZED pixels are computed once per calibration and depth
+# resolution, already rotated into the DAVIS frame, so a frame costs three multiply-adds
+# per point, the DAVIS projection with its distortion and a z-buffered splat
+# (np.minimum.at, the nearest surface wins). The ZED samples the scene ~3x finer than the
+# DAVIS, so by default only every `stride`-th ZED pixel is used, as many as keep the
+# DAVIS image covered. Rays that cannot land in the DAVIS image at any depth beyond
+# MIN_DEPTH_MM are dropped from the grid as well, which matters when the ZED sees a
+# wider field than the DAVIS lens. Registered depth is in mm along the DAVIS optical
+# axis, 0 = none.
+
+# ZED depth sensing starts at about 0.3 m
+MIN_DEPTH_MM = 300.0
+
+# Ray grids shared by the registrations of this process
+_ray_grids = {}
+
+
+def ray_grid(calibration, depth_size, stride):
+    # (3, N) unit-depth rays of the sampled ZED pixels, in ZED camera coordinates
+    key = (calibration.version, tuple(depth_size), stride)
+    rays = _ray_grids.get(key)
+    if rays is None:
+        K, _ = calibration.scaled(depth_size)
+        w, h = depth_size
+        ys, xs = np.mgrid[0:h:stride, 0:w:stride]
+        pts = np.column_stack([xs.ravel(), ys.ravel()]).astype(np.float32).reshape(-1, 1, 2)
+        normalized = cv.undistortPoints(pts, K, calibration.dist).reshape(-1, 2)
+        rays = np.vstack([normalized.T, np.ones(len(normalized))]).astype(np.float32)
+        _ray_grids[key] = rays
+    return rays
+
+
+def auto_stride(zed, davis, depth_size):
+    # Largest stride at which the sampled ZED pixels are still at least as fine as the DAVIS ones
+    K_zed, _ = zed.scaled(depth_size)
+    return max(1, int(min(K_zed[0, 0], K_zed[1, 1]) / max(davis.K[0, 0], davis.K[1, 1])))
+
+
+class DepthRegistration:
+    def __init__(self, zed, davis, R, T, depth_size, stride=None):
+        # zed / davis: undistort_maps.CameraCalibration; R, T map DAVIS to ZED coordinates
+        self.zed = zed
+        self.davis = davis
+        self.depth_size = tuple(depth_size)
+        self.stride = stride or auto_stride(zed, davis, depth_size)
+        R = np.asarray(R, dtype=np.float64)
+        T = np.asarray(T, dtype=np.float64).reshape(3)
+        self.width, self.height = davis.image_size
+        K, d = davis.K, np.zeros(5)
+        d[:min(5, len(davis.dist))] = davis.dist[:5]
+        # Python floats: NumPy scalars would promote the float32 point arrays to float64
+        self.fx, self.fy, self.cx, self.cy = float(K[0, 0]), float(K[1, 1]), float(K[0, 2]), float(K[1, 2])
+        self.k1, self.k2, self.p1, self.p2, self.k3 = (float(v) for v in d)
+
+        # The DAVIS field of view in undistorted normalized coordinates, a little enlarged.
+        # Outside it the distortion polynomial folds far away points back into the image,
+        # so points beyond the border radius are rejected in register() as well.
+        border = np.concatenate([np.column_stack([np.arange(self.width), np.full(self.width, y)]) for y in (0, self.height - 1)]
+                                + [np.column_stack([np.full(self.height, x), np.arange(self.height)]) for x in (0, self.width - 1)])
+        border = cv.undistortPoints(border.astype(np.float32).reshape(-1, 1, 2), K, d).reshape(-1, 2)
+        self.r2_max = float(np.max(np.sum(border ** 2, axis=1))) * 1.1 ** 2
+        (x0, y0), (x1, y1) = border.min(axis=0) * 1.1, border.max(axis=0) * 1.1
+
+        # p_davis = R^T (z * ray - T): rays rotated once, the offset added per frame
+        w, h = self.depth_size
+        ys, xs = np.mgrid[0:h:self.stride, 0:w:self.stride]
+        rays = R.T @ ray_grid(zed, depth_size, self.stride)
+        offset = -R.T @ T
+        # A ray's point moves along a segment between its position at MIN_DEPTH_MM and at
+        # infinity; rays whose segment misses the DAVIS field of view are dropped
+        with np.errstate(invalid="ignore", divide="ignore"):
+            near = rays * MIN_DEPTH_MM + offset[:, None]
+            near = near[:2] / near[2]
+            far = rays[:2] / rays[2]
+        lo = np.minimum(near, far)
+        hi = np.maximum(near, far)
+        visible = (hi[0] > x0) & (lo[0] < x1) & (hi[1] > y0) & (lo[1] < y1) & (rays[2] > 0)
+        self.depth_index = (ys.ravel() * w + xs.ravel())[visible].astype(np.intp)
+        # One contiguous array per coordinate, boolean selection on a (3, N) array is slow
+        self.rays = [np.ascontiguousarray(r[visible], dtype=np.float32) for r in rays]
+        self.offset = [float(v) for v in offset]
+        self.registered = np.zeros((self.height, self.width), dtype=np.float32)
+        self._zbuffer = np.empty(self.width * self.height, dtype=np.float32)
+
+    def register(self, depth):
+        # depth: (H, W) float32 mm at depth_size; returns the registered DAVIS depth view
+        if depth.shape[1] != self.depth_size[0] or depth.shape[0] != self.depth_size[1]:
+            raise ValueError(f"Depth is {depth.shape[1]}x{depth.shape[0]}, registration was built for "
+                             f"{self.depth_size[0]}x{self.depth_size[1]}")
+        # Invalid ZED depth (NaN / inf) stays NaN through the math and fails every
+        # comparison below, so the points are filtered once, at the end
+        z = depth.reshape(-1)[self.depth_index]
+        with np.errstate(invalid="ignore"):
+            X = self.rays[0] * z + self.offset[0]
+            Y = self.rays[1] * z + self.offset[1]
+            Z = self.rays[2] * z + self.offset[2]
+        u, v, r2 = self._project(X, Y, Z)
+        keep = (z > 0) & (Z > 0) & (r2 < self.r2_max) & (u > -0.5) & (u < self.width - 0.5) & (v > -0.5) & (v < self.height - 0.5)
+        index = np.rint(v[keep]).astype(np.int32) * self.width + np.rint(u[keep]).astype(np.int32)
+
+        self._zbuffer.fill(np.inf)
+        np.minimum.at(self._zbuffer, index, Z[keep])
+        np.copyto(self.registered.reshape(-1), self._zbuffer)
+        self.registered[np.isinf(self.registered)] = 0
+        return self.registered
+
+    def _project(self, X, Y, Z):
+        # DAVIS pixel coordinates of camera-frame points with the (k1, k2, p1, p2, k3)
+        # model of cv.projectPoints, and the undistorted squared radius. In place where
+        # possible, every temporary is a pass over all points.
+        with np.errstate(invalid="ignore", divide="ignore"):
+            x = X / Z
+            y = Y / Z
+        x2 = x * x
+        y2 = y * y
+        r2 = x2 + y2
+        radial = r2 * self.k3
+        radial += self.k2
+        radial *= r2
+        radial += self.k1
+        radial *= r2
+        radial += 1
+        xy = x * y
+        u = x * radial
+        v = y * radial
+        if self.p1 or self.p2:
+            u += (2 * self.p1) * xy
+            u += self.p2 * (r2 + 2 * x2)
+            v += self.p1 * (r2 + 2 * y2)
+            v += (2 * self.p2) * xy
+        u *= self.fx
+        u += self.cx
+        v *= self.fy
+        v += self.cy
+        return u, v, r2
+
+    def depth_at_events(self, events, registered=None):
+        # Registered depth (mm, 0 = none) under every event
+        arr = event_array(events)
+        registered = self.registered if registered is None else registered
+        return registered.reshape(-1)[arr["y"].astype(np.intp) * self.width + arr["x"]]
+
+
+def load_registration(depth_size, stride=None, path=CALIBRATION_FILE):
+    # DepthRegistration from the stereo calibration, or None when there is none yet
+    zed = load_calibration("zed", path)
+    davis = load_calibration("davis", path)
+    if zed is None or davis is None:
+        return None
+    with open(path, "r") as f:
+        data = json.load(f)
+    if data.get("R") is None:
+        return None
+    return DepthRegistration(zed, davis, data["R"], data["T"], depth_size, stride)
+
+
+def depth_overlay(image, registered, max_depth=DEFAULT_MAX_DEPTH_MM, alpha=0.6, colormap=cv.COLORMAP_TURBO):
+    # Registered depth blended over a BGR preview where there is depth
+    gray = cv.convertScaleAbs(registered, alpha=255.0 / max_depth)
+    colored = apply_lut(gray, colormap_lut(colormap), np.empty(image.shape[:2] + (3,), dtype=np.uint8))
+    blended = cv.addWeighted(image, 1 - alpha, colored, alpha, 0)
+    mask = registered > 0
+    out = image.copy()
+    out[mask] = blended[mask]
+    return out
+
+
+class SvoDepthReader:
+    # Depth of an .svo2 recording in DAVIS time: depth_at(t) returns the latest depth
+    # frame at or before t (DAVIS clock via the sync model), grabbing forward as needed
+    def __init__(self, svo_path, sync=None):
+        import pyzed.sl as sl
+        self.sl = sl
+        input_type = sl.InputType()
+        input_type.set_from_svo_file(str(svo_path))
+        init = sl.InitParameters(input_t=input_type)
+        init.depth_mode = sl.DEPTH_MODE.PERFORMANCE
+        init.coordinate_units = sl.UNIT.MILLIMETER
+        init.svo_real_time_mode = False
+        self.zed = sl.Camera()
+        err = self.zed.open(init)
+        if err != sl.ERROR_CODE.SUCCESS:
+            raise IOError(f"Error opening {svo_path}: {err}")
+        resolution = self.zed.get_camera_information().camera_configuration.resolution
+        self.size = (resolution.width, resolution.height)
+        self.sync = sync
+        self.runtime = sl.RuntimeParameters()
+        self.mat = sl.Mat()
+        self.depth = None
+        self.timestamp = None
+        self._next = None
+
+    def _grab(self):
+        sl = self.sl
+        if self.zed.grab(self.runtime) != sl.ERROR_CODE.SUCCESS:
+            return None
+        t = self.zed.get_timestamp(sl.TIME_REFERENCE.IMAGE).get_microseconds()
+        return self.sync.zed_to_dvs(t) if self.sync is not None else t
+
+    def depth_at(self, t_dvs):
+        if self.timestamp is not None and t_dvs < self.timestamp:
+            # Playback went back: start over from the first frame
+            self.zed.set_svo_position(0)
+            self.depth = self.timestamp = self._next = None
+        while True:
+            if self._next is None:
+                self._next = self._grab()
+                if self._next is None:
+                    return self.depth
+            if self._next > t_dvs:
+                return self.depth
+            self.zed.retrieve_measure(self.mat, self.sl.MEASURE.DEPTH)
+            self.depth = self.mat.get_data()
+            self.timestamp = self._next
+            self._next = None
+
+    def close(self):
+        self.zed.close()
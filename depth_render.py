@@ -0,0 +1,65 @@
+import functools
+import numpy as np
+import cv2
+
+# Depth map -> display image. The depth map is shrunk to the display size first (nearest
+# neighbour, so invalid pixels are never blended with valid ones) and every later step
+# works in place on buffers of that size, allocated once per renderer. Invalid depth
+# (NaN, +-inf, <= 0) renders as 0, like the old full-size path in playback_svo.py.
+#
+# With fixed_range the gray level is depth * 255 / max_depth, which skips the min/max
+# reduction and keeps the scale stable from frame to frame; otherwise the visible range
+# is stretched to 0..255 every frame (cv2.NORM_MINMAX, the old behaviour).
+
+DEFAULT_MAX_DEPTH_MM = 5000
+
+
+@functools.lru_cache(maxsize=None)
+def colormap_lut(colormap):
+    # (256, 3) BGR table for an OpenCV colormap, built once per colormap and shared
+    ramp = np.arange(256, dtype=np.uint8).reshape(256, 1)
+    lut = cv2.applyColorMap(ramp, colormap).reshape(256, 3)
+    lut.flags.writeable = False
+    return lut
+
+
+def apply_lut(gray, lut, out):
+    np.take(lut, gray, axis=0, out=out)
+    return out
+
+
+class DepthRenderer:
+    def __init__(self, width, height, max_depth=DEFAULT_MAX_DEPTH_MM, fixed_range=False, colormap=None):
+        self.width = width
+        self.height = height
+        self.max_depth = float(max_depth)
+        self.fixed_range = fixed_range
+        self.lut = None
+        if colormap is not None:
+            # Index 0 is invalid depth, keep it black
+            self.lut = colormap_lut(colormap).copy()
+            self.lut[0] = 0
+        self._small = np.empty((height, width), dtype=np.float32)
+        self._gray = np.empty((height, width), dtype=np.uint8)
+        self._color = np.empty((height, width, 3), dtype=np.uint8)
+
+    def render(self, depth):
+        # Returns a view of an internal buffer, overwritten by the next call
+        small = self._small
+        cv2.resize(depth, (self.width, self.height), dst=small, interpolation=cv2.INTER_NEAREST)
+        np.nan_to_num(small, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+        np.clip(small, 0, self.max_depth, out=small)
+
+        gray = self._gray
+        if self.fixed_range:
+            cv2.convertScaleAbs(small, dst=gray, alpha=255.0 / self.max_depth)
+        else:
+            _, hi, _, _ = cv2.minMaxLoc(small)
+            if hi <= 0:
+                gray.fill(0)
+            else:
+                cv2.normalize(small, gray, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+
+        if self.lut is None:
+            return gray
+        return apply_lut(gray, self.lut, self._color)
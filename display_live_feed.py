@@ -4,37 +4,51 @@ import pyzed.sl as sl
 import cv2
 import os
 import time
+import argparse
+from signal_bus import open_signal_bus, new_capture_id
+from depth_render import colormap_lut, apply_lut
+from instrumentation import open_instruments
 
 TEMP_FOLDER = "../../Recording/temp"
-SR_SIGNAL_FILE = os.path.join(TEMP_FOLDER, "src.txt")  # Start Record Signal
-SS_SIGNAL_FILE = os.path.join(TEMP_FOLDER, "ssc.txt")  # Stop Record Signal
+# Full resolution left images for calibration_solver.py, named by capture id like the DAVIS / DVSense ones
+CALI_PATH = "../../Recording/cali/zed"
+# Size the preview windows are retrieved and rendered at; recording stays at full resolution
+PREVIEW_WIDTH = 640
+PREVIEW_HEIGHT = 360
+# ZED confidence is 0..100 (100 = least confident), mapped with a fixed scale
+CONFIDENCE_MAX = 100.0
+# Start/stop record signals sent by the DVSense viewer (stage1), calibration capture events
+bus = open_signal_bus("display_live_feed", TEMP_FOLDER)
 
 def check_sr_signal():
-    return os.path.exists(SR_SIGNAL_FILE)
+    return bus.check("src")
 
 def check_ss_signal():
-    return os.path.exists(SS_SIGNAL_FILE)
+    return bus.check("ssc")
+
+def take_captures():
+    # Calibration capture ids announced by stage1 or live2 since the last call
+    return bus.take_events("capture")
+
+def start_capture():
+    capture_id = new_capture_id()
+    bus.emit("capture", capture_id)
+    return capture_id
 
 def clear_signal_files():
-    if os.path.exists(SR_SIGNAL_FILE):
-        try:
-            os.remove(SR_SIGNAL_FILE)
-            print(f"Removed: {SR_SIGNAL_FILE}")
-        except OSError as e:
-            print(f"Error removing {SR_SIGNAL_FILE}: {e}")
-    if os.path.exists(SS_SIGNAL_FILE):
-        try:
-            os.remove(SS_SIGNAL_FILE)
-            print(f"Removed: {SS_SIGNAL_FILE}")
-        except OSError as e:
-            print(f"Error removing {SS_SIGNAL_FILE}: {e}")
+    for name in ("src", "ssc"):
+        if bus.check(name):
+            bus.clear(name)
+            print(f"Cleared signal: {name}")
 
 def run():
     # ✅ Read the base file name from command line
-    if len(sys.argv) < 2:
-        print("Usage: python live2.py <base_file_name>")
-        return
-    base_filename = sys.argv[1].split('.')[0]  # Remove .raw if included
+    parser = argparse.ArgumentParser(description="ZED live view and SVO recording controlled by the DVSense window.")
+    parser.add_argument("base_file_name", help="Recording name (.raw suffix is removed)")
+    parser.add_argument("--preview-width", type=int, default=PREVIEW_WIDTH)
+    parser.add_argument("--preview-height", type=int, default=PREVIEW_HEIGHT)
+    args = parser.parse_args()
+    base_filename = args.base_file_name.split('.')[0]  # Remove .raw if included
 
     zed = sl.Camera()
 
@@ -65,20 +79,37 @@ def run():
 
     recording_active = False
     runtime_params = sl.RuntimeParameters()
-    image = sl.Mat()
-    depth = sl.Mat()
-    confidence = sl.Mat()
+    # Everything shown is retrieved at preview size into the same buffers every grab
+    preview_resolution = sl.Resolution(args.preview_width, args.preview_height)
+    image = sl.Mat(preview_resolution.width, preview_resolution.height, sl.MAT_TYPE.U8_C4)
+    depth = sl.Mat(preview_resolution.width, preview_resolution.height, sl.MAT_TYPE.U8_C4)
+    confidence = sl.Mat(preview_resolution.width, preview_resolution.height, sl.MAT_TYPE.F32_C1)
+    preview_shape = (args.preview_height, args.preview_width)
+    depth_map = np.empty(preview_shape + (4,), dtype=np.uint8)
+    conf_gray = np.empty(preview_shape, dtype=np.uint8)
+    conf_map = np.empty(preview_shape + (3,), dtype=np.uint8)
+    blank_depth = np.zeros(preview_shape, dtype=np.uint8)
+    blank_conf = np.zeros(preview_shape + (3,), dtype=np.uint8)
+    jet_lut = colormap_lut(cv2.COLORMAP_JET)
+    cali_image = sl.Mat()
+    # Per-stage timings, off unless MSC_INSTRUMENT is set
+    instruments = open_instruments("display_live_feed")
+    instruments.watch("zed_fps", zed.get_current_fps)
+    instruments.watch("zed_dropped", zed.get_frame_dropped_count)
 
     print("Press 'q' to quit. Recording controlled via DVSense window.")
 
     key = ' '
     while key != 113:  # ASCII for 'q'
-        should_start_recording = check_sr_signal()
-        should_stop_recording = check_ss_signal()
+        instruments.tick()
+        with instruments.stage("signals"):
+            should_start_recording = check_sr_signal()
+            should_stop_recording = check_ss_signal()
 
         if should_start_recording and not recording_active:
             recording_params = sl.RecordingParameters(output_path, sl.SVO_COMPRESSION_MODE.H264)
-            err = zed.enable_recording(recording_params)
+            with instruments.stage("write"):
+                err = zed.enable_recording(recording_params)
             if err == sl.ERROR_CODE.SUCCESS:
                 recording_active = True
                 print(f"ZED SVO recording started: {output_path}")
@@ -87,16 +118,35 @@ def run():
             clear_signal_files()
 
         elif should_stop_recording and recording_active:
-            zed.disable_recording()
+            with instruments.stage("write"):
+                zed.disable_recording()
             recording_active = False
             print("ZED SVO recording stopped.")
             print(f"SVO file saved to {output_path}")
             clear_signal_files()
 
-        if zed.grab(runtime_params) == sl.ERROR_CODE.SUCCESS:
-            zed.retrieve_image(image, sl.VIEW.LEFT)
-            zed.retrieve_image(depth, sl.VIEW.DEPTH)
-            zed.retrieve_measure(confidence, sl.MEASURE.CONFIDENCE)
+        # Includes depth computation and, while recording, SVO encoding
+        with instruments.stage("grab"):
+            grabbed = zed.grab(runtime_params) == sl.ERROR_CODE.SUCCESS
+        if grabbed:
+            with instruments.stage("retrieve"):
+                zed.retrieve_image(image, sl.VIEW.LEFT, sl.MEM.CPU, preview_resolution)
+                zed.retrieve_image(depth, sl.VIEW.DEPTH, sl.MEM.CPU, preview_resolution)
+                zed.retrieve_measure(confidence, sl.MEASURE.CONFIDENCE, sl.MEM.CPU, preview_resolution)
+
+            # Saved for every capture event from stage1 / live2 and for 'c' in a ZED window,
+            # named by the capture id so calibration_solver.py pairs it with the DAVIS image
+            with instruments.stage("signals"):
+                captures = take_captures()
+            if key == ord('c'):
+                captures.append(start_capture())
+            if captures:
+                os.makedirs(CALI_PATH, exist_ok=True)
+                zed.retrieve_image(cali_image, sl.VIEW.LEFT)
+            for capture_id in captures:
+                cali_filename = os.path.join(CALI_PATH, f"{capture_id}.png")
+                cv2.imwrite(cali_filename, cali_image.get_data())
+                print(f"Saved ZED calibration image: {cali_filename}")
 
             if recording_active:
                 cv2.putText(image.get_data(), "REC", (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
@@ -106,25 +156,27 @@ def run():
             conf_data = confidence.get_data()
 
             if depth_data is None or conf_data is None:
-                cv2.imshow("RGB View", img_np)
-                cv2.imshow("Depth Map", np.zeros((1080, 1920), dtype=np.uint8))
-                cv2.imshow("Confidence Map", np.zeros((1080, 1920, 3), dtype=np.uint8))
+                depth_view, conf_view = blank_depth, blank_conf
             else:
-                depth_map = cv2.normalize(depth_data, None, 0, 255, cv2.NORM_MINMAX)
-                depth_map = cv2.convertScaleAbs(depth_map)
-                conf_map = cv2.normalize(conf_data, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
-                conf_map = cv2.applyColorMap(conf_map, cv2.COLORMAP_JET)
+                with instruments.stage("depth"):
+                    cv2.normalize(depth_data, depth_map, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+                    cv2.convertScaleAbs(conf_data, dst=conf_gray, alpha=255.0 / CONFIDENCE_MAX)
+                    apply_lut(conf_gray, jet_lut, conf_map)
+                depth_view, conf_view = depth_map, conf_map
 
-                cv2.imshow("RGB View", img_np)
-                cv2.imshow("Depth Map", depth_map)
-                cv2.imshow("Confidence Map", conf_map)
+            with instruments.stage("imshow"):
+                cv2.imshow("RGB View", instruments.overlay(img_np))
+                cv2.imshow("Depth Map", depth_view)
+                cv2.imshow("Confidence Map", conf_view)
 
-        key = cv2.waitKey(10)
+        with instruments.stage("waitKey"):
+            key = cv2.waitKey(10)
 
     if recording_active:
         zed.disable_recording()
         print("ZED SVO recording stopped on exit.")
     clear_signal_files()
+    instruments.close()
     zed.close()
     cv2.destroyAllWindows()
     print("FINISH")
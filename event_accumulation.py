@@ -0,0 +1,116 @@
+import numpy as np
+from event_arrays import event_columns
+
+# Vectorized event representations built from (t, x, y, p) columns with bincount and
+# flat index writes into buffers allocated once per accumulator. Returned images are
+# views of those buffers and are overwritten by the next call; copy them to keep them.
+
+# BGR colors matching the dv.visualization.EventVisualizer previews
+BACKGROUND_COLOR = (0, 0, 0)
+POSITIVE_COLOR = (0, 255, 0)
+NEGATIVE_COLOR = (0, 0, 255)
+
+
+class EventAccumulator:
+    def __init__(self, width, height, background=BACKGROUND_COLOR, positive=POSITIVE_COLOR,
+                 negative=NEGATIVE_COLOR):
+        self.width = width
+        self.height = height
+        self.size = width * height
+        self.colors = np.array([background, positive, negative], dtype=np.uint8)
+        self._state = np.zeros(self.size, dtype=np.uint8)
+        self._polarity_image = np.empty((height, width, 3), dtype=np.uint8)
+        self._count_image = np.empty((height, width), dtype=np.float32)
+        self._surface = np.empty((2, height, width), dtype=np.float32)
+        self._voxels = {}
+        # Latest timestamp per pixel and polarity, kept across calls for the time surface
+        self.last_timestamp = np.full((2, self.size), np.iinfo(np.int64).min // 2, dtype=np.int64)
+
+    def _pixel_index(self, x, y):
+        return y.astype(np.intp) * self.width + x
+
+    def polarity_image(self, events):
+        # 3-colour image, the last event at a pixel decides its colour
+        _, x, y, p = event_columns(events)
+        self._state.fill(0)
+        # Events are time ordered and flat index assignment applies them in order
+        self._state[self._pixel_index(x, y)] = 2 - p.astype(np.uint8)
+        np.take(self.colors, self._state, axis=0, out=self._polarity_image.reshape(-1, 3))
+        return self._polarity_image
+
+    def polarity_overlay(self, events, background):
+        # Event colours drawn over a BGR background image, like the visualizer's
+        # generateImage(events, image): pixels without events keep the background
+        _, x, y, p = event_columns(events)
+        self._state.fill(0)
+        self._state[self._pixel_index(x, y)] = 2 - p.astype(np.uint8)
+        np.copyto(self._polarity_image, background)
+        state = self._state.reshape(self.height, self.width)
+        mask = state > 0
+        self._polarity_image[mask] = self.colors[state[mask]]
+        return self._polarity_image
+
+    def count_image(self, events):
+        # Signed per-pixel count: +1 for positive, -1 for negative events
+        _, x, y, p = event_columns(events)
+        weights = p.astype(np.float32) * 2 - 1
+        counts = np.bincount(self._pixel_index(x, y), weights=weights, minlength=self.size)
+        np.copyto(self._count_image.reshape(-1), counts, casting="unsafe")
+        return self._count_image
+
+    def update_time_surface(self, events):
+        # One flat write into the (polarity, pixel) table; later events overwrite earlier ones
+        t, x, y, p = event_columns(events)
+        idx = self._pixel_index(x, y)
+        idx += p.astype(np.intp) * self.size
+        self.last_timestamp.reshape(-1)[idx] = t
+
+    def time_surface(self, events, reference_time, tau_us):
+        # Exponentially decaying surface exp(-(t_ref - t_last) / tau), one channel per
+        # polarity (0 = negative, 1 = positive)
+        if events is not None:
+            self.update_time_surface(events)
+        surface = self._surface.reshape(2, -1)
+        np.subtract(self.last_timestamp, reference_time, out=surface, casting="unsafe")
+        np.multiply(surface, 1.0 / tau_us, out=surface)
+        np.exp(surface, out=surface)
+        return self._surface
+
+    def reset_time_surface(self):
+        self.last_timestamp.fill(np.iinfo(np.int64).min // 2)
+
+    def voxel_grid(self, events, bins, start_time=None, end_time=None):
+        # (bins, height, width) grid, polarity +-1 spread linearly over the two nearest
+        # temporal bins
+        t, x, y, p = event_columns(events)
+        voxels = self._voxels.get(bins)
+        if voxels is None:
+            voxels = self._voxels[bins] = np.empty((bins, self.height, self.width), dtype=np.float32)
+        if len(t) == 0:
+            voxels.fill(0)
+            return voxels
+        t0 = t[0] if start_time is None else start_time
+        t1 = t[-1] if end_time is None else end_time
+        total = bins * self.size
+        idx = self._pixel_index(x, y)
+        pol = p.astype(np.float64)
+        pol *= 2
+        pol -= 1
+        if bins == 1:
+            grid = np.bincount(idx, weights=pol, minlength=total)
+        else:
+            tn = (t - t0).astype(np.float64)
+            tn *= (bins - 1) / max(1, t1 - t0)
+            np.clip(tn, 0, bins - 1, out=tn)
+            left = tn.astype(np.intp)
+            np.minimum(left, bins - 2, out=left)
+            tn -= left
+            # tn is now the weight of the right bin
+            right = pol * tn
+            pol -= right
+            idx += left * self.size
+            grid = np.bincount(idx, weights=pol, minlength=total)
+            idx += self.size
+            grid += np.bincount(idx, weights=right, minlength=total)
+        np.copyto(voxels.reshape(-1), grid, casting="unsafe")
+        return voxels
@@ -0,0 +1,409 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+import numpy as np
+from event_arrays import event_columns
+
+# Compressed long-term container for a DAVIS recording (<name>.evar): events in chunks
+# of at most CHUNK_EVENTS events or CHUNK_US microseconds, frames one per block, and a
+# footer with the chunk time index and the frame table, so a time-range read seeks
+# straight to the chunks it touches and decompresses only those.
+#
+# A chunk is one codec block of two column groups, each stored as byte planes (all
+# first bytes, then all second bytes, ...), which compresses much better than
+# interleaved values:
+#   - timestamp deltas to the previous event (the first event is the chunk's t_start),
+#     1, 2, 4 or 8 bytes wide, whatever the largest delta of the chunk needs
+#   - x | y << x_bits | p << (x_bits + y_bits), packed into as few bytes as the
+#     resolution needs (3 for 346x260)
+#
+# File layout: MAGIC, chunk and frame blocks in write order, then the footer (chunk
+# table, frame table, JSON metadata) and a trailer (footer offset, metadata length,
+# MAGIC). Codecs are zstd (zstandard), lz4 (lz4.frame) and zlib; the writer falls back
+# along that list when a module is not installed.
+
+ARCHIVE_SUFFIX = ".evar"
+ARCHIVE_VERSION = 1
+MAGIC = b"MSCEVAR1"
+TRAILER = struct.Struct("<QQ8s")
+
+CHUNK_EVENTS = 1 << 18
+CHUNK_US = 100_000
+DEFAULT_CODEC = "zstd"
+CODEC_ORDER = ("zstd", "lz4", "zlib")
+DEFAULT_LEVELS = {"zstd": 3, "lz4": 0, "zlib": 1}
+
+# Decoded chunks kept per archive: consecutive frame windows mostly fall into the same chunk
+CACHE_CHUNKS = 8
+
+CHUNK_DTYPE = np.dtype([("offset", "<u8"), ("size", "<u4"), ("count", "<u4"), ("t_start", "<i8"),
+                        ("t_end", "<i8"), ("delta_width", "u1")])
+FRAME_DTYPE = np.dtype([("offset", "<u8"), ("size", "<u4"), ("timestamp", "<i8")])
+
+
+def is_archive(file_path):
+    return str(file_path).endswith(ARCHIVE_SUFFIX)
+
+
+def archive_path_for(file_path):
+    return os.path.splitext(file_path)[0] + ARCHIVE_SUFFIX
+
+
+def get_codec(name, level=None):
+    # (compress, decompress) functions; raises ImportError when the module is missing
+    level = DEFAULT_LEVELS[name] if level is None else level
+    if name == "zstd":
+        import zstandard
+        compressor = zstandard.ZstdCompressor(level=level)
+        decompressor = zstandard.ZstdDecompressor()
+        return compressor.compress, decompressor.decompress
+    if name == "lz4":
+        import lz4.frame
+        return (lambda data: lz4.frame.compress(data, compression_level=level)), lz4.frame.decompress
+    if name == "zlib":
+        return (lambda data: zlib.compress(data, level)), zlib.decompress
+    raise ValueError(f"Unknown codec {name}, expected one of {CODEC_ORDER}")
+
+
+def available_codecs():
+    codecs = []
+    for name in CODEC_ORDER:
+        try:
+            get_codec(name)
+            codecs.append(name)
+        except ImportError:
+            pass
+    return codecs
+
+
+def byte_planes(values, width):
+    # The low `width` bytes of every value, grouped by byte position
+    return values.astype(values.dtype.newbyteorder("<"), copy=False).view(np.uint8) \
+        .reshape(len(values), values.dtype.itemsize)[:, :width].T.tobytes()
+
+
+def from_byte_planes(buffer, offset, count, width, dtype):
+    # Shifted in from the most significant plane down, much faster than a strided byte copy
+    planes = np.frombuffer(buffer, dtype=np.uint8, count=count * width, offset=offset).reshape(width, count)
+    values = planes[width - 1].astype(dtype)
+    for i in range(width - 2, -1, -1):
+        values <<= 8
+        values |= planes[i]
+    return values
+
+
+def delta_width(max_delta):
+    for width in (1, 2, 4):
+        if max_delta < 1 << (8 * width):
+            return width
+    return 8
+
+
+class ArchiveFrame:
+    # Stand-in for dv.Frame in the players
+    def __init__(self, timestamp, image):
+        self.timestamp = timestamp
+        self.image = image
+
+
+class ArchiveWriter:
+    def __init__(self, path, resolution, codec=DEFAULT_CODEC, level=None, chunk_events=CHUNK_EVENTS,
+                 chunk_us=CHUNK_US, camera_name=""):
+        for name in CODEC_ORDER[CODEC_ORDER.index(codec):]:
+            try:
+                self.compress, _ = get_codec(name, level)
+                break
+            except ImportError:
+                print(f"Codec {name} not installed, trying the next one")
+        if name != codec:
+            level = None
+        self.path = path
+        self.resolution = tuple(int(v) for v in resolution)
+        self.codec = name
+        self.level = DEFAULT_LEVELS[name] if level is None else level
+        self.chunk_events = chunk_events
+        self.chunk_us = chunk_us
+        self.camera_name = camera_name
+        self.x_bits = max(1, (self.resolution[0] - 1).bit_length())
+        self.y_bits = max(1, (self.resolution[1] - 1).bit_length())
+        self.xyp_width = (self.x_bits + self.y_bits + 1 + 7) // 8
+        self.chunks = []
+        self.frames = []
+        self.frame_shape = None
+        self._pending = []
+        self._pending_count = 0
+        self._tmp_path = path + ".tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(MAGIC)
+
+    def _write_block(self, data):
+        offset = self._file.tell()
+        self._file.write(data)
+        return offset, len(data)
+
+    def _write_chunk(self, t, x, y, p):
+        if self.chunks and t[0] < self.chunks[-1][4]:
+            raise ValueError("Events must be added in time order")
+        deltas = np.diff(t, prepend=t[:1]).astype(np.uint64)
+        width = delta_width(int(deltas.max()))
+        word = x.astype(np.uint32)
+        word |= y.astype(np.uint32) << self.x_bits
+        word |= p.astype(np.uint32) << (self.x_bits + self.y_bits)
+        payload = self.compress(byte_planes(deltas, width) + byte_planes(word, self.xyp_width))
+        offset, size = self._write_block(payload)
+        self.chunks.append((offset, size, len(t), int(t[0]), int(t[-1]), width))
+
+    def _flush(self, final=False):
+        if self._pending_count == 0:
+            return
+        t, x, y, p = (np.concatenate(c) for c in zip(*self._pending))
+        start = 0
+        while start < len(t):
+            stop = min(start + self.chunk_events,
+                       start + int(np.searchsorted(t[start:], t[start] + self.chunk_us, side="left")))
+            if stop == len(t) and not final:
+                # Chunk not full yet, wait for more events
+                break
+            self._write_chunk(t[start:stop], x[start:stop], y[start:stop], p[start:stop])
+            start = stop
+        self._pending = [(t[start:], x[start:], y[start:], p[start:])] if start < len(t) else []
+        self._pending_count = len(t) - start
+
+    def add_events(self, events):
+        # Time-ordered events: dv EventStore, structured array or (t, x, y, p) columns
+        columns = event_columns(events)
+        if len(columns[0]) == 0:
+            return
+        self._pending.append(columns)
+        self._pending_count += len(columns[0])
+        # Concatenated only when a chunk can be cut, not for every small batch
+        if self._pending_count >= self.chunk_events or \
+                self._pending[-1][0][-1] - self._pending[0][0][0] >= self.chunk_us:
+            self._flush()
+
+    def add_frame(self, timestamp, image):
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        if self.frame_shape is None:
+            self.frame_shape = image.shape
+        elif image.shape != self.frame_shape:
+            raise ValueError(f"Frame shape {image.shape} differs from {self.frame_shape}")
+        offset, size = self._write_block(self.compress(image.tobytes()))
+        self.frames.append((offset, size, int(timestamp)))
+
+    def close(self):
+        self._flush(final=True)
+        chunks = np.array(self.chunks, dtype=CHUNK_DTYPE)
+        frames = np.array(self.frames, dtype=FRAME_DTYPE)
+        meta = {"version": ARCHIVE_VERSION, "resolution": list(self.resolution), "camera_name": self.camera_name,
+                "codec": self.codec, "level": self.level, "x_bits": self.x_bits, "y_bits": self.y_bits,
+                "xyp_width": self.xyp_width, "chunk_count": len(chunks), "frame_count": len(frames),
+                "frame_shape": None if self.frame_shape is None else list(self.frame_shape),
+                "chunk_events": self.chunk_events, "chunk_us": self.chunk_us}
+        meta_bytes = json.dumps(meta).encode("utf-8")
+        footer_offset = self._file.tell()
+        self._file.write(chunks.tobytes())
+        self._file.write(frames.tobytes())
+        self._file.write(meta_bytes)
+        self._file.write(TRAILER.pack(footer_offset, len(meta_bytes), MAGIC))
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        return self.path
+
+
+class EventArchive:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < len(MAGIC) + TRAILER.size or self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not an event archive: {path}")
+        footer_offset, meta_length, magic = TRAILER.unpack_from(self._map, len(self._map) - TRAILER.size)
+        if magic != MAGIC:
+            raise ValueError(f"Truncated event archive: {path}")
+        meta_offset = len(self._map) - TRAILER.size - meta_length
+        self.meta = json.loads(bytes(self._map[meta_offset:meta_offset + meta_length]))
+        if self.meta["version"] != ARCHIVE_VERSION:
+            raise ValueError(f"Unsupported event archive version in {path}")
+        self.chunks = np.frombuffer(self._map, dtype=CHUNK_DTYPE, count=self.meta["chunk_count"], offset=footer_offset)
+        self.frame_table = np.frombuffer(self._map, dtype=FRAME_DTYPE, count=self.meta["frame_count"],
+                                         offset=footer_offset + self.chunks.nbytes)
+        self.frame_timestamps = self.frame_table["timestamp"]
+        self.resolution = tuple(self.meta["resolution"])
+        self.frame_shape = None if self.meta["frame_shape"] is None else tuple(self.meta["frame_shape"])
+        self._chunk_start = self.chunks["t_start"]
+        self._chunk_end = self.chunks["t_end"]
+        self._decompress = None
+        self._cache = {}
+
+    @property
+    def event_count(self):
+        return int(self.chunks["count"].sum())
+
+    @property
+    def frame_count(self):
+        return len(self.frame_timestamps)
+
+    def _block(self, offset, size):
+        if self._decompress is None:
+            _, self._decompress = get_codec(self.meta["codec"])
+        return self._decompress(memoryview(self._map)[offset:offset + size])
+
+    def chunk(self, chunk_index):
+        # (t, x, y, p) of one chunk, decoded once while it stays in the cache
+        columns = self._cache.pop(chunk_index, None)
+        if columns is None:
+            offset, size, count, t_start, _, width = self.chunks[chunk_index].tolist()
+            data = self._block(offset, size)
+            t = from_byte_planes(data, 0, count, width, np.uint64).view(np.int64)
+            np.cumsum(t, out=t)
+            t += t_start
+            word = from_byte_planes(data, count * width, count, self.meta["xyp_width"], np.uint32)
+            x_bits, y_bits = self.meta["x_bits"], self.meta["y_bits"]
+            x = (word & ((1 << x_bits) - 1)).astype(np.uint16)
+            y = ((word >> x_bits) & ((1 << y_bits) - 1)).astype(np.uint16)
+            p = (word >> (x_bits + y_bits)).astype(np.uint8)
+            columns = (t, x, y, p)
+            if len(self._cache) >= CACHE_CHUNKS:
+                del self._cache[next(iter(self._cache))]
+        self._cache[chunk_index] = columns
+        return columns
+
+    def events_between(self, start_timestamp, end_timestamp):
+        # (t, x, y, p) columns of the events in [start_timestamp, end_timestamp), same
+        # interface as event_store.EventStore; only the chunks overlapping it are decoded
+        first = int(np.searchsorted(self._chunk_end, start_timestamp, side="left"))
+        last = int(np.searchsorted(self._chunk_start, end_timestamp, side="left"))
+        parts = []
+        for i in range(first, last):
+            t, x, y, p = self.chunk(i)
+            lo = int(np.searchsorted(t, start_timestamp, side="left"))
+            hi = int(np.searchsorted(t, end_timestamp, side="left"))
+            if hi > lo:
+                parts.append((t[lo:hi], x[lo:hi], y[lo:hi], p[lo:hi]))
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return (np.zeros(0, np.int64), np.zeros(0, np.uint16), np.zeros(0, np.uint16), np.zeros(0, np.uint8))
+        return tuple(np.concatenate(c) for c in zip(*parts))
+
+    def time_range(self):
+        # First and last event timestamp
+        if len(self.chunks) == 0:
+            return 0, 0
+        return int(self._chunk_start[0]), int(self._chunk_end[-1])
+
+    def frame_index_at(self, timestamp):
+        return max(0, int(np.searchsorted(self.frame_timestamps, timestamp, side="right")) - 1)
+
+    def frame(self, frame_index):
+        offset, size, timestamp = self.frame_table[frame_index].tolist()
+        image = np.frombuffer(self._block(offset, size), dtype=np.uint8).reshape(self.frame_shape)
+        return timestamp, image
+
+    def index(self):
+        # recording_index.RecordingIndex built from the footer, for the players and exporters
+        from recording_index import RecordingIndex
+        st = os.stat(self.path)
+        start, end = self.time_range()
+        return RecordingIndex(st.st_mtime_ns, st.st_size, start, end, self.frame_timestamps,
+                              self._chunk_start, self._chunk_end, self.chunks["count"])
+
+    # dv.io.MonoCameraRecording-style accessors, so SeekableRecording and the players
+    # read an archive like an .aedat4. Events come back as (t, x, y, p) columns.
+
+    def getEventResolution(self):
+        return self.resolution
+
+    def getFrameResolution(self):
+        return None if self.frame_shape is None else (self.frame_shape[1], self.frame_shape[0])
+
+    def isEventStreamAvailable(self):
+        return len(self.chunks) > 0
+
+    def isFrameStreamAvailable(self):
+        return self.frame_count > 0
+
+    def getCameraName(self):
+        return self.meta["camera_name"]
+
+    def getTimeRange(self):
+        return self.time_range()
+
+    def getEventsTimeRange(self, start_timestamp, end_timestamp):
+        return self.events_between(start_timestamp, end_timestamp)
+
+    def getFramesTimeRange(self, start_timestamp, end_timestamp):
+        lo = int(np.searchsorted(self.frame_timestamps, start_timestamp, side="left"))
+        hi = int(np.searchsorted(self.frame_timestamps, end_timestamp, side="left"))
+        return [ArchiveFrame(*self.frame(i)) for i in range(lo, hi)]
+
+
+def open_recording(file_path):
+    # EventArchive for .evar files, dv.io.MonoCameraRecording otherwise
+    if is_archive(file_path):
+        return EventArchive(file_path)
+    import dv_processing as dv
+    return dv.io.MonoCameraRecording(file_path)
+
+
+def convert(file_path, output_path=None, codec=DEFAULT_CODEC, level=None, chunk_events=CHUNK_EVENTS,
+            chunk_us=CHUNK_US):
+    # Reads the memory-mapped event store when there is an up-to-date one, else decodes the .aedat4
+    from event_store import open_event_store
+    import dv_processing as dv
+    output_path = output_path or archive_path_for(file_path)
+    recording = dv.io.MonoCameraRecording(file_path)
+    writer = ArchiveWriter(output_path, recording.getEventResolution(), codec, level, chunk_events, chunk_us,
+                           recording.getCameraName())
+    store = open_event_store(file_path)
+    if store is not None:
+        for start in range(0, store.event_count, chunk_events):
+            end = start + chunk_events
+            writer.add_events((store.t[start:end], store.x[start:end], store.y[start:end], store.p[start:end]))
+        for i in range(store.frame_count):
+            writer.add_frame(*store.frame(i))
+        return writer.close()
+
+    if recording.isEventStreamAvailable():
+        while True:
+            events = recording.getNextEventBatch()
+            if events is None:
+                break
+            writer.add_events(events)
+    if recording.isFrameStreamAvailable():
+        frame = recording.getNextFrame()
+        while frame is not None:
+            writer.add_frame(frame.timestamp, frame.image)
+            frame = recording.getNextFrame()
+    return writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert .aedat4 recordings to compressed, chunked event archives.")
+    parser.add_argument("recordings", nargs="+")
+    parser.add_argument("--codec", choices=CODEC_ORDER, default=DEFAULT_CODEC)
+    parser.add_argument("--level", type=int, help="Codec level (default: zstd 3, lz4 0, zlib 1)")
+    parser.add_argument("--chunk-events", type=int, default=CHUNK_EVENTS, help="Maximum events per chunk")
+    parser.add_argument("--chunk-ms", type=float, default=CHUNK_US / 1e3, help="Maximum time span per chunk")
+    args = parser.parse_args()
+
+    for file_path in args.recordings:
+        if not os.path.exists(file_path):
+            print(f"File does not exist: {file_path}")
+            sys.exit(1)
+        start = time.perf_counter()
+        output_path = convert(file_path, None, args.codec, args.level, args.chunk_events, int(args.chunk_ms * 1e3))
+        archive = EventArchive(output_path)
+        size, source_size = os.path.getsize(output_path), os.path.getsize(file_path)
+        print(f"Converted {file_path}: {archive.event_count} events in {len(archive.chunks)} chunks, "
+              f"{archive.frame_count} frames, {archive.meta['codec']} level {archive.meta['level']}, "
+              f"{size / 1e6:.1f} MB ({size / source_size:.2f}x the .aedat4) in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
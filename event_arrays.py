@@ -0,0 +1,63 @@
+import numpy as np
+
+# Column layout of dv.EventStore.numpy()
+EVENT_DTYPE = np.dtype([("timestamp", "<i8"), ("x", "<i2"), ("y", "<i2"), ("polarity", "u1")])
+
+EMPTY_EVENTS = np.zeros(0, dtype=EVENT_DTYPE)
+
+
+def event_array(events):
+    # Structured (timestamp, x, y, polarity) array for an EventStore slice. The
+    # conversion happens inside dv-processing, no per-event Python objects are created.
+    if events is None:
+        return EMPTY_EVENTS
+    if isinstance(events, np.ndarray):
+        return events
+    if isinstance(events, tuple):
+        # (t, x, y, p) columns of an event_store.EventStore slice, copied into one array
+        arr = np.empty(len(events[0]), dtype=EVENT_DTYPE)
+        for name, column in zip(EVENT_DTYPE.names, events):
+            arr[name] = column
+        return arr
+    if len(events) == 0:
+        return EMPTY_EVENTS
+    return events.numpy()
+
+
+def event_columns(events):
+    # (t, x, y, p) views into the structured array, no further copies. Column tuples
+    # from an event store are returned as they are.
+    if isinstance(events, tuple):
+        return events
+    arr = event_array(events)
+    return arr["timestamp"], arr["x"], arr["y"], arr["polarity"]
+
+
+def time_bounds(events):
+    t = event_columns(events)[0]
+    if len(t) == 0:
+        return None
+    return int(t[0]), int(t[-1])
+
+
+def slice_time(arr, start_time, end_time):
+    # Events in [start_time, end_time) of a time-sorted array, returned as a view
+    t = arr["timestamp"]
+    lo = np.searchsorted(t, start_time, side="left")
+    hi = np.searchsorted(t, end_time, side="left")
+    return arr[lo:hi]
+
+
+def filter_roi(arr, x0, y0, x1, y1):
+    mask = (arr["x"] >= x0) & (arr["x"] < x1) & (arr["y"] >= y0) & (arr["y"] < y1)
+    return arr[mask]
+
+
+def filter_polarity(arr, polarity):
+    return arr[arr["polarity"] == int(polarity)]
+
+
+def count_image(arr, width, height):
+    # Per-pixel event count via bincount on the flattened pixel index
+    idx = arr["y"].astype(np.intp) * width + arr["x"]
+    return np.bincount(idx, minlength=width * height).reshape(height, width)
@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import numpy as np
+
+# Columnar, memory-mapped copy of an .aedat4 recording, written once next to it as the
+# directory <name>.aedat4.store/: t (int64), x, y (uint16), p (uint8) event columns,
+# frame timestamps and all frames as .npy files, plus meta.json. Readers open the
+# columns with mmap_mode="r", so a time-range query is two searchsorted calls on t and
+# zero-copy slices of the columns, nothing is decompressed, and processes reading the
+# same session share the pages through the OS cache.
+#
+# The store is tied to the recording's mtime and size like the sidecar index and is
+# ignored (open_event_store returns None) once the recording changes.
+
+STORE_SUFFIX = ".store"
+STORE_VERSION = 1
+COLUMNS = {"t": np.int64, "x": np.uint16, "y": np.uint16, "p": np.uint8}
+
+
+def store_path_for(file_path):
+    return file_path + STORE_SUFFIX
+
+
+class EventStore:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported event store version in {path}")
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        self.t, self.x, self.y, self.p = (load(name) for name in COLUMNS)
+        self.frame_timestamps = load("frame_t")
+        self.frames = load("frames") if self.meta["frame_count"] > 0 else None
+        self.resolution = tuple(self.meta["resolution"])
+
+    @property
+    def event_count(self):
+        return len(self.t)
+
+    @property
+    def frame_count(self):
+        return len(self.frame_timestamps)
+
+    def matches(self, file_path):
+        st = os.stat(file_path)
+        return st.st_mtime_ns == self.meta["source_mtime_ns"] and st.st_size == self.meta["source_size"]
+
+    def time_range(self):
+        # First and last event timestamp
+        if self.event_count == 0:
+            return 0, 0
+        return int(self.t[0]), int(self.t[-1])
+
+    def event_range(self, start_timestamp, end_timestamp):
+        # [lo, hi) event positions of the events in [start_timestamp, end_timestamp)
+        lo = int(np.searchsorted(self.t, start_timestamp, side="left"))
+        hi = int(np.searchsorted(self.t, end_timestamp, side="left"))
+        return lo, hi
+
+    def events_between(self, start_timestamp, end_timestamp):
+        # (t, x, y, p) column views, the same half-open interval as getEventsTimeRange
+        lo, hi = self.event_range(start_timestamp, end_timestamp)
+        return self.t[lo:hi], self.x[lo:hi], self.y[lo:hi], self.p[lo:hi]
+
+    def frame_index_at(self, timestamp):
+        # Index of the last frame at or before the timestamp
+        return max(0, int(np.searchsorted(self.frame_timestamps, timestamp, side="right")) - 1)
+
+    def frame(self, frame_index):
+        # (timestamp, image view)
+        return int(self.frame_timestamps[frame_index]), self.frames[frame_index]
+
+
+def write_event_store(path, resolution, event_count, event_batches, frame_count, frames, source_stat):
+    # event_batches yields (t, x, y, p) column tuples or structured event arrays in time
+    # order, frames yields (timestamp, image). Counts come from the recording index, so
+    # every column is allocated once and filled in place.
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    open_column = lambda name, dtype, shape: np.lib.format.open_memmap(os.path.join(tmp_path, f"{name}.npy"),
+                                                                       mode="w+", dtype=dtype, shape=shape)
+    columns = {name: open_column(name, dtype, (event_count,)) for name, dtype in COLUMNS.items()}
+    n = 0
+    for batch in event_batches:
+        if isinstance(batch, np.ndarray):
+            batch = (batch["timestamp"], batch["x"], batch["y"], batch["polarity"])
+        m = len(batch[0])
+        if n + m > event_count:
+            raise ValueError(f"Recording has more events than its index ({event_count})")
+        for column, values in zip(columns.values(), batch):
+            column[n:n + m] = values
+        n += m
+    if n != event_count:
+        raise ValueError(f"Recording has {n} events, its index {event_count}")
+
+    frame_t = open_column("frame_t", np.int64, (frame_count,))
+    frame_array = None
+    i = 0
+    for timestamp, image in frames:
+        if frame_array is None:
+            frame_array = open_column("frames", np.uint8, (frame_count,) + image.shape)
+        frame_t[i] = timestamp
+        frame_array[i] = image
+        i += 1
+    if i != frame_count:
+        raise ValueError(f"Recording has {i} frames, its index {frame_count}")
+    for array in list(columns.values()) + [frame_t, frame_array]:
+        if array is not None:
+            array.flush()
+    del columns, frame_t, frame_array
+
+    meta = {"version": STORE_VERSION, "source_mtime_ns": source_stat.st_mtime_ns, "source_size": source_stat.st_size,
+            "resolution": list(resolution), "event_count": event_count, "frame_count": frame_count}
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    return EventStore(path)
+
+
+def convert(file_path):
+    import dv_processing as dv
+    from recording_index import load_index
+    index = load_index(file_path)
+    st = os.stat(file_path)
+    recording = dv.io.MonoCameraRecording(file_path)
+
+    def event_batches():
+        if not recording.isEventStreamAvailable():
+            return
+        while True:
+            events = recording.getNextEventBatch()
+            if events is None:
+                break
+            if len(events) > 0:
+                yield events.numpy()
+
+    def frames():
+        if not recording.isFrameStreamAvailable():
+            return
+        frame = recording.getNextFrame()
+        while frame is not None:
+            yield frame.timestamp, frame.image
+            frame = recording.getNextFrame()
+
+    return write_event_store(store_path_for(file_path), recording.getEventResolution(), index.event_count,
+                             event_batches(), len(index.frame_timestamps), frames(), st)
+
+
+def open_event_store(file_path):
+    # The converted store of a recording, or None when there is none or it is out of date
+    path = store_path_for(file_path)
+    if not os.path.isdir(path):
+        return None
+    try:
+        store = EventStore(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    if not store.matches(file_path):
+        print(f"Event store out of date, ignored: {path}")
+        return None
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert .aedat4 recordings to memory-mapped columnar event stores.")
+    parser.add_argument("recordings", nargs="+")
+    parser.add_argument("--force", action="store_true", help="Convert even when an up-to-date store exists")
+    args = parser.parse_args()
+
+    for file_path in args.recordings:
+        if not os.path.exists(file_path):
+            print(f"File does not exist: {file_path}")
+            sys.exit(1)
+        if not args.force and open_event_store(file_path) is not None:
+            print(f"Up to date: {store_path_for(file_path)}")
+            continue
+        start = time.perf_counter()
+        store = convert(file_path)
+        size = sum(os.path.getsize(os.path.join(store.path, name)) for name in os.listdir(store.path))
+        print(f"Converted {file_path}: {store.event_count} events, {store.frame_count} frames, "
+              f"{size / 1e6:.1f} MB in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import argparse
+import datetime
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import cv2 as cv
+from recording_index import load_index, print_index_summary
+from event_store import open_event_store
+from event_archive import ARCHIVE_SUFFIX, EventArchive, is_archive
+from event_accumulation import EventAccumulator
+
+# Headless replacement for the savepng1.py / savepng2.py playback loops: the save
+# points are computed from the recording index, only the selected frames and event
+# windows are decoded, and PNG encoding runs in a process pool. Recordings converted with
+# event_store.py are read from the memory-mapped store and not decoded at all; event
+# archives (event_archive.py) decode only the chunks of the exported windows.
+
+base_path = "D:/Programs/DV/Recording/"
+sf_path = "D:/Programs/DV/Recording/davis/frame"
+se_path = "D:/Programs/DV/Recording/davis/event"
+
+MAX_PENDING_PER_WORKER = 8
+
+
+def select_save_points(frame_timestamps, interval, limit):
+    # Same rule as the savepng loops: starting from the second frame, a frame is
+    # picked when its timestamp reaches the next save time, which then advances by
+    # one interval. Returns (frame index, save time) pairs.
+    points = []
+    if len(frame_timestamps) == 0:
+        return points
+    next_save_time = int(frame_timestamps[0])
+    for i in range(1, len(frame_timestamps)):
+        if limit is not None and len(points) >= limit:
+            break
+        if frame_timestamps[i] >= next_save_time:
+            points.append((i, next_save_time))
+            next_save_time += interval
+    return points
+
+
+def write_png(path, image):
+    if not cv.imwrite(path, image):
+        raise IOError(f"Failed to write {path}")
+    return path
+
+
+def read_frame_at(recording, timestamp):
+    frames = recording.getFramesTimeRange(timestamp, timestamp + 1)
+    if len(frames) == 0:
+        return None
+    return frames[0]
+
+
+class RecordingSource:
+    def __init__(self, file_path):
+        # Imported here so that archives and converted recordings export without dv_processing
+        import dv_processing as dv
+
+        self.recording = dv.io.MonoCameraRecording(file_path)
+        self.visualizer = dv.visualization.EventVisualizer(self.recording.getEventResolution())
+        self.visualizer.setBackgroundColor((0, 0, 0))
+        self.visualizer.setPositiveColor((0, 255, 0))
+        self.visualizer.setNegativeColor((0, 0, 255))
+
+    def frame_image(self, frame_index, timestamp):
+        frame = read_frame_at(self.recording, timestamp)
+        return None if frame is None else frame.image
+
+    def event_image(self, start_timestamp, end_timestamp):
+        events = self.recording.getEventsTimeRange(start_timestamp, end_timestamp)
+        return None if events is None else self.visualizer.generateImage(events)
+
+
+class StoreSource:
+    # event_store.EventStore or event_archive.EventArchive
+    def __init__(self, store):
+        self.store = store
+        # Same colours as the visualizer of RecordingSource
+        self.accumulator = EventAccumulator(*store.resolution)
+
+    def frame_image(self, frame_index, timestamp):
+        return self.store.frame(frame_index)[1]
+
+    def event_image(self, start_timestamp, end_timestamp):
+        # Copied: the accumulator reuses its buffer and the pool pickles images later
+        return self.accumulator.polarity_image(self.store.events_between(start_timestamp, end_timestamp)).copy()
+
+
+def export(file_path, frame_points, event_points, frame_timestamps, frame_dir, event_dir, workers, use_store=True):
+    if is_archive(file_path):
+        store = EventArchive(file_path)
+    else:
+        store = open_event_store(file_path) if use_store else None
+    if store is not None:
+        print(f"Reading from {store.path}")
+        source = StoreSource(store)
+    else:
+        source = RecordingSource(file_path)
+
+    timestamp_str = datetime.datetime.now().strftime("%Y%m%d")
+    frame_jobs = {i: (save_time, n + 1) for n, (i, save_time) in enumerate(frame_points)}
+    event_jobs = {i: (save_time, n + 1) for n, (i, save_time) in enumerate(event_points)}
+
+    saved = 0
+    pending = set()
+    max_pending = workers * MAX_PENDING_PER_WORKER
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        def submit(path, image):
+            nonlocal pending, saved
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    print(f"Saved: {future.result()}")
+                    saved += 1
+            pending.add(pool.submit(write_png, path, image))
+
+        for i in sorted(set(frame_jobs) | set(event_jobs)):
+            timestamp = int(frame_timestamps[i])
+
+            if i in frame_jobs:
+                image = source.frame_image(i, timestamp)
+                if image is not None:
+                    save_time, count = frame_jobs[i]
+                    submit(os.path.join(frame_dir, f"{timestamp_str}_{save_time}_{count}.png"), image)
+
+            if i in event_jobs:
+                start_timestamp = int(frame_timestamps[i - 1])
+                image = source.event_image(start_timestamp, timestamp)
+                if image is not None:
+                    save_time, count = event_jobs[i]
+                    submit(os.path.join(event_dir, f"{timestamp_str}_{save_time}_{count}.png"), image)
+
+        for future in pending:
+            print(f"Saved: {future.result()}")
+            saved += 1
+    return saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export frame and event PNGs from a .aedat4 recording without playback.")
+    parser.add_argument("file", help="Recording to export, relative to the recording folder or absolute")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--count", type=int, nargs=2, metavar=("FRAMES", "EVENTS"),
+                      help="Save N evenly spaced frame / event PNGs (savepng1 mode)")
+    mode.add_argument("--interval", type=int, nargs=2, metavar=("FRAME_US", "EVENT_US"),
+                      help="Save a frame / event PNG every given number of microseconds (savepng2 mode)")
+    parser.add_argument("--limit", type=int, nargs=2, metavar=("FRAMES", "EVENTS"),
+                        help="Maximum number of PNGs in interval mode")
+    parser.add_argument("--frame-dir", default=sf_path)
+    parser.add_argument("--event-dir", default=se_path)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--no-store", action="store_true", help="Decode the .aedat4 even if it was converted")
+    args = parser.parse_args()
+
+    file_path = args.file if os.path.isabs(args.file) else os.path.join(base_path, args.file)
+    if not file_path.endswith(".aedat4") and not is_archive(file_path):
+        print(f"Invalid file extension! It must end with '.aedat4' or '{ARCHIVE_SUFFIX}'")
+        sys.exit(1)
+    if not os.path.exists(file_path):
+        print(f"File does not exist: {file_path}")
+        sys.exit(1)
+
+    index = load_index(file_path)
+    print_index_summary(index)
+    if not index.has_frames:
+        sys.exit(1)
+
+    duration = index.frame_end - index.frame_start
+    if args.count is not None:
+        num_frames, num_events = args.count
+        frame_interval = max(1, duration // max(1, num_frames))
+        event_interval = max(1, duration // max(1, num_events))
+        frame_limit, event_limit = num_frames, num_events
+    else:
+        frame_interval, event_interval = max(1, args.interval[0]), max(1, args.interval[1])
+        frame_limit, event_limit = args.limit if args.limit is not None else (None, None)
+
+    frame_points = select_save_points(index.frame_timestamps, frame_interval, frame_limit)
+    event_points = select_save_points(index.frame_timestamps, event_interval, event_limit)
+    print(f"{len(frame_points)} FRAME PNGs and {len(event_points)} EVENT PNGs to save.")
+
+    os.makedirs(args.frame_dir, exist_ok=True)
+    os.makedirs(args.event_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    saved = export(file_path, frame_points, event_points, index.frame_timestamps,
+                   args.frame_dir, args.event_dir, max(1, args.workers), not args.no_store)
+    print(f"Exported {saved} PNGs in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import json
+import os
+import time
+import numpy as np
+import cv2 as cv
+
+# Per-stage timing for the live and playback loops. A loop wraps its stages in
+#     with instruments.stage("imshow"):
+# and calls instruments.tick() once per iteration; camera reads and writer calls made on
+# other threads are timed by wrapping the callables with instruments.wrap(). Durations go
+# into a rolling window per stage (the last WINDOW_SAMPLES, for p50/p95/p99) and a log2
+# histogram per report interval; gauges (queue depth, playback lag, ...) keep their last
+# and peak value. Every report interval one JSON line is appended to the log, and the
+# optional overlay draws the current numbers onto a preview image.
+#
+# Stages can nest (a slicer callback timed as "visualize" inside "slice"), so shares do
+# not add up to 100%. Each stage name is timed from one thread only; reports read the
+# statistics without a lock and may miss a sample that is being written.
+#
+# Off unless MSC_INSTRUMENT is set. open_instruments() then returns NULL_INSTRUMENTS:
+# stage() hands back one shared no-op context manager, wrap() returns the callable
+# unchanged and everything else returns immediately. Environment:
+#   MSC_INSTRUMENT=1             enable
+#   MSC_INSTRUMENT_LOG=<path>    JSON lines file (default: INSTRUMENT_DIR/<name>.jsonl)
+#   MSC_INSTRUMENT_INTERVAL=<s>  report interval (default: REPORT_INTERVAL_S)
+#   MSC_INSTRUMENT_OVERLAY=1     draw the numbers on the preview
+
+INSTRUMENT_DIR = "D:/Programs/DV/Recording/temp/instrumentation"
+REPORT_INTERVAL_S = 5.0
+OVERLAY_REFRESH_S = 0.5
+WINDOW_SAMPLES = 1024
+# Bucket k counts durations in [2^(k-1), 2^k) us, bucket 0 those under 1 us
+HISTOGRAM_BUCKETS = 22
+
+
+class StageStats:
+    def __init__(self, window=WINDOW_SAMPLES):
+        self.samples = [0.0] * window
+        self.count = 0
+        self.interval_count = 0
+        self.interval_total = 0.0
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, seconds):
+        self.samples[self.count % len(self.samples)] = seconds
+        self.count += 1
+        self.interval_count += 1
+        self.interval_total += seconds
+        self.buckets[min(int(seconds * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def percentiles_ms(self):
+        if self.count == 0:
+            return None, None, None
+        recent = self.samples[:min(self.count, len(self.samples))]
+        return tuple(float(v) * 1e3 for v in np.percentile(recent, (50, 95, 99)))
+
+    def summary(self, interval_s):
+        # Rolling percentiles plus what happened since the last report, which is then reset
+        p50, p95, p99 = self.percentiles_ms()
+        summary = {"count": self.interval_count, "share": self.interval_total / interval_s if interval_s > 0 else None,
+                   "p50_ms": p50, "p95_ms": p95, "p99_ms": p99,
+                   "max_ms": max(self.samples[:min(self.count, len(self.samples))]) * 1e3 if self.count else None,
+                   "histogram_us_log2": self.buckets}
+        self.interval_count = 0
+        self.interval_total = 0.0
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+        return summary
+
+
+class _StageTimer:
+    __slots__ = ("stats", "start")
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stats.add(time.perf_counter() - self.start)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_STAGE = _NullStage()
+
+
+class NullInstruments:
+    enabled = False
+
+    def stage(self, name):
+        return NULL_STAGE
+
+    def wrap(self, name, fn, ignore_none=False):
+        return fn
+
+    def record(self, name, seconds):
+        pass
+
+    def gauge(self, name, value):
+        pass
+
+    def watch(self, name, fn):
+        pass
+
+    def tick(self):
+        pass
+
+    def overlay(self, image):
+        return image
+
+    def close(self):
+        pass
+
+
+NULL_INSTRUMENTS = NullInstruments()
+
+
+class Instruments:
+    enabled = True
+
+    def __init__(self, name, log_path, interval_s=REPORT_INTERVAL_S, show_overlay=False, clock=time.perf_counter):
+        self.name = name
+        self.log_path = log_path
+        self.interval_s = interval_s
+        self.show_overlay = show_overlay
+        self.clock = clock
+        self.stages = {}
+        self.gauges = {}
+        self._timers = {}
+        self._watches = []
+        self._overlay_lines = []
+        self.iterations = 0
+        self._interval_start = clock()
+        self._interval_iterations = 0
+        self._next_report = self._interval_start + interval_s
+        self._next_overlay = self._interval_start
+        log_dir = os.path.dirname(log_path)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        self._log = open(log_path, "a", buffering=1)
+
+    def _stats(self, name):
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats()
+        return stats
+
+    def stage(self, name):
+        timer = self._timers.get(name)
+        if timer is None:
+            timer = self._timers[name] = _StageTimer(self._stats(name))
+        return timer
+
+    def wrap(self, name, fn, ignore_none=False):
+        # Timed version of fn for calls made on other threads (camera reads, writer
+        # calls); ignore_none leaves out polls that returned nothing
+        stats = self._stats(name)
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            result = fn(*args, **kwargs)
+            if result is not None or not ignore_none:
+                stats.add(clock() - start)
+            return result
+        return timed
+
+    def record(self, name, seconds):
+        self._stats(name).add(seconds)
+
+    def gauge(self, name, value):
+        if value is None:
+            return
+        g = self.gauges.get(name)
+        if g is None:
+            self.gauges[name] = [value, value]
+        else:
+            g[0] = value
+            if value > g[1]:
+                g[1] = value
+
+    def watch(self, name, fn):
+        # Gauge sampled by fn() on every tick
+        self._watches.append((name, fn))
+
+    def tick(self):
+        self.iterations += 1
+        self._interval_iterations += 1
+        for name, fn in self._watches:
+            self.gauge(name, fn())
+        now = self.clock()
+        if self.show_overlay and now >= self._next_overlay:
+            self._overlay_lines = self.overlay_lines()
+            self._next_overlay = now + OVERLAY_REFRESH_S
+        if now >= self._next_report:
+            self.report(now)
+
+    def report(self, now=None):
+        now = self.clock() if now is None else now
+        interval = now - self._interval_start
+        line = {"time": time.time(), "name": self.name, "interval_s": interval, "iterations": self._interval_iterations,
+                "loop_hz": self._interval_iterations / interval if interval > 0 else None,
+                "stages": {name: stats.summary(interval) for name, stats in self.stages.items()},
+                "gauges": {name: {"last": g[0], "peak": g[1]} for name, g in self.gauges.items()}}
+        for g in self.gauges.values():
+            g[1] = g[0]
+        self._log.write(json.dumps(line) + "\n")
+        self._interval_start = now
+        self._interval_iterations = 0
+        self._next_report = now + self.interval_s
+        return line
+
+    def overlay_lines(self):
+        lines = []
+        for name, stats in self.stages.items():
+            p50, p95, _ = stats.percentiles_ms()
+            if p50 is not None:
+                lines.append(f"{name:<12} p50 {p50:7.2f}  p95 {p95:7.2f} ms")
+        lines += [f"{name:<12} {g[0]:g} (peak {g[1]:g})" for name, g in self.gauges.items()]
+        return lines
+
+    def overlay(self, image):
+        # Copy of the image with the numbers drawn on it; the image itself when the overlay is off
+        if not self.show_overlay or image is None or not self._overlay_lines:
+            return image
+        out = image.copy()
+        scale = max(0.35, out.shape[1] / 1600)
+        step = int(28 * scale) + 4
+        color = (255, 255, 255) if out.ndim == 2 or out.shape[2] < 3 else (255, 255, 255, 255)[:out.shape[2]]
+        for i, text in enumerate(self._overlay_lines):
+            origin = (6, step * (i + 1))
+            cv.putText(out, text, origin, cv.FONT_HERSHEY_SIMPLEX, scale, (0,) * len(color), 3, cv.LINE_AA)
+            cv.putText(out, text, origin, cv.FONT_HERSHEY_SIMPLEX, scale, color, 1, cv.LINE_AA)
+        return out
+
+    def close(self):
+        if self._interval_iterations > 0:
+            self.report()
+        self._log.close()
+
+
+def open_instruments(name):
+    # Instruments for one script when MSC_INSTRUMENT is set, NULL_INSTRUMENTS otherwise
+    if os.environ.get("MSC_INSTRUMENT", "") in ("", "0"):
+        return NULL_INSTRUMENTS
+    log_path = os.environ.get("MSC_INSTRUMENT_LOG") or os.path.join(INSTRUMENT_DIR, f"{name}.jsonl")
+    interval_s = float(os.environ.get("MSC_INSTRUMENT_INTERVAL", REPORT_INTERVAL_S))
+    show_overlay = os.environ.get("MSC_INSTRUMENT_OVERLAY", "") not in ("", "0")
+    instruments = Instruments(name, log_path, interval_s, show_overlay)
+    print(f"Instrumentation on, every {interval_s:g} s to {log_path}" + (" (overlay)" if show_overlay else ""))
+    return instruments
@@ -7,6 +7,12 @@ import time
 import os
 import glob
 from datetime import timedelta
+from acquisition import DropQueue, AcquisitionThread, RecordingThread, OPEN_WRITER, CLOSE_WRITER, format_queue_stats
+from acquisition import write_davis_packet, recording_report, format_recording_report
+from instrumentation import open_instruments
+from signal_bus import open_signal_bus, new_capture_id
+from sources import davis_readers
+from undistort_maps import open_undistorter, undistort_image
 
 sys.argv = [sys.argv[0]]
 
@@ -38,48 +44,40 @@ sys.argv = [sys.argv[0]]
 
 cali_path = "D:/Programs/DV/Recording/cali/davis"
 base_path = "D:/Programs/DV/Recording/temp"
-stop_signal_path = "D:/Programs/DV/Recording/temp/stop_signal.txt"
-src_path = "D:/Programs/DV/Recording/temp/src.txt"
-sry_path = "D:/Programs/DV/Recording/temp/sry.txt"
-ssc_path = "D:/Programs/DV/Recording/temp/ssc.txt"
-ssy_path = "D:/Programs/DV/Recording/temp/ssy.txt"
-calic_path = "D:/Programs/DV/Recording/temp/calic.txt"
-caliy_path = "D:/Programs/DV/Recording/temp/caliy.txt"
+# Start/stop signals and calibration capture events shared with stage1 and display_live_feed.py
+bus = open_signal_bus("live2", base_path)
+# Per-stage timings and queue gauges, off unless MSC_INSTRUMENT is set
+instruments = open_instruments("live2")
 
 def check_ss_signal():
-    return os.path.exists(ssc_path)
+    return bus.check("ssc")
 
 def set_ss_signal():
-    with open(ssy_path, "w") as f:
-        f.write("STOP")
+    bus.set("ssy")
 
 def check_sr_signal():
-    return os.path.exists(src_path)
+    return bus.check("src")
 
 def set_sr_signal():
-    with open(sry_path, "w") as f:
-        f.write("START")
+    bus.set("sry")
 
 def check_stop_signal():
-    return os.path.exists(stop_signal_path)
+    return bus.check("stop_signal")
 
 def set_stop_signal():
-    with open(stop_signal_path, "w") as f:
-        f.write("STOP")
+    bus.set("stop_signal")
 
-def check_cali_signal():
-    return os.path.exists(calic_path)
+def take_captures():
+    # Calibration capture ids announced by the other capture windows since the last call
+    return bus.take_events("capture")
 
-def set_cali_signal():
-    with open(caliy_path, "w") as f:
-        f.write("START")
+def start_capture():
+    capture_id = new_capture_id()
+    bus.emit("capture", capture_id)
+    return capture_id
 
 def clear_folder():
-    for file_path in glob.glob(os.path.join(base_path, "*")):
-        try:
-            os.remove(file_path)
-        except Exception as e:
-            print("Failed to delete")
+    bus.clear_all()
 
 temp_file = "/tmp/temp_file.txt"
 
@@ -91,6 +89,9 @@ camera = dv.io.CameraCapture()
 
 camera.setDavisExposureDuration(timedelta(milliseconds=40))
 
+# Previews are undistorted with cached maps once calibration_solver.py has written a calibration
+undistort = open_undistorter("davis", camera.getCameraName(), camera.getEventResolution())
+
 # Initialize a multi-stream slicer
 slicer = dv.EventMultiStreamSlicer("events")
 
@@ -118,8 +119,6 @@ def display_preview(data):
     # Retrieve event data
     events = data.getEvents("events")
 
-    event_image = visualizer.generateImage(events)
-
     # Retrieve and color convert the latest frame of retrieved frames
     latest_image = None
     if len(frames) > 0:
@@ -133,8 +132,12 @@ def display_preview(data):
         return
 
     # Generate a preview and show the final image
-    cv.imshow("Preview", visualizer.generateImage(events, latest_image))
-    cv.imshow("Event Preview", event_image)
+    with instruments.stage("visualize"):
+        preview = undistort_image(undistort, visualizer.generateImage(events, latest_image))
+        event_preview = undistort_image(undistort, visualizer.generateImage(events), cv.INTER_NEAREST)
+    with instruments.stage("imshow"):
+        cv.imshow("Preview", instruments.overlay(preview))
+        cv.imshow("Event Preview", event_preview)
 
 
 def preview_events(event_slice):
@@ -163,15 +166,14 @@ def preview_events(event_slice):
 
     # cv.imshow("Preview", blended)
 
-    cv.imshow("Event Preview", event_image)
-    cv.imshow("Frame Preview", frame_color)
+    cv.imshow("Event Preview", undistort_image(undistort, event_image, cv.INTER_NEAREST))
+    cv.imshow("Frame Preview", undistort_image(undistort, frame_color))
 
 #slicer = dv.EventStreamSlicer()
 #slicer.doEveryTimeInterval(timedelta(milliseconds=40), preview_events)
 slicer.doEveryTimeInterval(timedelta(milliseconds=33), display_preview)
 
 is_recording = False
-frame_count = 0
 
 eventsAvailable = camera.isEventStreamAvailable()
 framesAvailable = camera.isFrameStreamAvailable()
@@ -184,18 +186,48 @@ triggersAvailable = camera.isTriggerStreamAvailable()
 #     while camera.getNextFrame() is not None:
 #         pass
 
-writer = None
+# The camera is read on its own thread; the main loop only renders what the
+# acquisition thread hands over and the recording thread owns the writer.
+readers = [(stream, instruments.wrap(f"read.{stream}", read, ignore_none=True)) for stream, read in davis_readers(camera)]
+
+preview_queue = DropQueue("preview", 64)
+record_queue = DropQueue("record", 4096)
+
+# Each packet is read once and goes to the slicer/preview and, while recording, to the writer
+acquisition = AcquisitionThread(readers, preview_queue, record_queue, preview_streams={"frames", "events"})
+recorder = RecordingThread(record_queue, instruments.wrap("write", write_davis_packet))
+instruments.watch("preview_queue", lambda: preview_queue.depth)
+instruments.watch("preview_dropped", lambda: preview_queue.dropped)
+instruments.watch("record_queue", lambda: record_queue.depth)
+instruments.watch("record_dropped", lambda: record_queue.dropped)
+
+def start_recording():
+    global is_recording
+    recorder.closed.clear()
+    acquisition.set_recording(True, (OPEN_WRITER, dv.io.MonoCameraWriter(file_path, camera)))
+    is_recording = True
+
+def stop_recording():
+    global is_recording
+    acquisition.set_recording(False, (CLOSE_WRITER, None))
+    if record_queue.depth > 1:
+        print(f"Flushing {record_queue.depth - 1} packets to {file_path}")
+    # Wait until the recording thread has released the writer so the file is complete
+    while not recorder.closed.wait(0.1) and recorder.is_alive():
+        pass
+    is_recording = False
+    print(format_queue_stats(preview_queue))
+    print(format_queue_stats(record_queue))
+    for line in format_recording_report(recording_report(acquisition, recorder)):
+        print(line)
 
 def toggle_recording():
-    global is_recording, writer
     if not is_recording:
-        writer = dv.io.MonoCameraWriter(file_path, camera)
+        start_recording()
         print(f"Recording started and saving to {file_path}")
-        is_recording = True
     else:
+        stop_recording()
         print(f"Recording stopped, file saved to {file_path}")
-        del writer
-        is_recording = False
 
 # start_time = time.time()
 # print("Waiting for camera to initialize...")
@@ -204,41 +236,42 @@ def toggle_recording():
 #     camera.getNextFrame()  
 # print("Done")
 
-while True:
-    frame = camera.getNextFrame()
-    if frame is not None and frame.image is not None:
-        frame_ready = True
-        last_valid_frame = frame
-        slicer.accept("frames", [frame])
-        cv.imshow("Frame Preview", frame.image)
-    else:
-        frame_ready = False
-
-    events = camera.getNextEventBatch()
-    if events is not None:
-        slicer.accept("events", events)
+acquisition.start()
+recorder.start()
+last_valid_frame = None
 
-    key = cv.waitKey(1) & 0xFF
-    if key == ord('q') or key == 27 or check_stop_signal(): 
+while True:
+    instruments.tick()
+    # Includes the slicer callbacks, which are also timed on their own as visualize / imshow
+    with instruments.stage("slice"):
+        for stream, packet in preview_queue.get_all():
+            if stream == "frames":
+                if packet.image is not None:
+                    last_valid_frame = packet
+                    slicer.accept("frames", [packet])
+                    cv.imshow("Frame Preview", undistort_image(undistort, packet.image))
+            elif stream == "events":
+                slicer.accept("events", packet)
+
+    with instruments.stage("waitKey"):
+        key = cv.waitKey(1) & 0xFF
+    with instruments.stage("signals"):
+        stop_signal = check_stop_signal()
+        captures = take_captures()
+    if key == ord('q') or key == 27 or stop_signal: 
         break
     
-    if key == ord('c') or check_cali_signal():
-        if check_cali_signal():
-            if last_valid_frame is not None and last_valid_frame.image is not None:
-                timestamp_str = datetime.datetime.now().strftime("%Y%m%d")
-                frame_filename = os.path.join(cali_path, f"{timestamp_str}_{frame_count + 1}.png")
-                cv.imwrite(frame_filename, last_valid_frame.image)
-                print(f"Saved Frame: {frame_filename}")
-                frame_count += 1
-                clear_folder()
+    # Every capture, from this window or another one, is saved under its id so that
+    # calibration_solver.py pairs it with the ZED / DVSense image of the same capture
+    if key == ord('c'):
+        captures.append(start_capture())
+    for capture_id in captures:
+        if last_valid_frame is not None and last_valid_frame.image is not None:
+            frame_filename = os.path.join(cali_path, f"{capture_id}.png")
+            cv.imwrite(frame_filename, last_valid_frame.image)
+            print(f"Saved Frame: {frame_filename}")
         else:
-            set_cali_signal()
-            if last_valid_frame is not None and last_valid_frame.image is not None:
-                timestamp_str = datetime.datetime.now().strftime("%Y%m%d")
-                frame_filename = os.path.join(cali_path, f"{timestamp_str}_{frame_count + 1}.png")
-                cv.imwrite(frame_filename, last_valid_frame.image)
-                print(f"Saved Frame: {frame_filename}")
-                frame_count += 1
+            print(f"No frame yet, calibration capture {capture_id} skipped")
         
     # if key == ord('c') or check_cali_signal():
     #     if check_cali_signal():
@@ -256,36 +289,34 @@ while True:
     #         print(f"Saved Frame: {frame_filename}")
     #         frame_count += 1
 
-    if key == ord(' ') or check_sr_signal() or check_ss_signal():  
-        if(check_ss_signal() and not key == ord(' ')):
+    with instruments.stage("signals"):
+        sr_signal = check_sr_signal()
+        ss_signal = check_ss_signal()
+    if key == ord(' ') or sr_signal or ss_signal:  
+        if(ss_signal and not key == ord(' ')):
            if(is_recording):
+               stop_recording()
                print(f"P1.Recording stopped, file saved to {file_path}")
-               del writer
-               is_recording = False
                clear_folder()
-        elif(check_sr_signal() and not key == ord(' ')):
+        elif(sr_signal and not key == ord(' ')):
             if(not is_recording):
-                writer = dv.io.MonoCameraWriter(file_path, camera)
+                start_recording()
                 print(f"P2.Recording started and saving to {file_path}")
-                is_recording = True
-        elif(key == ord(' ') and not check_sr_signal() and not check_ss_signal()):
+        elif(key == ord(' ') and not sr_signal and not ss_signal):
             if(is_recording):
                 set_ss_signal()
-                is_recording = False
+                stop_recording()
                 print(f"P3.Recording stopped, file saved to {file_path}")
-                del writer
             else:
                 set_sr_signal()
-                is_recording = True
-                writer = dv.io.MonoCameraWriter(file_path, camera)
+                start_recording()
                 print(f"P4.Recording started and saving to {file_path}")
-        elif(key == ord(' ') and check_sr_signal() and not check_ss_signal()):
+        elif(key == ord(' ') and sr_signal and not ss_signal):
             if(is_recording):
                 clear_folder()
                 set_ss_signal()
-                is_recording = False
+                stop_recording()
                 print(f"P5.Recording stopped, file saved to {file_path}")
-                del writer
             # else:
             #     set_sr_signal()
             #     is_recording = True
@@ -303,32 +334,14 @@ while True:
         #         writer = dv.io.MonoCameraWriter(file_path, camera)
         #         print(f"Recording started and saving to {file_path}")
 
-
-    if is_recording:
-
-        if framesAvailable:
-            frame = camera.getNextFrame()
-            if frame is not None:
-                frame_ready = True
-                writer.writeFrame(frame, streamName='frames')
-            else:
-                frame_ready = False
-
-        if eventsAvailable:
-            events = camera.getNextEventBatch()
-            if events is not None:
-                slicer.accept(events)
-                writer.writeEvents(events, streamName='events')
-
-        if imuAvailable:
-            imus = camera.getNextImuBatch()
-            if imus is not None:
-                writer.writeImuPacket(imus, streamName='imu')
-
-        if triggersAvailable:
-            triggers = camera.getNextTriggerBatch()
-            if triggers is not None:
-                writer.writeTriggerPacket(triggers, streamName='triggers')
+acquisition.stop()
+if is_recording:
+    stop_recording()
+    print(f"Recording stopped, file saved to {file_path}")
+recorder.stop()
+acquisition.join()
+recorder.join()
+instruments.close()
 
 cv.destroyAllWindows()
 del camera
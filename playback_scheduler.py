@@ -0,0 +1,150 @@
+import time
+
+# Wall-clock pacing for the recording players. A media timestamp t (us) is due at
+#     anchor_wall + (t - anchor_media) / speed
+# on the monotonic clock, so time spent decoding and rendering is absorbed instead of
+# being added on top of every inter-frame gap. A frame that is already more than
+# drop_after_us (media time) past its deadline is reported as not due and the caller
+# skips rendering it. speed=None plays as fast as possible: nothing waits, nothing drops.
+
+SPEEDS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0)
+DEFAULT_DROP_AFTER_US = 50_000
+
+
+def parse_speed(value):
+    # argparse type for --speed: a multiplier between 0.25 and 16, or "max"
+    if str(value).lower() in ("max", "fast", "0"):
+        return None
+    speed = float(value)
+    if not SPEEDS[0] <= speed <= SPEEDS[-1]:
+        raise ValueError(f"speed must be between {SPEEDS[0]} and {SPEEDS[-1]}, or 'max'")
+    return speed
+
+
+def format_speed(speed):
+    return "max" if speed is None else f"{speed:g}x"
+
+
+class PlaybackScheduler:
+    def __init__(self, speed=1.0, drop_after_us=DEFAULT_DROP_AFTER_US, clock=time.monotonic):
+        self.speed = speed
+        self.drop_after_us = drop_after_us
+        self.clock = clock
+        self.anchor_wall = None
+        self.anchor_media = None
+        self.last_media = None
+        self.shown = 0
+        self.dropped = 0
+        # Media time and wall time covered since the last restart, summed over segments
+        self._media_elapsed = 0
+        self._wall_elapsed = 0.0
+        self._segment_start = None
+
+    @property
+    def started(self):
+        return self.anchor_wall is not None
+
+    def anchor(self, media_ts, wall=None):
+        # Media timestamp media_ts is "now"; also used to follow an external master clock
+        self._close_segment()
+        self.anchor_wall = self.clock() if wall is None else wall
+        self.anchor_media = media_ts
+        self._segment_start = (self.anchor_wall, media_ts)
+
+    def restart(self):
+        # After a seek or rewind: the next timestamp passed in becomes the new anchor
+        self._close_segment()
+        self.anchor_wall = None
+        self.anchor_media = None
+
+    def set_speed(self, speed):
+        if self.last_media is not None and self.started:
+            self.anchor(self.last_media)
+        self.speed = speed
+
+    def faster(self):
+        if self.speed is not None:
+            faster = [s for s in SPEEDS if s > self.speed]
+            self.set_speed(faster[0] if faster else None)
+        return self.speed
+
+    def slower(self):
+        if self.speed is None:
+            self.set_speed(SPEEDS[-1])
+        else:
+            slower = [s for s in SPEEDS if s < self.speed]
+            self.set_speed(slower[-1] if slower else self.speed)
+        return self.speed
+
+    def toggle_max(self):
+        self.set_speed(1.0 if self.speed is None else None)
+        return self.speed
+
+    def deadline(self, media_ts):
+        if self.speed is None:
+            return self.clock()
+        return self.anchor_wall + (media_ts - self.anchor_media) / 1e6 / self.speed
+
+    def lag_us(self, media_ts):
+        # How far (in media time) playback is behind media_ts; negative when ahead
+        if self.speed is None:
+            return 0
+        return (self.clock() - self.deadline(media_ts)) * 1e6 * self.speed
+
+    def due(self, media_ts):
+        # True if the frame should be rendered, False if it is late and should be dropped
+        if not self.started:
+            self.anchor(media_ts)
+        self.last_media = media_ts
+        if self.lag_us(media_ts) > self.drop_after_us:
+            self.dropped += 1
+            return False
+        self.shown += 1
+        return True
+
+    def wait_s(self, media_ts):
+        if not self.started or self.speed is None:
+            return 0.0
+        return max(0.0, self.deadline(media_ts) - self.clock())
+
+    def wait_ms(self, media_ts, max_ms=None):
+        # For cv.waitKey(): at least 1 ms, because 0 would block until a key is pressed
+        ms = int(self.wait_s(media_ts) * 1000)
+        if max_ms is not None:
+            ms = min(ms, max_ms)
+        return max(1, ms)
+
+    def sleep_until(self, media_ts, max_s=1.0):
+        remaining = min(self.wait_s(media_ts), max_s)
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def _close_segment(self):
+        if self._segment_start is None or self.last_media is None:
+            self._segment_start = None
+            return
+        wall0, media0 = self._segment_start
+        if self.last_media >= media0:
+            self._media_elapsed += self.last_media - media0
+            self._wall_elapsed += self.clock() - wall0
+        self._segment_start = None
+
+    def stats(self):
+        media = self._media_elapsed
+        wall = self._wall_elapsed
+        if self._segment_start is not None and self.last_media is not None:
+            wall0, media0 = self._segment_start
+            if self.last_media >= media0:
+                media += self.last_media - media0
+                wall += self.clock() - wall0
+        achieved = media / 1e6 / wall if wall > 0 else None
+        return {"target_speed": self.speed, "achieved_speed": achieved,
+                "shown": self.shown, "dropped": self.dropped,
+                "shown_fps": self.shown / wall if wall > 0 else None}
+
+
+def format_scheduler_stats(stats):
+    achieved = "n/a" if stats["achieved_speed"] is None else f"{stats['achieved_speed']:.2f}x"
+    fps = "n/a" if stats["shown_fps"] is None else f"{stats['shown_fps']:.1f}"
+    return (f"Playback speed: target {format_speed(stats['target_speed'])}, achieved {achieved}, "
+            f"shown {stats['shown']} ({fps} fps), dropped {stats['dropped']}")
@@ -6,6 +6,13 @@ import time
 import argparse
 import numpy as np
 from pathlib import Path
+from signal_bus import open_signal_bus
+from shared_clock import ClockReader, DAVIS_CLOCK_NAME
+from sync_estimator import load_sync, sync_path_for
+from depth_render import DepthRenderer, DEFAULT_MAX_DEPTH_MM
+from playback_scheduler import PlaybackScheduler, parse_speed, format_scheduler_stats
+from undistort_maps import open_undistorter, undistort_image
+from instrumentation import open_instruments
 
 # --- Absolute Paths Setup ---
 script_dir_path = Path(os.path.abspath(__file__)).parent
@@ -18,20 +25,30 @@ print(f"Debug (Python): Constructed video_folder: {video_folder}")
 print(f"Debug (Python): Constructed TEMP_FOLDER: {TEMP_FOLDER}")
 print("-" * 50)
 
-# --- File-based Communication Setup ---
-DVSENSE_READY_FILE = TEMP_FOLDER / 'dvsense_ready.txt'
+# --- Signal and Timestamp Setup ---
+# The master clock is the DAVIS player (read2.py) when a sync model exists: its frame
+# timestamps are in .aedat4 time, the domain the model maps the ZED frames into. Without
+# a model the DVSense clock from stage1 is compared with raw ZED time as before. There is
+# no DVSense<->DAVIS mapping, so the DVSense clock is never used with a sync model. The
+# DVSense clock is read from shared memory; the file is only used when stage1 could not
+# create the shared block
 DVSENSE_TIMESTAMP_FILE = TEMP_FOLDER / 'dvsense_timestamp.txt'
-DVSENSE_REWIND_FILE = TEMP_FOLDER / 'dvsense_rewind.txt'
-STOP_SIGNAL_FILE = TEMP_FOLDER / 'stop_signal.txt'
 
-# --- Helper Functions ---
-def check_file_signal(file_path):
-    return Path(file_path).exists()
+# Ready/rewind/stop signals shared with the DVSense player (stage1)
+bus = open_signal_bus("playback_svo", TEMP_FOLDER)
 
-def clear_file_signal(file_path):
-    if Path(file_path).exists():
-        Path(file_path).unlink()
+# A master clock value is only followed when it lies within the recording's time span
+# (in the time domain the frames are paced in) give or take this margin; anything else
+# is another clock domain and the local clock is used instead
+CLOCK_DOMAIN_MARGIN_US = 2_000_000
+# A due frame further ahead of the scheduler's clock than this means the clocks disagree:
+# the scheduler is re-anchored on the frame instead of sleeping towards it
+MAX_AHEAD_US = 1_000_000
+# A master clock further than this from the last frame has seeked (scrubbing, replay),
+# and the SVO is moved to the matching frame
+MAX_JUMP_US = 1_000_000
 
+# --- Helper Functions ---
 def read_timestamp_from_file():
     if Path(DVSENSE_TIMESTAMP_FILE).exists():
         try:
@@ -42,7 +59,8 @@ def read_timestamp_from_file():
     return None
 
 # --- Main Function ---
-def run(svo_filename):
+def run(svo_filename, max_depth=DEFAULT_MAX_DEPTH_MM, fixed_depth_range=False, speed=1.0, undistort=True,
+        rectify=False):
     zed = sl.Camera()
     input_file = video_folder / svo_filename
 
@@ -52,6 +70,11 @@ def run(svo_filename):
 
     print(f"Loading ZED video: {input_file.name}")
 
+    # Clock offset/drift estimated offline by sync_estimator.py, if available
+    sync = load_sync(sync_path_for(input_file))
+    if sync is not None:
+        print(f"Using clock sync: offset {sync.offset_us:.0f} us, drift {sync.drift * 1e6:.2f} ppm")
+
     input_type = sl.InputType()
     input_type.set_from_svo_file(str(input_file))
 
@@ -72,26 +95,53 @@ def run(svo_filename):
     depth_zed = sl.Mat(image_size.width, image_size.height, sl.MAT_TYPE.F32_C1)
 
     runtime = sl.RuntimeParameters()
+    if sync is not None:
+        master_clock, master_name = ClockReader(DAVIS_CLOCK_NAME), "DAVIS"
+    else:
+        master_clock, master_name = ClockReader(), "DVSense"
+    # Paces frames against the master clock while it is published and in the frames' time
+    # domain, on its own at --speed otherwise. Frames that are already late are grabbed but
+    # not retrieved or shown.
+    scheduler = PlaybackScheduler(speed)
+    last_master_timestamp = None
+    master_out_of_domain = False
+    last_frame_ts = None
+    at_end = False
+    # Per-stage timings and playback lag, off unless MSC_INSTRUMENT is set
+    instruments = open_instruments("playback_svo")
+    instruments.watch("dropped_frames", lambda: scheduler.dropped)
 
     # Set desired display window size
     DISPLAY_WIDTH = 640
     DISPLAY_HEIGHT = 360
 
+    # Depth is shrunk to the window size before it is normalized
+    depth_renderer = DepthRenderer(DISPLAY_WIDTH, DISPLAY_HEIGHT, max_depth, fixed_depth_range)
+
+    # With a calibration, one cached remap undistorts the full size image and scales it to
+    # the window; the depth preview gets the same correction at window size
+    image_map = depth_map = None
+    if undistort:
+        serial = zed.get_camera_information().serial_number
+        image_map = open_undistorter("zed", serial, (image_size.width, image_size.height),
+                                     (DISPLAY_WIDTH, DISPLAY_HEIGHT), rectify=rectify)
+        if image_map is not None:
+            depth_map = open_undistorter("zed", serial, (DISPLAY_WIDTH, DISPLAY_HEIGHT), rectify=rectify)
+
     cv2.namedWindow("ZED Image", cv2.WINDOW_NORMAL)
     cv2.namedWindow("ZED Depth", cv2.WINDOW_NORMAL)
     cv2.resizeWindow("ZED Image", DISPLAY_WIDTH, DISPLAY_HEIGHT)
     cv2.resizeWindow("ZED Depth", DISPLAY_WIDTH, DISPLAY_HEIGHT)
 
     print('Waiting for DVSense to be ready...')
-    while not check_file_signal(DVSENSE_READY_FILE) and not check_file_signal(STOP_SIGNAL_FILE):
-        time.sleep(0.05)
+    bus.wait_for(["dvsense_ready", "stop_signal"])
 
-    if check_file_signal(STOP_SIGNAL_FILE):
+    if bus.check("stop_signal"):
         print("Stop signal received before start.")
         zed.close()
         sys.exit(0)
 
-    clear_file_signal(DVSENSE_READY_FILE)
+    bus.clear("dvsense_ready")
     print("Starting playback...")
 
     zed.set_svo_position(0)
@@ -106,51 +156,97 @@ def run(svo_filename):
         print("Failed to grab first frame.")
     
     print(f"Start timestamp: {first_timestamp} μs")
-
-    while not check_file_signal(STOP_SIGNAL_FILE):
-        if check_file_signal(DVSENSE_REWIND_FILE):
+    to_media = sync.zed_to_dvs if sync is not None else (lambda t: t)
+    to_zed = sync.dvs_to_zed if sync is not None else (lambda t: t)
+    frame_count = zed.get_svo_number_of_frames()
+    duration_us = max(0, frame_count - 1) * 1e6 / camera_fps
+    media_span = (to_media(first_timestamp) - CLOCK_DOMAIN_MARGIN_US,
+                  to_media(first_timestamp + duration_us) + CLOCK_DOMAIN_MARGIN_US)
+
+    while True:
+        instruments.tick()
+        with instruments.stage("signals"):
+            stop_signal = bus.check("stop_signal")
+            rewind_signal = not stop_signal and bus.check("dvsense_rewind")
+        if stop_signal:
+            break
+        if rewind_signal:
             zed.set_svo_position(0)
+            scheduler.restart()
+            last_frame_ts = None
             print("Rewind signal received.")
-            clear_file_signal(DVSENSE_REWIND_FILE)
-
-        dvsense_timestamp = read_timestamp_from_file()
-        err = zed.grab(runtime)
+            bus.clear("dvsense_rewind")
+
+        master_timestamp = master_clock.latest()
+        if sync is None and not master_clock.attached:
+            master_timestamp = read_timestamp_from_file()
+        if master_timestamp and master_timestamp != last_master_timestamp:
+            last_master_timestamp = master_timestamp
+            if media_span[0] <= master_timestamp <= media_span[1]:
+                # The master player's latest timestamp is "now"
+                scheduler.anchor(master_timestamp)
+                master_out_of_domain = False
+                if last_frame_ts is not None and abs(master_timestamp - last_frame_ts) > MAX_JUMP_US:
+                    position = round((to_zed(master_timestamp) - first_timestamp) * camera_fps / 1e6)
+                    if 0 <= position < frame_count:
+                        zed.set_svo_position(position)
+                        last_frame_ts = None
+                        at_end = False
+                        print(f"{master_name} clock jumped to {master_timestamp} us, seeking to frame {position}")
+            elif not master_out_of_domain:
+                print(f"{master_name} clock {master_timestamp} us is outside this recording's time span "
+                      f"{media_span[0]:.0f}..{media_span[1]:.0f} us, pacing on the local clock")
+                master_out_of_domain = True
+        # Includes SVO decoding and depth computation
+        with instruments.stage("grab"):
+            err = zed.grab(runtime)
 
         if err == sl.ERROR_CODE.SUCCESS:
-            zed.retrieve_image(image_zed, sl.VIEW.LEFT, sl.MEM.CPU, image_size)
-            zed.retrieve_measure(depth_zed, sl.MEASURE.DEPTH, sl.MEM.CPU, image_size)
-
-            image_ocv = image_zed.get_data()
-            depth_data = depth_zed.get_data()
-
-            # Process depth data to grayscale
-            valid_mask = np.logical_and(np.isfinite(depth_data), depth_data > 0)
-            depth_valid = np.where(valid_mask, depth_data, 0)
-            depth_clipped = np.clip(depth_valid, 0, 5000)  # Limit to 5 meters
-
-            if np.count_nonzero(depth_clipped) == 0:
-                depth_gray = np.zeros((depth_data.shape[0], depth_data.shape[1]), dtype=np.uint8)
-            else:
-                depth_normalized = cv2.normalize(depth_clipped, None, 0, 255, cv2.NORM_MINMAX)
-                depth_gray = depth_normalized.astype(np.uint8)
-
             current_ts = zed.get_timestamp(sl.TIME_REFERENCE.IMAGE).get_microseconds()
-            if dvsense_timestamp and current_ts:
-                time_diff = current_ts - dvsense_timestamp
-                if time_diff > 50000:
-                    time.sleep(0.01)
-
-            # Resize frames before showing
-            image_small = cv2.resize(image_ocv, (DISPLAY_WIDTH, DISPLAY_HEIGHT))
-            depth_small = cv2.resize(depth_gray, (DISPLAY_WIDTH, DISPLAY_HEIGHT))
-
-            cv2.imshow("ZED Image", image_small)
-            cv2.imshow("ZED Depth", depth_small)
+            current_ts = to_media(current_ts)
+            last_frame_ts = current_ts
+            at_end = False
+            if scheduler.due(current_ts):
+                lag_us = scheduler.lag_us(current_ts)
+                instruments.gauge("lag_ms", lag_us / 1e3)
+                if lag_us < -MAX_AHEAD_US:
+                    # The clocks disagree, follow the frames instead of sleeping up to max_s on each
+                    scheduler.anchor(current_ts)
+                with instruments.stage("wait"):
+                    scheduler.sleep_until(current_ts, max_s=0.1)
+                with instruments.stage("retrieve"):
+                    zed.retrieve_image(image_zed, sl.VIEW.LEFT, sl.MEM.CPU, image_size)
+                    zed.retrieve_measure(depth_zed, sl.MEASURE.DEPTH, sl.MEM.CPU, image_size)
+
+                image_ocv = image_zed.get_data()
+                depth_data = depth_zed.get_data()
+
+                # Resize frames before showing
+                with instruments.stage("visualize"):
+                    if image_map is not None:
+                        image_small = image_map.apply(image_ocv)
+                    else:
+                        image_small = cv2.resize(image_ocv, (DISPLAY_WIDTH, DISPLAY_HEIGHT))
+                with instruments.stage("depth"):
+                    depth_small = undistort_image(depth_map, depth_renderer.render(depth_data), cv2.INTER_NEAREST)
+
+                with instruments.stage("imshow"):
+                    cv2.imshow("ZED Image", instruments.overlay(image_small))
+                    cv2.imshow("ZED Depth", depth_small)
 
         elif err == sl.ERROR_CODE.END_OF_SVOFILE_REACHED:
-            print("End of SVO file reached.")
-            while not check_file_signal(DVSENSE_REWIND_FILE) and not check_file_signal(STOP_SIGNAL_FILE):
-                time.sleep(0.05)
+            if sync is not None and master_clock.attached:
+                # The DAVIS player replays and scrubs without a rewind signal; its clock
+                # jumping back into the recording seeks the SVO
+                if not at_end:
+                    print("End of SVO file reached, following the DAVIS clock.")
+                    at_end = True
+                time.sleep(0.01)
+            else:
+                print("End of SVO file reached.")
+                bus.wait_for(["dvsense_rewind", "stop_signal"])
+                scheduler.restart()
+                last_frame_ts = None
 
         elif err == sl.ERROR_CODE.NOT_A_NEW_FRAME:
             time.sleep(0.001)
@@ -158,15 +254,22 @@ def run(svo_filename):
             print(f"Grab error: {err}")
             break
 
-        key = cv2.waitKey(1)
+        with instruments.stage("waitKey"):
+            key = cv2.waitKey(1)
         if key & 0xFF == ord('q'):
             print("Quit requested.")
-            with open(STOP_SIGNAL_FILE, 'w') as f:
-                f.write("STOP")
+            bus.set("stop_signal")
             break
 
     cv2.destroyAllWindows()
+    instruments.close()
     zed.close()
+    print(format_scheduler_stats(scheduler.stats()))
+    latency = master_clock.latency_summary()
+    if latency is not None:
+        print(f"{master_name} clock publish-to-observe latency: p50 {latency['p50_us']:.1f} us, "
+              f"p99 {latency['p99_us']:.1f} us, max {latency['max_us']:.1f} us over {latency['count']} updates")
+    master_clock.close()
     print("Playback finished.")
 
 # --- Main Execution ---
@@ -176,6 +279,14 @@ if __name__ == "__main__":
 
         parser = argparse.ArgumentParser(description="Play ZED .svo2 video with RGB and depth (grayscale).")
         parser.add_argument("raw_filename", help="Filename of the corresponding .raw file")
+        parser.add_argument("--max-depth-mm", type=float, default=DEFAULT_MAX_DEPTH_MM, help="Depth shown as white")
+        parser.add_argument("--fixed-depth-range", action="store_true",
+                            help="Scale depth by 0..max-depth-mm instead of stretching each frame")
+        parser.add_argument("--speed", type=parse_speed, default=1.0,
+                            help="0.25 to 16, or 'max'; used while no master clock is published")
+        parser.add_argument("--raw", action="store_true", help="Show the previews without undistortion")
+        parser.add_argument("--rectify", action="store_true",
+                            help="Rectify to the DAVIS/ZED stereo pair, not just undistort")
 
         args = parser.parse_args()
         if not args.raw_filename.endswith(".raw"):
@@ -185,7 +296,7 @@ if __name__ == "__main__":
         base_name = os.path.splitext(args.raw_filename)[0]
         svo_filename = base_name + ".svo2"
 
-        run(svo_filename)
+        run(svo_filename, args.max_depth_mm, args.fixed_depth_range, args.speed, not args.raw, args.rectify)
 
     except KeyboardInterrupt:
         print("\nInterrupted by user.")
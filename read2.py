@@ -3,6 +3,19 @@ import cv2 as cv
 import os
 import sys
 import glob
+import argparse
+from recording_index import print_index_summary
+from recording_seek import SeekableRecording, SCRUB_KEYS, SCRUB_HELP
+from signal_bus import open_signal_bus
+from playback_scheduler import PlaybackScheduler, parse_speed, format_speed, format_scheduler_stats
+from undistort_maps import open_undistorter, undistort_image
+from depth_registration import SvoDepthReader, load_registration, depth_overlay
+from sync_estimator import load_sync, sync_path_for
+from event_store import open_event_store
+from event_archive import is_archive
+from event_accumulation import EventAccumulator
+from instrumentation import open_instruments
+from shared_clock import ClockWriter, DAVIS_CLOCK_NAME
 
 # base_path = "D:/Programs/DV/Recording/"
 
@@ -72,7 +85,32 @@ def display_preview(data):
         return
 
     # Generate a preview and show the final image
-    cv.imshow("Preview", visualizer.generateImage(events, latest_image))
+    with instruments.stage("visualize"):
+        preview = render_events(events, latest_image)
+    if depth_reader is not None:
+        # ZED depth at this frame's time, registered into the DAVIS image
+        with instruments.stage("depth"):
+            depth = depth_reader.depth_at(frames[-1].timestamp)
+            if depth is not None:
+                preview = depth_overlay(preview, registration.register(depth))
+    with instruments.stage("imshow"):
+        cv.imshow("Preview", instruments.overlay(undistort_image(undistort, preview)))
+
+def events_between(start_timestamp, end_timestamp):
+    # Zero-copy column slices of the converted event store when there is one,
+    # otherwise decoded from the recording
+    if store is not None:
+        return store.events_between(start_timestamp, end_timestamp)
+    return player.recording.getEventsTimeRange(start_timestamp, end_timestamp)
+
+def render_events(events, background=None):
+    if store is not None:
+        if background is None:
+            return accumulator.polarity_image(events)
+        return accumulator.polarity_overlay(events, background)
+    if background is None:
+        return visualizer.generateImage(events)
+    return visualizer.generateImage(events, background)
 
 class FakeSlicedPacket:
     def __init__(self, events, frames):
@@ -115,64 +153,90 @@ def preview_events_both(event_slice):
 
     blended = cv.addWeighted(frame_color, 1.0, event_image, 0.5, 0)
 
-    cv.imshow("Preview", blended)
+    cv.imshow("Preview", undistort_image(undistort, blended))
 
 
 running = True 
 first_playback = True
 
 base_path = "D:/Programs/DV/Recording/temp"
-stop_signal_path = "D:/Programs/DV/Recording/temp/stop_signal.txt"
+bus = open_signal_bus("read2", base_path)
+# Per-stage timings and playback lag, off unless MSC_INSTRUMENT is set
+instruments = open_instruments("read2")
 
 def check_stop_signal():
-    return os.path.exists(stop_signal_path)
+    return bus.check("stop_signal")
 
 def set_stop_signal():
-    with open(stop_signal_path, "w") as f:
-        f.write("STOP")
+    bus.set("stop_signal")
+
+parser = argparse.ArgumentParser(description="Play back the DAVIS recording named in temp_file.txt.")
+parser.add_argument("--speed", type=parse_speed, default=1.0, help="0.25 to 16, or 'max' for as fast as possible")
+parser.add_argument("--raw", action="store_true", help="Show the previews without undistortion")
+parser.add_argument("--rectify", action="store_true", help="Rectify to the DAVIS/ZED stereo pair, not just undistort")
+parser.add_argument("--no-store", action="store_true", help="Decode events from the .aedat4 even if it was converted")
+parser.add_argument("--depth-svo", help="Overlay the depth of this matching .svo2 on the Preview window")
+args = parser.parse_args()
 
 temp_file = "D:/Programs/DV/Recording/temp/temp_file.txt"
 
 with open(temp_file, "r") as f:
     file_path = f.read().strip()
 
+# Opened once: replay and scrubbing seek within the same reader
+player = SeekableRecording(file_path)
+
+# Events from the memory-mapped store written by event_store.py, if the recording was
+# converted; an event archive serves the same column slices itself
+store = accumulator = None
+if is_archive(file_path):
+    store = player.recording
+elif not args.no_store:
+    store = open_event_store(file_path)
+if store is not None:
+    accumulator = EventAccumulator(*player.recording.getEventResolution())
+    print(f"Reading events from {store.path}")
+
+# Cached undistortion maps for the camera the recording was made with
+undistort = None
+if not args.raw:
+    undistort = open_undistorter("davis", player.recording.getCameraName(), player.recording.getEventResolution(),
+                                 rectify=args.rectify)
+
+# ZED depth registered into the DAVIS image, in DAVIS time through the clock sync model
+depth_reader = registration = None
+if args.depth_svo:
+    depth_reader = SvoDepthReader(args.depth_svo, load_sync(sync_path_for(args.depth_svo)))
+    registration = load_registration(depth_reader.size)
+    if registration is None:
+        print("No stereo calibration yet, depth overlay disabled")
+        depth_reader.close()
+        depth_reader = None
+print(SCRUB_HELP + ", 'r' = restart, '-' / '+' = speed, 'f' = toggle as fast as possible")
+
+# Frames are paced against wall-clock deadlines; late frames are skipped, not rendered
+scheduler = PlaybackScheduler(args.speed)
+instruments.watch("dropped_frames", lambda: scheduler.dropped)
+# The timestamp of every rendered frame is published for playback_svo.py, which maps it
+# to ZED time with the sync model and follows it, seeks included
+davis_clock = ClockWriter(DAVIS_CLOCK_NAME)
+
 while running: 
-    recording = dv.io.MonoCameraRecording(file_path)
+    player.rewind()
+    scheduler.restart()
+    recording = player.recording
 
     assert recording.isEventStreamAvailable()
     assert recording.isFrameStreamAvailable()
     assert recording.getFrameResolution() == recording.getEventResolution()
 
     if first_playback:
-        event_batches = []
-        while True:
-            events = recording.getNextEventBatch()
-            if events is None or len(events) == 0:
-                break
-            event_batches.append(events)
-
-        if len(event_batches) > 0:
-            start_events = list(event_batches[0])  
-            end_events = list(event_batches[-1]) 
-
-            if len(start_events) > 0 and len(end_events) > 0:
-                start_timestamp_events = start_events[0].timestamp()
-                end_timestamp_events = end_events[-1].timestamp()
-                print(f"Event Start Timestamp: {start_timestamp_events}")
-                print(f"Event End Timestamp: {end_timestamp_events}")
-            else:
-                print("No valid events found!")
-
-        frame = recording.getNextFrame()
-        if frame is not None:
-            start_timestamp_frames = frame.timestamp
-            while frame is not None:
-                end_timestamp_frames = frame.timestamp
-                frame = recording.getNextFrame()
-            print(f"Frame Start Timestamp: {start_timestamp_frames}")
-            print(f"Frame End Timestamp: {end_timestamp_frames}")
-        else:
-            print("No frames found!")
+        # Start/end timestamps come from the sidecar index instead of a full decoding pass
+        index = player.index
+        print_index_summary(index)
+        if index.has_frames:
+            start_timestamp_frames = index.frame_start
+            end_timestamp_frames = index.frame_end
 
         first_playback = False
     
@@ -185,10 +249,13 @@ while running:
     # visualizer.setNegativeColor((0, 0, 255))
 
     def preview_events(event_slice):
-        cv.imshow("Event Preview", visualizer.generateImage(event_slice))
+        with instruments.stage("visualize"):
+            event_image = undistort_image(undistort, render_events(event_slice), cv.INTER_NEAREST)
+        with instruments.stage("imshow"):
+            cv.imshow("Event Preview", event_image)
 
     lastFrame = None
-    frame = recording.getNextFrame()
+    frame = player.next_frame()
 
     # start_timestamp = frame.timestamp
     # end_timestamp = lastFrame.timestamp
@@ -196,17 +263,25 @@ while running:
     # print(f"End Timestamp: {end_timestamp}")
 
 
+    # lastFrame is the last frame that was rendered: a frame that is skipped because it is
+    # late leaves it in place, so the next rendered slice still holds the skipped events
     while frame is not None:
-        if lastFrame is not None:
-            delay = frame.timestamp - lastFrame.timestamp
-
-            events = recording.getEventsTimeRange(lastFrame.timestamp, frame.timestamp)
+        instruments.tick()
+        wait_ms = 1
+        if lastFrame is None:
+            lastFrame = frame
+        elif scheduler.due(frame.timestamp):
+            instruments.gauge("lag_ms", scheduler.lag_us(frame.timestamp) / 1e3)
+            with instruments.stage("slice"):
+                events = events_between(lastFrame.timestamp, frame.timestamp)
             preview_events(events)
 
             if len(frame.image.shape) > 2:
                 frame.image = cv.cvtColor(frame.image, cv.COLOR_BGR2GRAY)
 
-            cv.imshow("Frame Preview", frame.image)
+            with instruments.stage("imshow"):
+                cv.imshow("Frame Preview", undistort_image(undistort, frame.image))
+            davis_clock.publish(frame.timestamp)
 
             if frame.timestamp >= end_timestamp_frames:
                 print("P.Playback finished, replaying")
@@ -215,25 +290,58 @@ while running:
             display_preview(data)
             # preview_events_both(events) 
 
-            key = cv.waitKey(int(delay / 1000)) & 0xFF
-
-            if key == ord('q') or key == 27 or check_stop_signal(): 
-                running = False 
-                break
+            next_timestamp = player.next_timestamp
+            if next_timestamp is None:
+                next_timestamp = frame.timestamp
+            wait_ms = scheduler.wait_ms(next_timestamp)
+            lastFrame = frame
+
+        # Every frame, rendered or skipped, pumps the GUI and checks for quit / scrub keys;
+        # after a rendered one this includes the pacing wait until the next frame is due
+        with instruments.stage("waitKey"):
+            key = cv.waitKey(wait_ms) & 0xFF
+        with instruments.stage("signals"):
+            stop_signal = check_stop_signal()
+
+        if key == ord('q') or key == 27 or stop_signal: 
+            running = False 
+            break
+
+        if key in SCRUB_KEYS or key == ord('r'):
+            if key == ord('r'):
+                player.rewind()
+            else:
+                player.seek_relative(SCRUB_KEYS[key])
+            scheduler.restart()
+            lastFrame = None
+            frame = player.next_frame()
+            if frame is not None:
+                print(f"Seek to {frame.timestamp}")
+            continue
+
+        if key in (ord('+'), ord('='), ord('-'), ord('f')):
+            if key == ord('-'):
+                scheduler.slower()
+            elif key == ord('f'):
+                scheduler.toggle_max()
+            else:
+                scheduler.faster()
+            print(f"Playback speed: {format_speed(scheduler.speed)}")
 
-        lastFrame = frame
-        frame = recording.getNextFrame()
+        with instruments.stage("frame"):
+            frame = player.next_frame()
 
     if not running:
         break  
 
 cv.destroyAllWindows()
+instruments.close()
+davis_clock.close()
+print(format_scheduler_stats(scheduler.stats()))
+if depth_reader is not None:
+    depth_reader.close()
 
 if check_stop_signal():
-    for file_path in glob.glob(os.path.join(base_path, "*")):
-        try:
-            os.remove(file_path)
-        except Exception as e:
-            print("Failed to delete ")
+    bus.clear_all()
 else:
     set_stop_signal()
\ No newline at end of file
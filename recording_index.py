@@ -0,0 +1,155 @@
+import os
+import numpy as np
+
+# Sidecar index for .aedat4 recordings, stored next to the recording as
+# <name>.aedat4.idx.npz and rebuilt whenever the recording's mtime or size changes.
+INDEX_SUFFIX = ".idx.npz"
+INDEX_VERSION = 1
+
+
+def index_path_for(file_path):
+    return file_path + INDEX_SUFFIX
+
+
+class RecordingIndex:
+    def __init__(self, source_mtime_ns, source_size, event_start, event_end,
+                 frame_timestamps, chunk_start, chunk_end, chunk_counts):
+        self.source_mtime_ns = int(source_mtime_ns)
+        self.source_size = int(source_size)
+        self.event_start = int(event_start)
+        self.event_end = int(event_end)
+        self.frame_timestamps = np.asarray(frame_timestamps, dtype=np.int64)
+        self.chunk_start = np.asarray(chunk_start, dtype=np.int64)
+        self.chunk_end = np.asarray(chunk_end, dtype=np.int64)
+        self.chunk_counts = np.asarray(chunk_counts, dtype=np.int64)
+        # Offset of the first event of every chunk within the event stream
+        self.chunk_offsets = np.concatenate(([0], np.cumsum(self.chunk_counts)[:-1])).astype(np.int64)
+
+    @property
+    def has_events(self):
+        return len(self.chunk_counts) > 0
+
+    @property
+    def has_frames(self):
+        return len(self.frame_timestamps) > 0
+
+    @property
+    def frame_start(self):
+        return int(self.frame_timestamps[0])
+
+    @property
+    def frame_end(self):
+        return int(self.frame_timestamps[-1])
+
+    @property
+    def event_count(self):
+        return int(self.chunk_counts.sum())
+
+    def save(self, path):
+        # Write to a temporary file first so a crash never leaves a truncated index behind
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, version=INDEX_VERSION,
+                     source_mtime_ns=self.source_mtime_ns, source_size=self.source_size,
+                     event_start=self.event_start, event_end=self.event_end,
+                     frame_timestamps=self.frame_timestamps, chunk_start=self.chunk_start,
+                     chunk_end=self.chunk_end, chunk_counts=self.chunk_counts)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data["version"]) != INDEX_VERSION:
+                return None
+            return cls(data["source_mtime_ns"], data["source_size"],
+                       data["event_start"], data["event_end"], data["frame_timestamps"],
+                       data["chunk_start"], data["chunk_end"], data["chunk_counts"])
+
+    def matches(self, file_path):
+        st = os.stat(file_path)
+        return st.st_mtime_ns == self.source_mtime_ns and st.st_size == self.source_size
+
+
+def build_index(file_path):
+    import dv_processing as dv
+    st = os.stat(file_path)
+    recording = dv.io.MonoCameraRecording(file_path)
+
+    chunk_start, chunk_end, chunk_counts = [], [], []
+    if recording.isEventStreamAvailable():
+        while True:
+            events = recording.getNextEventBatch()
+            if events is None:
+                break
+            if len(events) == 0:
+                continue
+            # Only the batch bounds are kept, the events themselves are dropped right away
+            chunk_start.append(events.getLowestTime())
+            chunk_end.append(events.getHighestTime())
+            chunk_counts.append(len(events))
+
+    frame_timestamps = []
+    if recording.isFrameStreamAvailable():
+        frame = recording.getNextFrame()
+        while frame is not None:
+            frame_timestamps.append(frame.timestamp)
+            frame = recording.getNextFrame()
+
+    event_start = chunk_start[0] if chunk_start else 0
+    event_end = chunk_end[-1] if chunk_end else 0
+    return RecordingIndex(st.st_mtime_ns, st.st_size, event_start, event_end,
+                          frame_timestamps, chunk_start, chunk_end, chunk_counts)
+
+
+def load_index(file_path, rebuild=False):
+    from event_archive import is_archive, EventArchive
+    if is_archive(file_path):
+        # Archives carry their chunk index and frame table in the footer
+        return EventArchive(file_path).index()
+    path = index_path_for(file_path)
+    if not rebuild and os.path.exists(path):
+        try:
+            index = RecordingIndex.load(path)
+            if index is not None and index.matches(file_path):
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+        print(f"Index out of date, rebuilding: {path}")
+    else:
+        print(f"Building index: {path}")
+
+    index = build_index(file_path)
+    try:
+        index.save(path)
+    except OSError as e:
+        print(f"Failed to save index {path}: {e}")
+    return index
+
+
+def print_index_summary(index):
+    if index.has_events:
+        print(f"Event Start Timestamp: {index.event_start}")
+        print(f"Event End Timestamp: {index.event_end}")
+        print(f"Event duration: {index.event_end - index.event_start}")
+    else:
+        print("No valid events found!")
+
+    if index.has_frames:
+        print(f"Frame Start Timestamp: {index.frame_start}")
+        print(f"Frame End Timestamp: {index.frame_end}")
+        print(f"Frame duration: {index.frame_end - index.frame_start}")
+    else:
+        print("No frames found!")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or refresh the timestamp index of .aedat4 recordings.")
+    parser.add_argument("files", nargs="+", help="Recordings to index")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore any existing index")
+    args = parser.parse_args()
+
+    for file_path in args.files:
+        print(file_path)
+        print_index_summary(load_index(file_path, rebuild=args.rebuild))
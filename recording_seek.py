@@ -0,0 +1,94 @@
+import numpy as np
+from recording_index import load_index
+from event_archive import open_recording
+
+# Random access over the frames of an .aedat4 recording. The sidecar index holds every
+# frame timestamp, so a seek is a binary search over that array and a read is a
+# getFramesTimeRange() call, which the reader serves from the file's packet table
+# instead of decoding from the start. Frames are fetched PREFETCH_FRAMES at a time so
+# forward playback costs one range read per block rather than one per frame. Event
+# archives (event_archive.py) are read through the same calls.
+
+PREFETCH_FRAMES = 32
+
+# Scrubbing keys shared by the players: key -> jump in microseconds
+SCRUB_KEYS = {
+    ord(','): -1_000_000,
+    ord('.'): 1_000_000,
+    ord('['): -10_000_000,
+    ord(']'): 10_000_000,
+}
+SCRUB_HELP = "Scrub: ',' / '.' = -/+1 s, '[' / ']' = -/+10 s"
+
+
+class SeekableRecording:
+    def __init__(self, file_path, index=None, prefetch=PREFETCH_FRAMES):
+        self.file_path = file_path
+        self.recording = open_recording(file_path)
+        self.index = index if index is not None else load_index(file_path)
+        self.frame_timestamps = self.index.frame_timestamps
+        self.prefetch = max(1, prefetch)
+        # Index of the frame next_frame() returns
+        self.position = 0
+        self._cache = {}
+        self._cache_range = (0, 0)
+
+    @property
+    def frame_count(self):
+        return len(self.frame_timestamps)
+
+    @property
+    def at_end(self):
+        return self.position >= self.frame_count
+
+    @property
+    def next_timestamp(self):
+        # Timestamp of the frame next_frame() returns, without reading it
+        return None if self.at_end else int(self.frame_timestamps[self.position])
+
+    def frame_index_at(self, timestamp):
+        # Last frame at or before timestamp (the first frame for earlier timestamps)
+        i = int(np.searchsorted(self.frame_timestamps, timestamp, side="right")) - 1
+        return min(max(i, 0), self.frame_count - 1)
+
+    def seek_frame(self, frame_index):
+        self.position = min(max(int(frame_index), 0), self.frame_count)
+
+    def seek_time(self, timestamp):
+        self.seek_frame(self.frame_index_at(timestamp))
+
+    def seek_relative(self, delta_us):
+        # Relative to the frame shown last, i.e. the one before the current position
+        current = self.frame_timestamps[max(self.position - 1, 0)]
+        self.seek_time(current + delta_us)
+
+    def rewind(self):
+        self.seek_frame(0)
+
+    def _fetch(self, frame_index):
+        end = min(frame_index + self.prefetch, self.frame_count)
+        t0 = int(self.frame_timestamps[frame_index])
+        t1 = int(self.frame_timestamps[end - 1]) + 1
+        frames = self.recording.getFramesTimeRange(t0, t1)
+        self._cache = {frame.timestamp: frame for frame in (frames or [])}
+        self._cache_range = (frame_index, end)
+
+    def frame(self, frame_index):
+        if not 0 <= frame_index < self.frame_count:
+            return None
+        lo, hi = self._cache_range
+        if not lo <= frame_index < hi:
+            self._fetch(frame_index)
+        return self._cache.get(int(self.frame_timestamps[frame_index]))
+
+    def next_frame(self):
+        # Frame at the current position, then advance; None at the end of the recording
+        while not self.at_end:
+            frame = self.frame(self.position)
+            self.position += 1
+            if frame is not None:
+                return frame
+        return None
+
+    def events_between(self, start_timestamp, end_timestamp):
+        return self.recording.getEventsTimeRange(start_timestamp, end_timestamp)
@@ -2,16 +2,20 @@ import dv_processing as dv
 import cv2 as cv
 import os
 import datetime
+from recording_index import load_index, print_index_summary
+from recording_seek import SeekableRecording
+from event_archive import ARCHIVE_SUFFIX, is_archive
+from event_accumulation import EventAccumulator
 
 base_path = "D:/Programs/DV/Recording/"
 sf_path = "D:/Programs/DV/Recording/davis/frame"
 se_path = "D:/Programs/DV/Recording/davis/event"
 
 while True:
-    file_name = input("Enter a file name to read (must end with .aedat4): ")
+    file_name = input(f"Enter a file name to read (must end with .aedat4 or {ARCHIVE_SUFFIX}): ")
 
-    if not file_name.endswith(".aedat4"):
-        print("Invalid file extension! It must end with '.aedat4'")
+    if not file_name.endswith(".aedat4") and not is_archive(file_name):
+        print(f"Invalid file extension! It must end with '.aedat4' or '{ARCHIVE_SUFFIX}'")
         continue
 
     file_path = os.path.join(base_path, file_name)
@@ -51,7 +55,7 @@ def preview_events_both(event_slice):
         return  
 
     frame_color = prev_frame.image
-    event_image = visualizer.generateImage(event_slice)
+    event_image = render_events(event_slice)
 
     if event_image is None:
         print("No event image generated!") 
@@ -72,43 +76,15 @@ running = True
 first_playback = True
 first_check = True
 
-while first_check:
-    recording = dv.io.MonoCameraRecording(file_path)
+if first_check:
+    # Start/end timestamps come from the sidecar index instead of a full decoding pass
+    index = load_index(file_path)
+    print_index_summary(index)
+    if index.has_frames:
+        start_timestamp_frames = index.frame_start
+        end_timestamp_frames = index.frame_end
 
-    if first_check:
-        event_batches = []
-        while True:
-            events = recording.getNextEventBatch()
-            if events is None or len(events) == 0:
-                break
-            event_batches.append(events)
-
-        if len(event_batches) > 0:
-            start_events = list(event_batches[0])  
-            end_events = list(event_batches[-1]) 
-
-            if len(start_events) > 0 and len(end_events) > 0:
-                start_timestamp_events = start_events[0].timestamp()
-                end_timestamp_events = end_events[-1].timestamp()
-                print(f"Event Start Timestamp: {start_timestamp_events}")
-                print(f"Event End Timestamp: {end_timestamp_events}")
-                print(f"Event duration: {end_timestamp_events - start_timestamp_events}")
-            else:
-                print("No valid events found!")
-
-        frame = recording.getNextFrame()
-        if frame is not None:
-            start_timestamp_frames = frame.timestamp
-            while frame is not None:
-                end_timestamp_frames = frame.timestamp
-                frame = recording.getNextFrame()
-            print(f"Frame Start Timestamp: {start_timestamp_frames}")
-            print(f"Frame End Timestamp: {end_timestamp_frames}")
-            print(f"Frame duration: {end_timestamp_frames - start_timestamp_frames}")
-        else:
-            print("No frames found!")
-
-        first_check = False
+    first_check = False
 
 # frame_interval = max(1, (end_timestamp_frames - start_timestamp_frames) // num_frames_to_save)
 # event_interval = max(1, (end_timestamp_frames - start_timestamp_frames) // num_events_to_save)
@@ -121,8 +97,20 @@ event_count = 0
 next_frame_save_time = start_timestamp_frames
 next_event_save_time = start_timestamp_frames
 
+# Opened once: replaying seeks back to the first frame within the same reader
+player = SeekableRecording(file_path, index)
+
+# Event archives return (t, x, y, p) columns, drawn by the accumulator in the visualizer's colours
+accumulator = EventAccumulator(*player.recording.getEventResolution()) if is_archive(file_path) else None
+
+def render_events(event_slice):
+    if accumulator is not None:
+        return accumulator.polarity_image(event_slice)
+    return visualizer.generateImage(event_slice)
+
 while running:
-    recording = dv.io.MonoCameraRecording(file_path)
+    player.rewind()
+    recording = player.recording
 
     assert recording.isEventStreamAvailable()
     assert recording.isFrameStreamAvailable()
@@ -134,10 +122,10 @@ while running:
     visualizer.setNegativeColor((0, 0, 255))  
 
     lastFrame = None
-    frame = recording.getNextFrame()
+    frame = player.next_frame()
 
     def preview_events(event_slice):
-        cv.imshow("Event Preview", visualizer.generateImage(event_slice))
+        cv.imshow("Event Preview", render_events(event_slice))
 
     while frame is not None:
         if lastFrame is not None:
@@ -158,7 +146,7 @@ while running:
                 next_frame_save_time += frame_interval
             
             if events is not None:
-                event_img = visualizer.generateImage(events)
+                event_img = render_events(events)
                 if event_img is not None:
                     cv.imshow("Event Preview", event_img)
 
@@ -182,9 +170,9 @@ while running:
                     break
                 if key == ord(' '): 
                     print("P.Replaying")
+                    player.rewind()
                     lastFrame = None
-                    frame = recording.getNextFrame() 
-                    recording = dv.io.MonoCameraRecording(file_path)  
+                    frame = player.next_frame()
 
             if frame is not None and len(frame.image.shape) > 2: 
                 frame.image = cv.cvtColor(frame.image, cv.COLOR_BGR2GRAY)
@@ -202,12 +190,12 @@ while running:
                 break
             if key == ord(' '): 
                 print("P.Replaying")
-                recording = dv.io.MonoCameraRecording(file_path)
+                player.rewind()
                 lastFrame = None
-                frame = recording.getNextFrame()
+                frame = player.next_frame()
 
         lastFrame = frame
-        frame = recording.getNextFrame()
+        frame = player.next_frame()
 
     if not running:
         break
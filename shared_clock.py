@@ -0,0 +1,237 @@
+import mmap
+import os
+import struct
+import time
+from multiprocessing import shared_memory
+
+# Shared-memory channels for the playback clocks, read by playback_svo.py: the DVSense
+# clock (CLOCK_NAME, written by stage1, DVSense .raw time) and the DAVIS clock
+# (DAVIS_CLOCK_NAME, written by read2.py, .aedat4 time). They are different sensors and
+# time domains; only the DAVIS clock is in the domain of the ZED/DAVIS sync model.
+#
+# Each block is a seqlock: the writer makes the sequence counter odd, stores the
+# timestamp and its wall-clock publish time, then makes it even again. A reader retries
+# until it sees the same even counter before and after the payload, so it never observes
+# a torn value, and reading is plain memory access without syscalls.
+#
+# A crashed writer leaves its block behind, so a reader checks that the block is alive:
+# the writer's PID (stored once, outside the seqlock) must still run, and a block whose
+# sequence has not moved since the reader attached must have been published within
+# STALE_AFTER_S. A dead block reads as absent, is unmapped, and attaching is retried.
+#
+# Layout (little endian): u64 sequence | i64 timestamp (us) | i64 publish time (ns since epoch) | i64 writer PID
+
+CLOCK_NAME = os.environ.get("MSC_CLOCK_NAME", "msc_dvsense_clock")
+DAVIS_CLOCK_NAME = os.environ.get("MSC_DAVIS_CLOCK_NAME", "msc_davis_clock")
+CLOCK_SIZE = 64
+STALE_AFTER_S = 2.0
+
+_SEQ = struct.Struct("<Q")
+_PAYLOAD = struct.Struct("<qq")
+_PID = struct.Struct("<q")
+_PID_OFFSET = 24
+
+
+def _process_alive(pid):
+    # Unknown (0) and Windows PIDs count as alive; staleness then rests on the publish time
+    if pid <= 0 or os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ClockWriter:
+    def __init__(self, name=CLOCK_NAME):
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=CLOCK_SIZE)
+        except FileExistsError:
+            # Left behind by a writer that did not exit cleanly, take it over
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.buf = self.shm.buf
+        self.seq = _SEQ.unpack_from(self.buf, 0)[0] & ~1
+        _PID.pack_into(self.buf, _PID_OFFSET, os.getpid())
+
+    def publish(self, timestamp):
+        self.seq += 1
+        _SEQ.pack_into(self.buf, 0, self.seq)
+        _PAYLOAD.pack_into(self.buf, 8, int(timestamp), time.time_ns())
+        self.seq += 1
+        _SEQ.pack_into(self.buf, 0, self.seq)
+
+    def close(self):
+        self.buf.release()
+        self.shm.close()
+        self.shm.unlink()
+
+
+class _Mapping:
+    def __init__(self, mm):
+        self.mm = mm
+        self.buf = memoryview(mm)
+
+    def close(self):
+        self.buf.release()
+        self.mm.close()
+
+
+def _attach(name):
+    # Readers map the block directly: SharedMemory would register it with the resource
+    # tracker (before Python 3.13), which unlinks the writer's block when the reader exits
+    if os.name == "nt":
+        return shared_memory.SharedMemory(name=name)
+    import _posixshmem
+    fd = _posixshmem.shm_open("/" + name, os.O_RDWR, mode=0o600)
+    try:
+        size = os.fstat(fd).st_size
+        if size < CLOCK_SIZE:
+            raise FileNotFoundError(name)
+        return _Mapping(mmap.mmap(fd, size))
+    finally:
+        os.close(fd)
+
+
+class ClockReader:
+    def __init__(self, name=CLOCK_NAME, retry_interval=0.5, max_latency_samples=10000, stale_after_s=STALE_AFTER_S):
+        self.name = name
+        self.retry_interval = retry_interval
+        self.stale_after_s = stale_after_s
+        self.mapping = None
+        self.buf = None
+        self._next_attach = 0.0
+        self._next_check = 0.0
+        self._attach_seq = None
+        self._advanced = False
+        self.stale = False
+        self.last_seq = None
+        self.last_timestamp = None
+        self.max_latency_samples = max_latency_samples
+        self.latency_ns = []
+
+    @property
+    def attached(self):
+        return self.buf is not None
+
+    def try_attach(self):
+        # Attaching is the only syscall; it is retried at most every retry_interval
+        if self.attached:
+            return True
+        now = time.monotonic()
+        if now < self._next_attach:
+            return False
+        self._next_attach = now + self.retry_interval
+        try:
+            self.mapping = _attach(self.name)
+        except FileNotFoundError:
+            return False
+        self.buf = self.mapping.buf
+        self._attach_seq = None
+        self._advanced = False
+        self._next_check = 0.0
+        return True
+
+    def _detach(self):
+        self.buf = None
+        self.mapping.close()
+        self.mapping = None
+
+    def _alive(self, seq, publish_ns):
+        # Checked at most every retry_interval, since the PID check is a syscall
+        if self._attach_seq is None:
+            self._attach_seq = seq
+        elif seq != self._attach_seq:
+            self._advanced = True
+        now = time.monotonic()
+        if now < self._next_check:
+            return True
+        self._next_check = now + self.retry_interval
+        if not _process_alive(_PID.unpack_from(self.buf, _PID_OFFSET)[0]):
+            return False
+        # A writer seen publishing may pause; a block that never moved must be recent
+        return self._advanced or time.time_ns() - publish_ns <= self.stale_after_s * 1e9
+
+    def read(self, max_retries=1000):
+        # Consistent (sequence, timestamp, publish time), or None if nothing was published
+        # or the block was left behind by a writer that is gone
+        if not self.try_attach():
+            return None
+        buf = self.buf
+        for _ in range(max_retries):
+            seq = _SEQ.unpack_from(buf, 0)[0]
+            if seq & 1:
+                continue
+            timestamp, publish_ns = _PAYLOAD.unpack_from(buf, 8)
+            if _SEQ.unpack_from(buf, 0)[0] == seq:
+                if seq == 0:
+                    return None
+                if not self._alive(seq, publish_ns):
+                    if not self.stale:
+                        print(f"Clock {self.name} is stale (writer gone or not publishing), ignoring it")
+                        self.stale = True
+                    self._detach()
+                    return None
+                self.stale = False
+                return seq, timestamp, publish_ns
+        return None
+
+    def latest(self):
+        value = self.read()
+        if value is None:
+            return None
+        seq, timestamp, publish_ns = value
+        if seq != self.last_seq:
+            # First time this update is seen: record publish-to-observe latency
+            self.last_seq = seq
+            self.last_timestamp = timestamp
+            if len(self.latency_ns) < self.max_latency_samples:
+                self.latency_ns.append(time.time_ns() - publish_ns)
+        return timestamp
+
+    def latency_summary(self):
+        if not self.latency_ns:
+            return None
+        samples = sorted(self.latency_ns)
+        return {"count": len(samples),
+                "p50_us": samples[len(samples) // 2] / 1e3,
+                "p99_us": samples[int(len(samples) * 0.99)] / 1e3,
+                "max_us": samples[-1] / 1e3}
+
+    def close(self):
+        if self.mapping is not None:
+            self._detach()
+
+
+def _publish_loop(name, count, period, ready):
+    writer = ClockWriter(name)
+    ready.set()
+    for i in range(count):
+        writer.publish(i * 1000)
+        time.sleep(period)
+    time.sleep(0.1)
+    writer.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import multiprocessing
+
+    parser = argparse.ArgumentParser(description="Measure publish-to-observe latency of the shared-memory clock.")
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--period-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    name = f"msc_clock_bench_{os.getpid()}"
+    ready = multiprocessing.Event()
+    writer = multiprocessing.Process(target=_publish_loop, args=(name, args.count, args.period_ms / 1000, ready))
+    writer.start()
+    ready.wait()
+    reader = ClockReader(name)
+    while writer.is_alive():
+        reader.latest()
+    writer.join()
+    reader.close()
+    print(f"{args.count} updates, latency: {reader.latency_summary()}")
@@ -0,0 +1,306 @@
+import atexit
+import collections
+import datetime
+import glob
+import os
+import select
+import socket
+import tempfile
+import time
+
+# Start/stop/ready/rewind signals shared between stage1 and the Python scripts. Signal
+# names are the stems of the old signal files (src, ssc, sry, ssy, stop_signal,
+# dvsense_ready, dvsense_rewind). A signal stays set until it is cleared, exactly like
+# the files did.
+#
+# "socket" mode: every process binds a Unix datagram socket in the bus directory and
+# pushes set/clear messages to its peers, so checks only drain a socket and never
+# touch the file system. "file" mode keeps the old <temp folder>/<name>.txt files.
+# clear_all() empties the temp folder in both modes, as clearing the signals always did,
+# so dvsense_timestamp.txt, temp_file.txt and the event logs do not outlive a session.
+# The mode is picked with MSC_SIGNAL_BUS=socket|file (socket by default where Unix
+# sockets exist), the bus directory with MSC_SIGNAL_BUS_DIR.
+#
+# Besides the latched signals there are one-shot events with a payload, sent with
+# emit(name, payload) and collected with take_events(name). Each receiver gets every
+# event once, the sender does not get its own, and events are not replayed to peers that
+# start later. Calibration captures use them: the window where 'c' is pressed emits
+# "capture" with a new_capture_id(), and every capture window saves its image for that
+# id as <id>.png, so calibration_solver.py can pair the images by capture time.
+
+SIGNAL_CONTENTS = {
+    "src": "START",
+    "sry": "START",
+    "ssc": "STOP",
+    "ssy": "STOP",
+    "stop_signal": "STOP",
+    "dvsense_ready": "READY",
+    "dvsense_rewind": "REWIND",
+}
+
+DEFAULT_BUS_DIR = os.path.join(tempfile.gettempdir(), "msc_signal_bus")
+CAPTURE_ID_FORMAT = "%Y%m%d_%H%M%S_%f"
+
+
+def new_capture_id():
+    # Local capture time to the millisecond, e.g. 20240131_142502_123
+    return datetime.datetime.now().strftime(CAPTURE_ID_FORMAT)[:-3]
+
+
+def parse_capture_id(capture_id):
+    # Capture time (s since the epoch) of a new_capture_id(), or None for any other name
+    try:
+        return datetime.datetime.strptime(capture_id, CAPTURE_ID_FORMAT).timestamp()
+    except ValueError:
+        return None
+
+
+def clear_temp_folder(temp_folder):
+    # Every file in the folder; socket files are kept in case the bus directory is the same folder
+    for file_path in glob.glob(os.path.join(str(temp_folder), "*")):
+        if file_path.endswith(".sock"):
+            continue
+        try:
+            os.remove(file_path)
+        except Exception as e:
+            print("Failed to delete")
+
+
+class FileSignalBus:
+    def __init__(self, temp_folder, role="bus"):
+        self.temp_folder = str(temp_folder)
+        self.sender = f"{role}-{os.getpid()}"
+        # Read position per events file; events written before the first take_events are skipped
+        self.event_offsets = {}
+
+    def _path(self, name):
+        return os.path.join(self.temp_folder, f"{name}.txt")
+
+    def _events_path(self, name):
+        return os.path.join(self.temp_folder, f"{name}_events.txt")
+
+    def emit(self, name, payload):
+        # One "<sender> <payload>" line per event, appended to <name>_events.txt
+        with open(self._events_path(name), "ab") as f:
+            f.write(f"{self.sender} {payload}\n".encode())
+
+    def take_events(self, name):
+        path = self._events_path(name)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        offset = self.event_offsets.get(name)
+        if offset is None:
+            self.event_offsets[name] = size
+            return []
+        if size < offset:
+            # Removed by clear_all and written again since
+            offset = 0
+        payloads = []
+        if size > offset:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    offset += len(line)
+                    sender, _, payload = line.decode().rstrip("\n").partition(" ")
+                    if sender != self.sender:
+                        payloads.append(payload)
+        self.event_offsets[name] = offset
+        return payloads
+
+    def check(self, name):
+        return os.path.exists(self._path(name))
+
+    def set(self, name):
+        with open(self._path(name), "w") as f:
+            f.write(SIGNAL_CONTENTS.get(name, name.upper()))
+
+    def clear(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def clear_all(self):
+        clear_temp_folder(self.temp_folder)
+
+    def wait_for(self, names, timeout=None, poll_interval=0.05):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            for name in names:
+                if self.check(name):
+                    return name
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll_interval)
+
+    def close(self):
+        pass
+
+
+class SocketSignalBus:
+    def __init__(self, role, bus_dir=DEFAULT_BUS_DIR, temp_folder=None):
+        self.bus_dir = bus_dir
+        # Emptied by clear_all like in file mode; signals themselves never touch it
+        self.temp_folder = temp_folder
+        os.makedirs(bus_dir, exist_ok=True)
+        self.path = os.path.join(bus_dir, f"{role}-{os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.sock.setblocking(False)
+        self.latched = set()
+        self.events = collections.defaultdict(list)
+        # The directory is listed once; peers started later announce themselves with "hello"
+        self.peers = {os.path.join(bus_dir, f) for f in os.listdir(bus_dir)
+                      if f.endswith(".sock") and os.path.join(bus_dir, f) != self.path}
+        atexit.register(self.close)
+        # Ask the running peers for the signals that are already set
+        self._broadcast(b"hello")
+
+    def _send(self, peer, message):
+        try:
+            self.sock.sendto(message, peer)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # Nobody is listening any more, remove the stale socket file
+            self.peers.discard(peer)
+            try:
+                os.remove(peer)
+            except OSError:
+                pass
+        except BlockingIOError:
+            print(f"Signal bus peer {peer} is not draining its socket")
+
+    def _broadcast(self, message):
+        for peer in list(self.peers):
+            self._send(peer, message)
+
+    def _handle(self, message, sender):
+        kind, _, name = message.decode().partition(":")
+        if kind == "set":
+            self.latched.add(name)
+        elif kind == "clear":
+            self.latched.discard(name)
+        elif kind == "clear_all":
+            self.latched.clear()
+        elif kind == "event":
+            event_name, _, payload = name.partition(":")
+            self.events[event_name].append(payload)
+        elif kind == "hello" and sender:
+            self.peers.add(sender)
+            for latched_name in self.latched:
+                self._send(sender, f"set:{latched_name}".encode())
+        elif kind == "bye":
+            self.peers.discard(sender)
+
+    def poll(self):
+        while True:
+            try:
+                message, sender = self.sock.recvfrom(256)
+            except (BlockingIOError, InterruptedError):
+                return
+            self._handle(message, sender)
+
+    def check(self, name):
+        self.poll()
+        return name in self.latched
+
+    def set(self, name):
+        self.latched.add(name)
+        self._broadcast(f"set:{name}".encode())
+
+    def clear(self, name):
+        self.latched.discard(name)
+        self._broadcast(f"clear:{name}".encode())
+
+    def clear_all(self):
+        self.latched.clear()
+        self._broadcast(b"clear_all")
+        if self.temp_folder is not None:
+            clear_temp_folder(self.temp_folder)
+
+    def emit(self, name, payload):
+        self._broadcast(f"event:{name}:{payload}".encode())
+
+    def take_events(self, name):
+        self.poll()
+        return self.events.pop(name, [])
+
+    def wait_for(self, names, timeout=None):
+        # Blocks in select() on the socket, so a signal wakes the caller immediately
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self.poll()
+            for name in names:
+                if name in self.latched:
+                    return name
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+            select.select([self.sock], [], [], remaining)
+
+    def close(self):
+        if self.sock.fileno() == -1:
+            return
+        self._broadcast(b"bye")
+        self.sock.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def signal_bus_mode():
+    default = "socket" if hasattr(socket, "AF_UNIX") and os.name != "nt" else "file"
+    return os.environ.get("MSC_SIGNAL_BUS", default).lower()
+
+
+def open_signal_bus(role, temp_folder):
+    # temp_folder holds the signal files in file mode and is emptied by clear_all in both
+    if signal_bus_mode() == "socket":
+        return SocketSignalBus(role, os.environ.get("MSC_SIGNAL_BUS_DIR", DEFAULT_BUS_DIR), temp_folder)
+    return FileSignalBus(temp_folder, role)
+
+
+def _echo_peer(bus_dir, count):
+    bus = SocketSignalBus("echo", bus_dir)
+    for i in range(count):
+        bus.wait_for([f"ping{i}"])
+        bus.set(f"pong{i}")
+    bus.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import multiprocessing
+
+    parser = argparse.ArgumentParser(description="Measure signal delivery latency of the socket bus with a ping-pong peer.")
+    parser.add_argument("--count", type=int, default=2000)
+    args = parser.parse_args()
+
+    bus_dir = tempfile.mkdtemp(prefix="msc_signal_bus_bench_")
+    peer = multiprocessing.Process(target=_echo_peer, args=(bus_dir, args.count))
+    peer.start()
+    bus = SocketSignalBus("bench", bus_dir)
+    while len(bus.peers) == 0:
+        bus.poll()
+        time.sleep(0.01)
+
+    samples = []
+    for i in range(args.count):
+        t0 = time.perf_counter_ns()
+        bus.set(f"ping{i}")
+        bus.wait_for([f"pong{i}"])
+        samples.append((time.perf_counter_ns() - t0) / 2)
+    peer.join()
+    bus.close()
+    os.rmdir(bus_dir)
+
+    samples.sort()
+    print(f"one-way latency over {args.count} round trips: "
+          f"p50 {samples[len(samples) // 2] / 1e3:.1f} us, "
+          f"p99 {samples[int(len(samples) * 0.99)] / 1e3:.1f} us, "
+          f"max {samples[-1] / 1e3:.1f} us")
@@ -0,0 +1,291 @@
+import time
+import numpy as np
+from event_arrays import EVENT_DTYPE, EMPTY_EVENTS
+
+# Camera stand-ins for running the capture pipeline without hardware. The DAVIS sources
+# expose the part of dv.io.CameraCapture that live2.py reads from (is*StreamAvailable,
+# getNext*, get*Resolution), so davis_readers() builds the same acquisition readers for
+# a real camera, a synthetic stream or a recording replay.
+#
+# - SyntheticDavisSource: random events at a configurable rate and resolution, frames
+#   and IMU samples, generated against the wall clock. Events are numpy arrays in the
+#   EventStore.numpy() layout, frames are objects with .timestamp and .image.
+# - ReplayDavisSource: packets of an .aedat4 recording, released when their timestamp
+#   is reached at the chosen speed (None = as fast as they can be read).
+#   Both report arrival_time(stream, packet), the time a camera would have delivered a
+#   packet, so benchmarks can time stages from arrival rather than from the read.
+# - FakeZedSource: left image, depth (mm, with invalid pixels) and confidence at a
+#   fixed frame rate, as numpy arrays.
+
+DAVIS_RESOLUTION = (346, 260)
+IMU_DTYPE = np.dtype([("timestamp", "<i8"), ("accelerometer", "<f4", 3), ("gyroscope", "<f4", 3),
+                      ("temperature", "<f4")])
+
+
+def davis_readers(source):
+    # (stream name, read callable) pairs for acquisition.AcquisitionThread
+    readers = []
+    if source.isFrameStreamAvailable():
+        readers.append(("frames", source.getNextFrame))
+    if source.isEventStreamAvailable():
+        readers.append(("events", source.getNextEventBatch))
+    if source.isImuStreamAvailable():
+        readers.append(("imu", source.getNextImuBatch))
+    if source.isTriggerStreamAvailable():
+        readers.append(("triggers", source.getNextTriggerBatch))
+    return readers
+
+
+def _packet_end_time(stream, packet):
+    if stream == "frames":
+        return packet.timestamp
+    if isinstance(packet, np.ndarray):
+        return int(packet["timestamp"][-1])
+    if stream == "events":
+        return packet.getHighestTime()
+    # IMU and trigger batches are lists of samples with a timestamp field
+    return packet[-1].timestamp
+
+
+class SyntheticFrame:
+    def __init__(self, timestamp, image):
+        self.timestamp = timestamp
+        self.image = image
+
+
+class SyntheticDavisSource:
+    def __init__(self, event_rate=1_000_000, resolution=DAVIS_RESOLUTION, frame_rate=30.0, imu_rate=1000.0,
+                 batch_interval_us=1000, max_batch_us=100_000, pool_size=1 << 22, seed=0,
+                 clock=time.monotonic):
+        self.event_rate = float(event_rate)
+        self.width, self.height = resolution
+        self.frame_interval_us = int(1e6 / frame_rate) if frame_rate else None
+        self.imu_interval_us = int(1e6 / imu_rate) if imu_rate else None
+        self.batch_interval_us = batch_interval_us
+        # A reader that falls far behind gets at most this much time per batch; the rest is skipped
+        self.max_batch_us = max_batch_us
+        self.rng = np.random.default_rng(seed)
+        self.clock = clock
+        # Started by the first read, so the time spent building the pool below and
+        # starting the reader threads is not counted as a backlog
+        self.start = None
+        self.event_time = 0
+        self.frame_time = 0
+        self.imu_time = 0
+        self.generated_events = 0
+        self.skipped_us = 0
+        self._pool = np.empty(pool_size, dtype=EVENT_DTYPE)
+        self._pool["x"] = self.rng.integers(0, self.width, pool_size)
+        self._pool["y"] = self.rng.integers(0, self.height, pool_size)
+        self._pool["polarity"] = self.rng.integers(0, 2, pool_size)
+        self._pool_offset = 0
+        # One gradient image, shifted per frame, so frames differ without per-frame allocation
+        self._base_image = np.tile(np.linspace(0, 255, self.width, dtype=np.uint8), (self.height, 1))
+
+    def now_us(self):
+        if self.start is None:
+            self.start = self.clock()
+        return int((self.clock() - self.start) * 1e6)
+
+    def arrival_time(self, stream, packet):
+        # Clock time at which a camera would have delivered the packet: when its last
+        # sample was taken. None for an empty batch.
+        if stream != "frames" and len(packet) == 0:
+            return None
+        return self.start + _packet_end_time(stream, packet) / 1e6
+
+    def isEventStreamAvailable(self):
+        return self.event_rate > 0
+
+    def isFrameStreamAvailable(self):
+        return self.frame_interval_us is not None
+
+    def isImuStreamAvailable(self):
+        return self.imu_interval_us is not None
+
+    def isTriggerStreamAvailable(self):
+        return False
+
+    def isRunning(self):
+        return True
+
+    def getEventResolution(self):
+        return (self.width, self.height)
+
+    def getFrameResolution(self):
+        return (self.width, self.height)
+
+    def getNextEventBatch(self):
+        now = self.now_us()
+        if now - self.event_time < self.batch_interval_us:
+            return None
+        t0 = self.event_time
+        if now - t0 > self.max_batch_us:
+            self.skipped_us += now - self.max_batch_us - t0
+            t0 = now - self.max_batch_us
+        self.event_time = now
+        n = self.rng.poisson(self.event_rate * (now - t0) / 1e6)
+        if n == 0:
+            return EMPTY_EVENTS
+        # Coordinates and polarities come from a pre-generated pool so that generating
+        # events costs little more than copying them; timestamps are evenly spread
+        start = self._pool_offset % len(self._pool)
+        idx = np.arange(start, start + n) % len(self._pool) if start + n > len(self._pool) else slice(start, start + n)
+        events = self._pool[idx].copy()
+        self._pool_offset = start + n
+        events["timestamp"] = np.linspace(t0, now, n, endpoint=False, dtype=np.int64)
+        self.generated_events += n
+        return events
+
+    def getNextFrame(self):
+        now = self.now_us()
+        if self.frame_interval_us is None or now - self.frame_time < self.frame_interval_us:
+            return None
+        self.frame_time = now - (now - self.frame_time) % self.frame_interval_us
+        shift = (self.frame_time // self.frame_interval_us) % self.width
+        return SyntheticFrame(self.frame_time, np.roll(self._base_image, int(shift), axis=1))
+
+    def getNextImuBatch(self):
+        now = self.now_us()
+        if self.imu_interval_us is None or now - self.imu_time < self.imu_interval_us:
+            return None
+        timestamps = np.arange(self.imu_time + self.imu_interval_us, now + 1, self.imu_interval_us, dtype=np.int64)
+        self.imu_time = int(timestamps[-1])
+        samples = np.zeros(len(timestamps), dtype=IMU_DTYPE)
+        samples["timestamp"] = timestamps
+        samples["accelerometer"][:, 2] = -1.0
+        samples["gyroscope"] = self.rng.normal(0, 0.01, (len(timestamps), 3))
+        samples["temperature"] = 30.0
+        return samples
+
+    def getNextTriggerBatch(self):
+        return None
+
+
+class ReplayDavisSource:
+    def __init__(self, file_path, speed=1.0, clock=time.monotonic):
+        import dv_processing as dv
+
+        self.recording = dv.io.MonoCameraRecording(file_path)
+        self.speed = speed
+        self.clock = clock
+        self.start_wall = None
+        self.start_time = None
+        self.finished = set()
+        self._pending = {}
+        self._read = {
+            "events": self.recording.getNextEventBatch,
+            "frames": self.recording.getNextFrame,
+            "imu": self.recording.getNextImuBatch,
+            "triggers": self.recording.getNextTriggerBatch,
+        }
+
+    def arrival_time(self, stream, packet):
+        # Clock time at which the replay made the packet available, None when replaying as
+        # fast as possible (the read itself is the arrival then)
+        if self.speed is None:
+            return None
+        return self.start_wall + (_packet_end_time(stream, packet) - self.start_time) / 1e6 / self.speed
+
+    def isEventStreamAvailable(self):
+        return self.recording.isEventStreamAvailable()
+
+    def isFrameStreamAvailable(self):
+        return self.recording.isFrameStreamAvailable()
+
+    def isImuStreamAvailable(self):
+        return self.recording.isImuStreamAvailable()
+
+    def isTriggerStreamAvailable(self):
+        return self.recording.isTriggerStreamAvailable()
+
+    def isRunning(self):
+        return len(self.finished) < len(davis_readers(self.recording))
+
+    def getEventResolution(self):
+        return self.recording.getEventResolution()
+
+    def getFrameResolution(self):
+        return self.recording.getFrameResolution()
+
+    def _next(self, stream):
+        # One packet of look-ahead per stream, handed out once the replay clock reaches it
+        packet = self._pending.pop(stream, None)
+        if packet is None:
+            if stream in self.finished:
+                return None
+            packet = self._read[stream]()
+            while packet is not None and len(packet) == 0 and stream != "frames":
+                packet = self._read[stream]()
+            if packet is None:
+                self.finished.add(stream)
+                return None
+        t = _packet_end_time(stream, packet)
+        if self.start_time is None:
+            self.start_time = t
+            self.start_wall = self.clock()
+        if self.speed is not None:
+            due = self.start_wall + (t - self.start_time) / 1e6 / self.speed
+            if self.clock() < due:
+                self._pending[stream] = packet
+                return None
+        return packet
+
+    def getNextEventBatch(self):
+        return self._next("events")
+
+    def getNextFrame(self):
+        return self._next("frames")
+
+    def getNextImuBatch(self):
+        return self._next("imu")
+
+    def getNextTriggerBatch(self):
+        return self._next("triggers")
+
+
+class FakeZedSource:
+    def __init__(self, resolution=(1920, 1080), fps=30.0, max_depth_mm=8000.0, invalid_fraction=0.05,
+                 seed=0, clock=time.monotonic):
+        self.width, self.height = resolution
+        self.frame_interval = 1.0 / fps
+        self.clock = clock
+        self.start = clock()
+        self.frame_index = -1
+        self.skipped = 0
+        rng = np.random.default_rng(seed)
+        self._image = np.empty((self.height, self.width, 4), dtype=np.uint8)
+        self._image[..., :3] = rng.integers(0, 256, (self.height, 1, 3), dtype=np.uint8)
+        self._image[..., 3] = 255
+        ramp = np.linspace(300.0, max_depth_mm, self.width, dtype=np.float32)
+        self._depth = np.repeat(ramp[None, :], self.height, axis=0)
+        holes = rng.random((self.height, self.width)) < invalid_fraction
+        self._depth[holes] = np.nan
+        self._confidence = rng.uniform(0, 100, (self.height, self.width)).astype(np.float32)
+
+    def grab(self, block=True):
+        # Advances to the next frame; without block, returns False until it is due
+        due = self.start + (self.frame_index + 1) * self.frame_interval
+        remaining = due - self.clock()
+        if remaining > 0:
+            if not block:
+                return False
+            time.sleep(remaining)
+        elapsed = self.clock() - self.start
+        # A slow consumer skips frames, like a live camera does
+        next_index = max(self.frame_index + 1, int(elapsed / self.frame_interval))
+        self.skipped += next_index - self.frame_index - 1
+        self.frame_index = next_index
+        return True
+
+    def timestamp_us(self):
+        return int(self.frame_index * self.frame_interval * 1e6)
+
+    def image(self):
+        return self._image
+
+    def depth(self):
+        return self._depth
+
+    def confidence(self):
+        return self._confidence
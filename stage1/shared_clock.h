@@ -0,0 +1,65 @@
+#pragma once
+
+// Writer side of shared_clock.py: publishes the DVSense playback clock into a POSIX
+// shared-memory block guarded by a sequence counter (seqlock), so playback_svo.py can
+// read it without any syscalls and without torn values.
+// Layout: u64 sequence | i64 timestamp (us) | i64 publish time (ns since epoch) | i64 writer PID
+// The PID lets readers tell a live block from one left behind by a crashed stage1.
+
+#include <atomic>
+#include <chrono>
+#include <cstdint>
+#include <cstdlib>
+#include <string>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <unistd.h>
+
+class SharedClockWriter {
+public:
+    explicit SharedClockWriter(const std::string& name) : name_("/" + name) {
+        int fd = ::shm_open(name_.c_str(), O_CREAT | O_RDWR, 0666);
+        if (fd < 0) {
+            return;
+        }
+        if (::ftruncate(fd, kSize) == 0) {
+            void* mem = ::mmap(nullptr, kSize, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+            if (mem != MAP_FAILED) {
+                block_ = static_cast<int64_t*>(mem);
+                block_[3] = ::getpid();
+            }
+        }
+        ::close(fd);
+    }
+
+    ~SharedClockWriter() {
+        if (block_) {
+            ::munmap(block_, kSize);
+            ::shm_unlink(name_.c_str());
+        }
+    }
+
+    bool ok() const { return block_ != nullptr; }
+
+    void publish(int64_t timestamp) {
+        std::atomic_ref<uint64_t> seq(*reinterpret_cast<uint64_t*>(block_));
+        const uint64_t value = seq.load(std::memory_order_relaxed) & ~uint64_t(1);
+        seq.store(value + 1, std::memory_order_relaxed);
+        std::atomic_thread_fence(std::memory_order_release);
+        block_[1] = timestamp;
+        block_[2] = std::chrono::duration_cast<std::chrono::nanoseconds>(
+            std::chrono::system_clock::now().time_since_epoch()).count();
+        seq.store(value + 2, std::memory_order_release);
+    }
+
+private:
+    static constexpr size_t kSize = 64;
+    std::string name_;
+    int64_t* block_ = nullptr;
+};
+
+inline SharedClockWriter& dvsense_clock() {
+    const char* name = std::getenv("MSC_CLOCK_NAME");
+    static SharedClockWriter clock(name ? name : "msc_dvsense_clock");
+    return clock;
+}
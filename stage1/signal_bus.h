@@ -0,0 +1,272 @@
+#pragma once
+
+// C++ side of signal_bus.py: start/stop/calibration/ready/rewind signals shared with
+// the Python scripts. Signal names are the stems of the old signal files. In socket
+// mode (the default, MSC_SIGNAL_BUS=file switches back) every process binds a Unix
+// datagram socket in the bus directory and pushes set/clear messages to its peers, so
+// checking a signal never touches the file system. clear_all() empties the temp folder in
+// both modes, so dvsense_timestamp.txt, temp_file.txt and the event logs are removed too.
+//
+// One-shot events with a payload (emit / take_events) are delivered once to every other
+// peer and not replayed to late starters; in file mode they are "<sender> <payload>"
+// lines appended to <temp folder>/<name>_events.txt. A calibration capture is the event
+// "capture" with a new_capture_id(), and every capture window saves <id>.png for it.
+
+#include <cerrno>
+#include <chrono>
+#include <cstdlib>
+#include <cstring>
+#include <ctime>
+#include <filesystem>
+#include <fstream>
+#include <iomanip>
+#include <iostream>
+#include <map>
+#include <set>
+#include <sstream>
+#include <string>
+#include <vector>
+#include <fcntl.h>
+#include <sys/socket.h>
+#include <sys/un.h>
+#include <unistd.h>
+
+// Local capture time to the millisecond, e.g. 20240131_142502_123 (new_capture_id in signal_bus.py)
+inline std::string new_capture_id() {
+    const auto now = std::chrono::system_clock::now();
+    const std::time_t now_c = std::chrono::system_clock::to_time_t(now);
+    const auto ms = std::chrono::duration_cast<std::chrono::milliseconds>(now.time_since_epoch()).count() % 1000;
+    std::tm tm = *std::localtime(&now_c);
+    std::ostringstream id;
+    id << std::put_time(&tm, "%Y%m%d_%H%M%S") << "_" << std::setw(3) << std::setfill('0') << ms;
+    return id.str();
+}
+
+class SignalBus {
+public:
+    SignalBus(const std::string& role, const std::string& temp_folder)
+        : temp_folder_(temp_folder), sender_(role + "-" + std::to_string(::getpid())) {
+        const char* mode = std::getenv("MSC_SIGNAL_BUS");
+        socket_mode_ = !(mode && std::string(mode) == "file");
+        if (socket_mode_) {
+            open_socket(role);
+        }
+    }
+
+    ~SignalBus() {
+        if (fd_ >= 0) {
+            broadcast("bye");
+            ::close(fd_);
+            std::filesystem::remove(path_);
+        }
+    }
+
+    bool socket_mode() const { return socket_mode_; }
+
+    bool check(const std::string& name) {
+        if (!socket_mode_) {
+            std::ifstream file(file_path(name));
+            return file.good();
+        }
+        poll();
+        return latched_.count(name) > 0;
+    }
+
+    void set(const std::string& name) {
+        if (!socket_mode_) {
+            std::ofstream file(file_path(name));
+            file << content(name);
+            return;
+        }
+        latched_.insert(name);
+        broadcast("set:" + name);
+    }
+
+    void clear(const std::string& name) {
+        if (!socket_mode_) {
+            std::filesystem::remove(file_path(name));
+            return;
+        }
+        latched_.erase(name);
+        broadcast("clear:" + name);
+    }
+
+    void clear_all() {
+        if (socket_mode_) {
+            latched_.clear();
+            broadcast("clear_all");
+        }
+        // Socket files are kept in case the bus directory is the temp folder
+        std::error_code ec;
+        for (const auto& entry : std::filesystem::directory_iterator(temp_folder_, ec)) {
+            if (entry.path().extension() != ".sock") {
+                std::filesystem::remove(entry.path(), ec);
+            }
+        }
+    }
+
+    void emit(const std::string& name, const std::string& payload) {
+        if (!socket_mode_) {
+            std::ofstream file(events_path(name), std::ios::app | std::ios::binary);
+            file << sender_ << " " << payload << "\n";
+            return;
+        }
+        broadcast("event:" + name + ":" + payload);
+    }
+
+    std::vector<std::string> take_events(const std::string& name) {
+        std::vector<std::string> payloads;
+        if (socket_mode_) {
+            poll();
+            payloads.swap(events_[name]);
+            return payloads;
+        }
+        std::error_code ec;
+        const auto size = std::filesystem::exists(events_path(name), ec) ? std::filesystem::file_size(events_path(name), ec) : 0;
+        const auto known = event_offsets_.find(name);
+        if (known == event_offsets_.end()) {
+            // Events written before the first call are skipped
+            event_offsets_[name] = size;
+            return payloads;
+        }
+        std::uintmax_t offset = size < known->second ? 0 : known->second;
+        std::ifstream file(events_path(name), std::ios::binary);
+        file.seekg(static_cast<std::streamoff>(offset));
+        std::string line;
+        while (offset < size && std::getline(file, line) && !file.eof()) {
+            offset += line.size() + 1;
+            const auto sep = line.find(' ');
+            if (sep != std::string::npos && line.substr(0, sep) != sender_) {
+                payloads.push_back(line.substr(sep + 1));
+            }
+        }
+        event_offsets_[name] = offset;
+        return payloads;
+    }
+
+private:
+    std::string temp_folder_;
+    std::string sender_;
+    bool socket_mode_ = false;
+    int fd_ = -1;
+    std::string path_;
+    std::set<std::string> latched_;
+    std::set<std::string> peers_;
+    std::map<std::string, std::vector<std::string>> events_;
+    std::map<std::string, std::uintmax_t> event_offsets_;
+
+    std::string file_path(const std::string& name) const {
+        return temp_folder_ + "/" + name + ".txt";
+    }
+
+    std::string events_path(const std::string& name) const {
+        return temp_folder_ + "/" + name + "_events.txt";
+    }
+
+    static std::string content(const std::string& name) {
+        if (name == "ssc" || name == "ssy" || name == "stop_signal") return "STOP";
+        if (name == "dvsense_ready") return "READY";
+        if (name == "dvsense_rewind") return "REWIND";
+        return "START";
+    }
+
+    void open_socket(const std::string& role) {
+        const char* dir = std::getenv("MSC_SIGNAL_BUS_DIR");
+        std::filesystem::path bus_dir = dir ? std::filesystem::path(dir)
+                                            : std::filesystem::temp_directory_path() / "msc_signal_bus";
+        std::filesystem::create_directories(bus_dir);
+        path_ = (bus_dir / (role + "-" + std::to_string(::getpid()) + ".sock")).string();
+        std::filesystem::remove(path_);
+
+        fd_ = ::socket(AF_UNIX, SOCK_DGRAM, 0);
+        sockaddr_un addr{};
+        addr.sun_family = AF_UNIX;
+        std::strncpy(addr.sun_path, path_.c_str(), sizeof(addr.sun_path) - 1);
+        if (fd_ < 0 || ::bind(fd_, reinterpret_cast<sockaddr*>(&addr), sizeof(addr)) != 0) {
+            std::cerr << "Signal bus socket failed (" << std::strerror(errno) << "), using signal files" << std::endl;
+            if (fd_ >= 0) ::close(fd_);
+            fd_ = -1;
+            socket_mode_ = false;
+            return;
+        }
+        ::fcntl(fd_, F_SETFL, ::fcntl(fd_, F_GETFL) | O_NONBLOCK);
+
+        // The directory is listed once; peers started later announce themselves with "hello"
+        for (const auto& entry : std::filesystem::directory_iterator(bus_dir)) {
+            if (entry.path().extension() == ".sock" && entry.path().string() != path_) {
+                peers_.insert(entry.path().string());
+            }
+        }
+        broadcast("hello");
+    }
+
+    void send_to(const std::string& peer, const std::string& message) {
+        sockaddr_un addr{};
+        addr.sun_family = AF_UNIX;
+        std::strncpy(addr.sun_path, peer.c_str(), sizeof(addr.sun_path) - 1);
+        if (::sendto(fd_, message.data(), message.size(), 0, reinterpret_cast<sockaddr*>(&addr), sizeof(addr)) < 0) {
+            if (errno == ECONNREFUSED || errno == ENOENT) {
+                // Nobody is listening any more, remove the stale socket file
+                peers_.erase(peer);
+                std::filesystem::remove(peer);
+            }
+        }
+    }
+
+    void broadcast(const std::string& message) {
+        const std::set<std::string> peers = peers_;
+        for (const auto& peer : peers) {
+            send_to(peer, message);
+        }
+    }
+
+    void poll() {
+        char buffer[256];
+        while (true) {
+            sockaddr_un sender{};
+            socklen_t sender_len = sizeof(sender);
+            ssize_t n = ::recvfrom(fd_, buffer, sizeof(buffer), 0, reinterpret_cast<sockaddr*>(&sender), &sender_len);
+            if (n < 0) {
+                return;
+            }
+            std::string message(buffer, n);
+            std::string sender_path = sender_len > sizeof(sa_family_t) ? std::string(sender.sun_path) : "";
+            handle(message, sender_path);
+        }
+    }
+
+    void handle(const std::string& message, const std::string& sender) {
+        const auto sep = message.find(':');
+        const std::string kind = message.substr(0, sep);
+        const std::string name = sep == std::string::npos ? "" : message.substr(sep + 1);
+        if (kind == "set") {
+            latched_.insert(name);
+        }
+        else if (kind == "clear") {
+            latched_.erase(name);
+        }
+        else if (kind == "clear_all") {
+            latched_.clear();
+        }
+        else if (kind == "event") {
+            const auto event_sep = name.find(':');
+            if (event_sep != std::string::npos) {
+                events_[name.substr(0, event_sep)].push_back(name.substr(event_sep + 1));
+            }
+        }
+        else if (kind == "hello" && !sender.empty()) {
+            peers_.insert(sender);
+            for (const auto& latched_name : latched_) {
+                send_to(sender, "set:" + latched_name);
+            }
+        }
+        else if (kind == "bye") {
+            peers_.erase(sender);
+        }
+    }
+};
+
+inline SignalBus& signal_bus() {
+    static SignalBus bus("stage1", "../../Recording/temp");
+    return bus;
+}
@@ -1,5 +1,7 @@
 ﻿#include <DvsenseDriver/camera/DvsCameraManager.hpp>
 #include "stage1.h"
+#include "signal_bus.h"
+#include "shared_clock.h"
 #include <DvsenseDriver/FileReader/DvsFileReader.h>
 #include <iostream>
 #include <vector>
@@ -17,34 +19,39 @@
 #include <DvsenseBase/logging/logger.hh> // If using this
 
 
-// New file-based signal functions for synchronization
+// Signal functions for synchronization, see signal_bus.h
 void set_dvsense_ready_signal() {
-    std::ofstream file("../../Recording/temp/dvsense_ready.txt");
-    file << "READY";
-    file.close();
+    signal_bus().set("dvsense_ready");
 }
 
 void clear_dvsense_ready_signal() {
-    std::filesystem::remove("../../Recording/temp/dvsense_ready.txt");
+    signal_bus().clear("dvsense_ready");
 }
 
 void set_dvsense_rewind_signal() {
-    std::ofstream file("../../Recording/temp/dvsense_rewind.txt");
-    file << "REWIND";
-    file.close();
+    signal_bus().set("dvsense_rewind");
 }
 
 void clear_dvsense_rewind_signal() {
-    std::filesystem::remove("../../Recording/temp/dvsense_rewind.txt");
+    signal_bus().clear("dvsense_rewind");
 }
 
-// Function to write timestamp (for coarse sync)
+// Function to write timestamp (for coarse sync), only used when shared memory is unavailable
 void write_dvsense_timestamp(uint64_t timestamp) {
     std::ofstream file("../../Recording/temp/dvsense_timestamp.txt");
     file << timestamp;
     file.close();
 }
 
+// Publish the playback clock through shared memory, see shared_clock.h
+bool publish_dvsense_timestamp(uint64_t timestamp) {
+    if (!dvsense_clock().ok()) {
+        return false;
+    }
+    dvsense_clock().publish(static_cast<int64_t>(timestamp));
+    return true;
+}
+
 // Ensure the EventAnalyzer and signal functions from your original snippet are here
 // (Copied them here for completeness in the example, but assume they are external)
 class EventAnalyzer {
@@ -85,49 +92,38 @@ void run_python_script(const std::string& python_path, const std::string& script
 }
 
 void set_stop_signal() {
-    std::ofstream stopFile("../../Recording/temp/stop_signal.txt");
-    stopFile << "STOP";
-    stopFile.close();
+    signal_bus().set("stop_signal");
 }
 
 bool check_stop_signal() {
-    std::ifstream stopFile("../../Recording/temp/stop_signal.txt");
-    bool exists = stopFile.good(); // Check if file exists and can be opened
-    stopFile.close(); // Close the file stream
-    return exists;
+    return signal_bus().check("stop_signal");
 }
 
 void set_sr_signal() {
-	std::ofstream srFile("../../Recording/temp/src.txt");
-	srFile << "START";
-	srFile.close();
+	signal_bus().set("src");
 }
 
 bool check_sr_signal() {
-	std::ifstream srFile("../../Recording/temp/sry.txt");
-	return srFile.good();
+	return signal_bus().check("sry");
 }
 
 void set_ss_signal() {
-	std::ofstream ssFile("../../Recording/temp/ssc.txt");
-	ssFile << "STOP";
-	ssFile.close();
+	signal_bus().set("ssc");
 }
 
 bool check_ss_signal() {
-	std::ifstream ssFile("../../Recording/temp/ssy.txt");
-	return ssFile.good();
+	return signal_bus().check("ssy");
 }
 
-bool check_cali_signal() {
-	std::ifstream caliFile("../../Recording/temp/caliy.txt");
-	return caliFile.good();
+// Calibration captures announced by live2.py / display_live_feed.py since the last call
+std::vector<std::string> take_captures() {
+	return signal_bus().take_events("capture");
 }
 
-void set_cali_signal() {
-	std::ofstream caliFile("../../Recording/temp/calic.txt");
-	caliFile << "START";
-	caliFile.close();
+std::string start_capture() {
+	std::string capture_id = new_capture_id();
+	signal_bus().emit("capture", capture_id);
+	return capture_id;
 }
 
 //void set_to_record(bool start_recording) {
@@ -165,6 +161,9 @@ void clearTempFolder() {
 
     try {
         for (const auto& entry : std::filesystem::directory_iterator(temp_folder)) {
+            if (entry.path().extension() == ".sock") {
+                continue;
+            }
             std::filesystem::remove(entry.path());
             std::cout << "Removed: " << entry.path().filename() << std::endl;
         }
@@ -172,6 +171,11 @@ void clearTempFolder() {
     catch (const std::exception& e) {
         std::cerr << "Failed to clear temp folder: " << e.what() << std::endl;
     }
+
+    // The signals are files in file mode and went with the folder; socket peers are told to drop theirs
+    if (signal_bus().socket_mode()) {
+        signal_bus().clear_all();
+    }
 }
 
 int recordFromCamera(int argc, char* argv[]) {
@@ -189,15 +193,6 @@ int recordFromCamera(int argc, char* argv[]) {
 
     std::string cali_path = "../../Recording/cali/dvsense/";
 
-    // Get current date
-    std::chrono::system_clock::time_point now = std::chrono::system_clock::now();
-    std::time_t now_c = std::chrono::system_clock::to_time_t(now);
-    std::tm tm = *std::localtime(&now_c);
-
-    std::stringstream date_str;
-    date_str << std::put_time(&tm, "%Y%m%d");
-    std::string date = date_str.str();
-
     // Display help information
     const std::string short_program_desc(
         "Simple viewer to stream events from device, using the SDK driver API\n");
@@ -288,7 +283,6 @@ int recordFromCamera(int argc, char* argv[]) {
     EventAnalyzer event_analyzer;
     bool is_recording = false;
     bool stop_application = false;
-    int save_count = 1;
 
     do {
         if (!camera || !camera->isConnected()) {
@@ -332,25 +326,21 @@ int recordFromCamera(int argc, char* argv[]) {
 
         // If user presses `q` key, exit loop and stop application
         int key = cv::waitKey(wait_time);
+        std::vector<std::string> captures = take_captures();
         if ((key & 0xff) == 'q' || (key & 0xff) == 27 || check_stop_signal()) {
             stop_application = true;
             std::cout << "Button triggered, exit" << std::endl;
             camera->stop();
         }
-        else if (((key & 0xff) == 'c') || check_cali_signal()) {
-            if (check_cali_signal()) {
-                std::string img_filename = cali_path + date + "_" + std::to_string(save_count) + ".png";
-                cv::imwrite(img_filename, display);
-                std::cout << "Saved: " << img_filename << std::endl;
-                save_count++;
-                clearTempFolder();
+        else if (((key & 0xff) == 'c') || !captures.empty()) {
+            // Saved under the capture id, like the DAVIS and ZED images of the same capture
+            if ((key & 0xff) == 'c') {
+                captures.push_back(start_capture());
             }
-            else {
-                set_cali_signal();
-                std::string img_filename = cali_path + date + "_" + std::to_string(save_count) + ".png";
+            for (const auto& capture_id : captures) {
+                std::string img_filename = cali_path + capture_id + ".png";
                 cv::imwrite(img_filename, display);
                 std::cout << "Saved: " << img_filename << std::endl;
-                save_count++;
             }
         }
         else if (((key & 0xff) == ' ') || check_sr_signal() || check_ss_signal()) {
@@ -512,12 +502,14 @@ int readFromFile(int argc, char* argv[]) {
             current_dvsense_time += 40000; // Increment if no events found
         }
 
-        // Write timestamp to file every 100ms
-        static auto last_timestamp_write_time = std::chrono::high_resolution_clock::now();
-        auto now = std::chrono::high_resolution_clock::now();
-        if (std::chrono::duration_cast<std::chrono::milliseconds>(now - last_timestamp_write_time).count() > 100) {
-            write_dvsense_timestamp(current_dvsense_time);
-            last_timestamp_write_time = now;
+        // Publish the timestamp every iteration, falling back to writing the file every 100ms
+        if (!publish_dvsense_timestamp(current_dvsense_time)) {
+            static auto last_timestamp_write_time = std::chrono::high_resolution_clock::now();
+            auto now = std::chrono::high_resolution_clock::now();
+            if (std::chrono::duration_cast<std::chrono::milliseconds>(now - last_timestamp_write_time).count() > 100) {
+                write_dvsense_timestamp(current_dvsense_time);
+                last_timestamp_write_time = now;
+            }
         }
 
         event_analyzer.process_events(events->data(), events->data() + events->size());
@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import sys
+import numpy as np
+import cv2
+
+# Offline clock alignment between a DAVIS recording (.aedat4, event timestamps in us)
+# and the matching ZED recording (.svo2, image timestamps). Both sensors see the same
+# motion, so the event rate and the ZED frame-difference energy rise and fall together:
+# the two series are binned on a common step, cross-correlated with an FFT to get the
+# clock offset, and the offset is re-estimated per window to fit a linear drift.
+#
+# The model stored in <svo base>.sync.json is
+#     t_dvs = t_zed + offset_us + drift * (t_zed - reference_zed_us)
+
+DEFAULT_BIN_US = 5000
+DEFAULT_MAX_OFFSET_US = 2_000_000
+DEFAULT_WINDOW_US = 20_000_000
+HIGHPASS_US = 1_000_000
+MOTION_SIZE = (160, 90)
+
+
+def sync_path_for(svo_path):
+    return os.path.splitext(str(svo_path))[0] + ".sync.json"
+
+
+class SyncModel:
+    def __init__(self, offset_us, drift=0.0, reference_zed_us=0):
+        self.offset_us = float(offset_us)
+        self.drift = float(drift)
+        self.reference_zed_us = int(reference_zed_us)
+
+    def zed_to_dvs(self, t_zed):
+        return t_zed + self.offset_us + self.drift * (t_zed - self.reference_zed_us)
+
+    def dvs_to_zed(self, t_dvs):
+        return (t_dvs - self.offset_us + self.drift * self.reference_zed_us) / (1.0 + self.drift)
+
+
+def load_sync(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        data = json.load(f)
+    return SyncModel(data["offset_us"], data.get("drift", 0.0), data.get("reference_zed_us", 0))
+
+
+def event_rate_series(aedat_path, bin_us):
+    import dv_processing as dv
+    from event_arrays import event_columns
+
+    recording = dv.io.MonoCameraRecording(aedat_path)
+    start = None
+    counts = np.zeros(0, dtype=np.float64)
+    while True:
+        events = recording.getNextEventBatch()
+        if events is None:
+            break
+        t = event_columns(events)[0]
+        if len(t) == 0:
+            continue
+        if start is None:
+            start = int(t[0])
+        bins = np.bincount((t - start) // bin_us)
+        if len(bins) > len(counts):
+            counts = np.pad(counts, (0, len(bins) - len(counts)))
+        counts[:len(bins)] += bins
+    return start, counts
+
+
+def zed_motion_series(svo_path, bin_us, size=MOTION_SIZE):
+    import pyzed.sl as sl
+
+    input_type = sl.InputType()
+    input_type.set_from_svo_file(str(svo_path))
+    init = sl.InitParameters(input_t=input_type)
+    init.depth_mode = sl.DEPTH_MODE.NONE
+    init.svo_real_time_mode = False
+
+    zed = sl.Camera()
+    err = zed.open(init)
+    if err != sl.ERROR_CODE.SUCCESS:
+        raise IOError(f"Error opening ZED: {err}")
+
+    runtime = sl.RuntimeParameters()
+    image = sl.Mat()
+    resolution = sl.Resolution(size[0], size[1])
+    gray = np.empty((size[1], size[0]), dtype=np.uint8)
+    prev = np.empty_like(gray)
+    diff = np.empty_like(gray)
+    timestamps, energy = [], []
+    have_prev = False
+    while zed.grab(runtime) == sl.ERROR_CODE.SUCCESS:
+        zed.retrieve_image(image, sl.VIEW.LEFT, sl.MEM.CPU, resolution)
+        cv2.cvtColor(image.get_data(), cv2.COLOR_BGRA2GRAY, dst=gray)
+        if have_prev:
+            cv2.absdiff(gray, prev, dst=diff)
+            timestamps.append(zed.get_timestamp(sl.TIME_REFERENCE.IMAGE).get_microseconds())
+            energy.append(float(diff.mean()))
+        gray, prev = prev, gray
+        have_prev = True
+    zed.close()
+
+    if len(timestamps) < 2:
+        return None, np.zeros(0)
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    start = int(timestamps[0])
+    grid = np.arange(0, timestamps[-1] - start, bin_us, dtype=np.int64)
+    return start, np.interp(grid, timestamps - start, np.asarray(energy))
+
+
+def normalize_series(x, bin_us, highpass_us=HIGHPASS_US):
+    # log compresses bursts, the moving-average subtraction removes slow trends
+    # (scene brightness, overall activity) that do not carry timing information
+    x = np.log1p(np.asarray(x, dtype=np.float64))
+    k = max(1, int(highpass_us // bin_us))
+    c = np.cumsum(np.concatenate(([0.0], x)))
+    lo = np.clip(np.arange(len(x)) - k // 2, 0, len(x))
+    hi = np.clip(np.arange(len(x)) + k // 2 + 1, 0, len(x))
+    x = x - (c[hi] - c[lo]) / (hi - lo)
+    std = x.std()
+    return x / std if std > 0 else x
+
+
+def xcorr_lag(a, b, min_lag, max_lag):
+    # Lag (in bins, sub-bin accurate) maximizing sum_i a[i + lag] * b[i] within
+    # [min_lag, max_lag], and the normalized correlation at that lag
+    n = len(a) + len(b)
+    nfft = 1 << (n - 1).bit_length()
+    c = np.fft.irfft(np.fft.rfft(a, nfft) * np.conj(np.fft.rfft(b, nfft)), nfft)
+    lags = np.arange(-(len(b) - 1), len(a))
+    c = np.concatenate((c[nfft - (len(b) - 1):], c[:len(a)])) if len(b) > 1 else c[:len(a)]
+    mask = (lags >= min_lag) & (lags <= max_lag)
+    if not mask.any():
+        return None, 0.0
+    lags, c = lags[mask], c[mask]
+    i = int(np.argmax(c))
+    lag = float(lags[i])
+    if 0 < i < len(c) - 1:
+        denom = c[i - 1] - 2 * c[i] + c[i + 1]
+        if denom != 0:
+            lag += 0.5 * (c[i - 1] - c[i + 1]) / denom
+    norm = np.sqrt(np.dot(a, a) * np.dot(b, b))
+    return lag, float(c[i] / norm) if norm > 0 else 0.0
+
+
+def estimate_offset(events, events_start, motion, motion_start, bin_us, center_us, search_us):
+    # offset = t_dvs - t_zed; lag L aligns events[k + L] with motion[k]
+    base = events_start - motion_start
+    min_lag = int(np.floor((center_us - search_us - base) / bin_us))
+    max_lag = int(np.ceil((center_us + search_us - base) / bin_us))
+    lag, peak = xcorr_lag(events, motion, min_lag, max_lag)
+    if lag is None:
+        return None, 0.0
+    return base + lag * bin_us, peak
+
+
+def estimate_sync(aedat_path, svo_path, bin_us=DEFAULT_BIN_US, max_offset_us=DEFAULT_MAX_OFFSET_US,
+                  window_us=DEFAULT_WINDOW_US):
+    events_start, events = event_rate_series(aedat_path, bin_us)
+    motion_start, motion = zed_motion_series(svo_path, bin_us)
+    if events_start is None or motion_start is None:
+        raise ValueError("Not enough data in one of the recordings")
+    events = normalize_series(events, bin_us)
+    motion = normalize_series(motion, bin_us)
+
+    # Both clocks are referenced to wall time, so the offset is searched around zero
+    offset_us, peak = estimate_offset(events, events_start, motion, motion_start, bin_us, 0, max_offset_us)
+    if offset_us is None:
+        raise ValueError("Recordings do not overlap within the allowed offset")
+
+    # Drift: refine the offset per ZED window around the global estimate and fit a line
+    window_bins = max(1, int(window_us // bin_us))
+    search_us = max(10 * bin_us, window_us // 100)
+    windows = []
+    for w0 in range(0, len(motion) - window_bins + 1, window_bins):
+        w_start = motion_start + w0 * bin_us
+        w_offset, w_peak = estimate_offset(events, events_start, motion[w0:w0 + window_bins], w_start,
+                                           bin_us, offset_us, search_us)
+        if w_offset is not None and w_peak > 0:
+            windows.append({"zed_center_us": int(w_start + window_us // 2), "offset_us": float(w_offset),
+                            "peak": w_peak})
+
+    reference_zed_us = motion_start
+    drift = 0.0
+    if len(windows) >= 3:
+        t = np.array([w["zed_center_us"] for w in windows], dtype=np.float64) - reference_zed_us
+        o = np.array([w["offset_us"] for w in windows])
+        weights = np.array([w["peak"] for w in windows])
+        drift, intercept = np.polyfit(t, o, 1, w=weights)
+        offset_us = float(intercept)
+
+    return {"aedat4": os.path.basename(aedat_path), "svo": os.path.basename(str(svo_path)),
+            "offset_us": float(offset_us), "drift": float(drift), "reference_zed_us": int(reference_zed_us),
+            "peak_correlation": peak, "bin_us": bin_us, "windows": windows}
+
+
+def save_sync(result, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(result, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate clock offset and drift between a DAVIS .aedat4 and a ZED .svo2 recording.")
+    parser.add_argument("aedat4", help="DAVIS recording")
+    parser.add_argument("svo", help="Matching ZED recording")
+    parser.add_argument("--bin-us", type=int, default=DEFAULT_BIN_US)
+    parser.add_argument("--max-offset-us", type=int, default=DEFAULT_MAX_OFFSET_US)
+    parser.add_argument("--window-us", type=int, default=DEFAULT_WINDOW_US)
+    parser.add_argument("--output", help="Output file (default: <svo base>.sync.json)")
+    args = parser.parse_args()
+
+    for path in (args.aedat4, args.svo):
+        if not os.path.exists(path):
+            print(f"File does not exist: {path}")
+            sys.exit(1)
+
+    result = estimate_sync(args.aedat4, args.svo, args.bin_us, args.max_offset_us, args.window_us)
+    output = args.output or sync_path_for(args.svo)
+    save_sync(result, output)
+    print(f"Offset: {result['offset_us']:.0f} us, drift: {result['drift'] * 1e6:.2f} ppm, "
+          f"peak correlation: {result['peak_correlation']:.3f} ({len(result['windows'])} windows)")
+    print(f"Saved: {output}")
+
+
+if __name__ == "__main__":
+    main()
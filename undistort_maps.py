@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import numpy as np
+import cv2 as cv
+from event_arrays import event_array
+
+# Undistortion / rectification for the previews. initUndistortRectifyMap tables are built
+# once per camera serial, input and output resolution and calibration version, stored as
+# fixed-point maps (CV_16SC2 + CV_16UC1, 6 bytes per pixel) in MAPS_DIR and applied with a
+# single remap per frame. The output size can differ from the input size, so a preview
+# is undistorted and scaled to its window in the same remap. For events, a per-pixel
+# lookup table moves event coordinates directly instead of remapping a rendered image.
+#
+# Calibrations are read from the stereo_calibration.json written by
+# calibration_solver.py: {"davis": {"K", "dist", "image_size"}, "zed": {...}, "R", "T"}.
+
+CALIBRATION_FILE = "D:/Programs/DV/Recording/cali/davis/stereo_calibration.json"
+MAPS_DIR = "D:/Programs/DV/Recording/cali/maps"
+MAP_VERSION = 1
+SENSORS = ("davis", "zed")
+
+# Maps already loaded by this process, keyed like the files on disk
+_maps = {}
+
+
+class CameraCalibration:
+    def __init__(self, K, dist, image_size, R=None, P=None):
+        self.K = np.asarray(K, dtype=np.float64)
+        self.dist = np.asarray(dist, dtype=np.float64).ravel()
+        self.image_size = tuple(int(v) for v in image_size)
+        # Rectifying rotation and new camera matrix (at image_size); plain undistortion without
+        self.R = None if R is None else np.asarray(R, dtype=np.float64)
+        self.P = None if P is None else np.asarray(P, dtype=np.float64)[:3, :3]
+
+    @property
+    def version(self):
+        h = hashlib.blake2b(digest_size=6)
+        for a in (self.K, self.dist, np.array(self.image_size), self.R, self.P):
+            if a is not None:
+                h.update(np.ascontiguousarray(np.round(a, 9), dtype=np.float64).tobytes())
+        return h.hexdigest()
+
+    def scaled(self, size):
+        # Camera matrices for a different resolution of the same sensor (same field of view)
+        sx, sy = size[0] / self.image_size[0], size[1] / self.image_size[1]
+        scale = np.array([[sx, sx, sx], [0, sy, sy], [0, 0, 1]])
+        P = self.P if self.P is not None else self.K
+        return self.K * scale, P * scale
+
+
+def load_calibration(sensor, path=CALIBRATION_FILE, rectify=False):
+    # CameraCalibration for "davis" or "zed", or None when there is no calibration yet
+    if sensor not in SENSORS:
+        raise ValueError(f"Unknown sensor {sensor}, expected one of {SENSORS}")
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    camera = data.get(sensor)
+    if camera is None or "image_size" not in camera:
+        return None
+    if not rectify or data.get("R") is None:
+        return CameraCalibration(camera["K"], camera["dist"], camera["image_size"])
+
+    # Rectified pair: only the rectifying rotations are taken from stereoRectify. Its new
+    # camera matrices assume similar cameras; with a 346x260 DAVIS next to a 1080p ZED each
+    # sensor keeps its own K, so rows line up between the two up to their scale.
+    davis, zed = data["davis"], data["zed"]
+    R1, R2, _, _, _, _, _ = cv.stereoRectify(np.array(davis["K"]), np.array(davis["dist"]), np.array(zed["K"]),
+                                             np.array(zed["dist"]), tuple(camera["image_size"]), np.array(data["R"]),
+                                             np.array(data["T"], dtype=np.float64).reshape(3, 1))
+    return CameraCalibration(camera["K"], camera["dist"], camera["image_size"], R1 if sensor == "davis" else R2)
+
+
+class UndistortMap:
+    def __init__(self, map1, map2, input_size, output_size, event_lut=None):
+        self.map1 = map1
+        self.map2 = map2
+        self.input_size = tuple(input_size)
+        self.output_size = tuple(output_size)
+        # Flat output pixel index for every input pixel, -1 where it leaves the image
+        self.event_lut = event_lut
+
+    def apply(self, image, out=None, interpolation=cv.INTER_LINEAR):
+        # INTER_NEAREST keeps the pure colours of rendered event images
+        return cv.remap(image, self.map1, self.map2, interpolation, dst=out)
+
+    def undistort_events(self, events):
+        # Copy of the events with undistorted pixel coordinates, events mapped outside dropped
+        arr = event_array(events)
+        if self.event_lut is None:
+            raise ValueError("Map was built without an event lookup table")
+        target = self.event_lut[arr["y"].astype(np.intp) * self.input_size[0] + arr["x"]]
+        keep = target >= 0
+        out = arr[keep]
+        ys, xs = np.divmod(target[keep], self.output_size[0])
+        out["x"] = xs
+        out["y"] = ys
+        return out
+
+
+def build_map(calibration, input_size, output_size, events=False):
+    K, P = calibration.scaled(input_size)
+    _, P_out = calibration.scaled(output_size)
+    R = calibration.R if calibration.R is not None else np.eye(3)
+    map1, map2 = cv.initUndistortRectifyMap(K, calibration.dist, R, P_out, output_size, cv.CV_16SC2)
+    event_lut = None
+    if events:
+        w, h = input_size
+        ys, xs = np.mgrid[0:h, 0:w]
+        pts = np.column_stack([xs.ravel(), ys.ravel()]).astype(np.float32).reshape(-1, 1, 2)
+        moved = cv.undistortPoints(pts, K, calibration.dist, R=R, P=P_out).reshape(-1, 2)
+        ix = np.round(moved[:, 0]).astype(np.int32)
+        iy = np.round(moved[:, 1]).astype(np.int32)
+        inside = (ix >= 0) & (ix < output_size[0]) & (iy >= 0) & (iy < output_size[1])
+        event_lut = np.where(inside, iy * output_size[0] + ix, -1).astype(np.int32)
+    return UndistortMap(map1, map2, input_size, output_size, event_lut)
+
+
+def map_path(maps_dir, serial, calibration, input_size, output_size):
+    w, h = input_size
+    ow, oh = output_size
+    return os.path.join(maps_dir, f"{serial}_{w}x{h}_to_{ow}x{oh}_{calibration.version}.npz")
+
+
+def save_map(path, undistort_map):
+    tmp_path = path + ".tmp"
+    arrays = {"version": MAP_VERSION, "map1": undistort_map.map1, "map2": undistort_map.map2,
+              "input_size": undistort_map.input_size, "output_size": undistort_map.output_size}
+    if undistort_map.event_lut is not None:
+        arrays["event_lut"] = undistort_map.event_lut
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_map(path):
+    try:
+        with np.load(path) as data:
+            if int(data["version"]) != MAP_VERSION:
+                return None
+            event_lut = data["event_lut"] if "event_lut" in data else None
+            return UndistortMap(data["map1"], data["map2"], data["input_size"], data["output_size"], event_lut)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def get_undistort_map(serial, calibration, input_size, output_size=None, events=False, maps_dir=MAPS_DIR):
+    # Cached map: this process, then MAPS_DIR, then built and saved
+    input_size = tuple(int(v) for v in input_size)
+    output_size = input_size if output_size is None else tuple(int(v) for v in output_size)
+    path = map_path(maps_dir, serial, calibration, input_size, output_size)
+    undistort_map = _maps.get(path)
+    if undistort_map is not None and (undistort_map.event_lut is not None or not events):
+        return undistort_map
+    undistort_map = load_map(path)
+    if undistort_map is None or (events and undistort_map.event_lut is None):
+        undistort_map = build_map(calibration, input_size, output_size, events)
+        try:
+            os.makedirs(maps_dir, exist_ok=True)
+            save_map(path, undistort_map)
+        except OSError as e:
+            print(f"Failed to save undistortion map {path}: {e}")
+    _maps[path] = undistort_map
+    return undistort_map
+
+
+def open_undistorter(sensor, serial, input_size, output_size=None, events=False, rectify=False,
+                     calibration_path=CALIBRATION_FILE):
+    # UndistortMap for a preview, or None (with a message) when no calibration exists yet
+    calibration = load_calibration(sensor, calibration_path, rectify)
+    if calibration is None:
+        print(f"No {sensor} calibration in {calibration_path}, previews are not undistorted")
+        return None
+    undistort_map = get_undistort_map(serial, calibration, input_size, output_size, events)
+    print(f"Undistorting {sensor} previews ({'rectified, ' if rectify else ''}calibration {calibration.version})")
+    return undistort_map
+
+
+def undistort_image(undistort_map, image, interpolation=cv.INTER_LINEAR):
+    # For the preview call sites: the image unchanged when there is no calibration
+    if undistort_map is None or image is None:
+        return image
+    return undistort_map.apply(image, interpolation=interpolation)